@@ -1,42 +1,250 @@
+"""
+单条生成：python answer.py "问题"
+
+批量生成（离线生成回答、预热回答缓存）：每行一个 {"prompt": ...}（其他字段原样带回）或一个 JSON 字符串，
+每次读入 batch_size × sort_window 条，按 prompt 的 token 数排序后切成左侧填充的微批，一次 generate 一个微批；
+结果按输入顺序逐行写出 JSONL，附 prompt_tokens、new_tokens、所在微批的 batch_size 与耗时 seconds：
+
+    python answer.py --batch prompts.jsonl --output replies.jsonl --batch-size 16
+    python answer.py --batch - --model /path/to/tiny-model --device-map cpu < prompts.jsonl
+    python answer.py --batch prompts.jsonl --answer-cache ../UI/data/answer_cache.sqlite3
+"""
 import os
-os.environ["CUDA_VISIBLE_DEVICES"] = "1,2"
-from transformers import AutoModelForCausalLM, AutoTokenizer
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "1,2")
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+import argparse
 import sys
 import json
+import threading
+import time
+from itertools import islice
 
 model_name = "/mnt/data/model/Qwen2.5-7B-Instruct"
+system_prompt = "你是一个中医助手，善于根据知识图谱给出中药建议。"
+max_new_tokens = 512
+batch_size = 8     # 批量模式每个微批的最大条数
+sort_window = 16   # 批量模式每次读入 batch_size × sort_window 条，在其中按长度排序
+stream_timeout = float(os.environ.get("STREAM_TIMEOUT", "60"))  # 流式生成两段文本之间的最长等待（秒）
+
+
+def load_model(name=model_name, device_map="auto"):
+    """加载模型与分词器，常驻进程（llm_worker.py）只需调用一次"""
+    model = AutoModelForCausalLM.from_pretrained(
+        name,
+        torch_dtype="auto",
+        device_map=device_map
+    )
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    return model, tokenizer
+
+
+def generation_params(model, max_new_tokens=max_new_tokens):
+    """影响生成结果的参数：system prompt、长度上限与模型自带的采样配置（回答缓存 key 的一部分）"""
+    config = model.generation_config
+    return {
+        "system_prompt": system_prompt,
+        "max_new_tokens": max_new_tokens,
+        **{name: getattr(config, name, None)
+           for name in ("do_sample", "temperature", "top_p", "top_k", "repetition_penalty")},
+    }
+
+
+def chat_text(tokenizer, prompt):
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt}
+    ]
+
+    return tokenizer.apply_chat_template(
+        messages,
+        tokenize=False,
+        add_generation_prompt=True
+    )
+
+
+def build_inputs(tokenizer, prompt, device):
+    return tokenizer([chat_text(tokenizer, prompt)], return_tensors="pt").to(device)
+
+
+def generate(model, tokenizer, prompt, max_new_tokens=max_new_tokens):
+    model_inputs = build_inputs(tokenizer, prompt, model.device)
+
+    generated_ids = model.generate(
+        **model_inputs,
+        max_new_tokens=max_new_tokens
+    )
+    generated_ids = [
+        output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
+    ]
+
+    return tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
+
+
+def generate_batch(model, tokenizer, prompts, max_new_tokens=max_new_tokens):
+    """
+    一个微批：左侧填充到同一长度后一次 generate（仅解码器模型须左侧填充，生成的 token 才紧接在各自的 prompt 之后）
+    :return: [(回复, 生成的 token 数)]，与 prompts 顺序相同
+    """
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    padding_side = tokenizer.padding_side
+    tokenizer.padding_side = "left"
+    try:
+        model_inputs = tokenizer([chat_text(tokenizer, prompt) for prompt in prompts],
+                                 return_tensors="pt", padding=True).to(model.device)
+    finally:
+        tokenizer.padding_side = padding_side
+
+    generated_ids = model.generate(
+        **model_inputs,
+        max_new_tokens=max_new_tokens,
+        pad_token_id=tokenizer.pad_token_id
+    )
+    generated_ids = generated_ids[:, model_inputs.input_ids.shape[1]:]
+    replies = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
+    counts = (generated_ids != tokenizer.pad_token_id).sum(dim=1).tolist()
+    return list(zip(replies, counts))
+
+
+def batch_generate(model, tokenizer, records, batch_size=batch_size, max_new_tokens=max_new_tokens, window=sort_window):
+    """
+    批量生成，按输入顺序产出结果；每次只读入 batch_size × window 条，内存占用与输入规模无关
+    :param records: 可迭代的 dict，含 prompt；含 error 的记录（输入有误）原样产出
+    :return: 结果 dict 生成器：原记录字段 + reply、prompt_tokens、new_tokens、batch_size、seconds（所在微批的耗时）
+    """
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, batch_size * window))
+        if not chunk:
+            return
+        results = list(chunk)
+        valid = [i for i, record in enumerate(chunk) if "error" not in record]
+        texts = [chat_text(tokenizer, chunk[i]["prompt"]) for i in valid]
+        lengths = dict(zip(valid, (len(ids) for ids in tokenizer(texts)["input_ids"]))) if texts else {}
+        # 长度相近的 prompt 放在同一微批，填充最少
+        order = sorted(valid, key=lambda i: lengths[i])
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            begin = time.perf_counter()
+            outputs = generate_batch(model, tokenizer, [chunk[i]["prompt"] for i in batch], max_new_tokens)
+            elapsed = time.perf_counter() - begin
+            for i, (reply, new_tokens) in zip(batch, outputs):
+                results[i] = dict(chunk[i], reply=reply, prompt_tokens=lengths[i], new_tokens=new_tokens,
+                                  batch_size=len(batch), seconds=round(elapsed, 4))
+        yield from results
+
+
+def read_records(lines):
+    """每行一个 {"prompt": ...} 或 JSON 字符串，空行跳过；无法解析的行产出 {"line": 行号, "error": ...}"""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield {"line": number, "error": f"invalid JSON: {e}"}
+            continue
+        if isinstance(record, str):
+            record = {"prompt": record}
+        if not isinstance(record, dict) or not isinstance(record.get("prompt"), str):
+            yield {"line": number, "error": "expected a string or an object with a string prompt"}
+            continue
+        yield record
+
+
+def run_batch(args):
+    model, tokenizer = load_model(args.model, device_map=args.device_map)
+    cache = None
+    if args.answer_cache:
+        # 与 UI/llm_client.py 相同的 key（模型标识 + 生成参数 + prompt），UI 随后的相同提问直接命中
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "UI"))
+        from answer_cache import AnswerCache
+        cache = AnswerCache(args.answer_cache)
+        params = generation_params(model, args.max_new_tokens)
+
+    fr = sys.stdin if args.batch == "-" else open(args.batch, "r", encoding="utf-8")
+    fw = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    count = tokens = 0
+    start = time.perf_counter()
+    try:
+        for result in batch_generate(model, tokenizer, read_records(fr), args.batch_size, args.max_new_tokens):
+            fw.write(json.dumps(result, ensure_ascii=False) + "\n")
+            if "reply" in result:
+                count += 1
+                tokens += result["new_tokens"]
+                if cache is not None:
+                    cache.put(args.model, params, result["prompt"], result["reply"].strip())
+    finally:
+        if fr is not sys.stdin:
+            fr.close()
+        if fw is not sys.stdout:
+            fw.close()
+    elapsed = time.perf_counter() - start
+    print(f"{count} 条，用时 {elapsed:.2f}s，{count / elapsed if elapsed else 0:.2f} 条/s，"
+          f"{tokens / elapsed if elapsed else 0:.1f} token/s", file=sys.stderr)
+
+
+class CancelCriteria(StoppingCriteria):
+    """cancel 事件被置位（如客户端断开）时提前结束生成"""
+
+    def __init__(self, cancel):
+        self.cancel = cancel
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return self.cancel.is_set()
+
+
+def stream_generate(model, tokenizer, prompt, max_new_tokens=max_new_tokens, cancel=None):
+    """
+    逐段产出生成文本；迭代被中途关闭或 cancel 被置位时停止生成，释放显卡。
+    generate 出错时在此重新抛出；stream_timeout 秒内没有新文本时抛出 queue.Empty
+    """
+    cancel = cancel or threading.Event()
+    model_inputs = build_inputs(tokenizer, prompt, model.device)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=stream_timeout)
+    errors = []
+
+    def run():
+        try:
+            model.generate(
+                **model_inputs,
+                max_new_tokens=max_new_tokens,
+                streamer=streamer,
+                stopping_criteria=StoppingCriteriaList([CancelCriteria(cancel)])
+            )
+        except Exception as e:
+            errors.append(e)
+        finally:
+            streamer.end()  # 出错时也结束迭代，否则消费方一直阻塞
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    try:
+        for text in streamer:
+            if text:
+                yield text
+        if errors:
+            raise errors[0]
+    finally:
+        cancel.set()
+        thread.join()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="单条或批量生成")
+    parser.add_argument("prompt", nargs="?", default="Give me a short introduction to large language model.")
+    parser.add_argument("--batch", metavar="JSONL", help="批量模式的输入文件，- 为标准输入")
+    parser.add_argument("--output", default="-", help="批量模式的输出 JSONL 文件，默认标准输出")
+    parser.add_argument("--batch-size", type=int, default=batch_size, help="每个微批的最大条数")
+    parser.add_argument("--model", default=model_name)
+    parser.add_argument("--device-map", default="auto", help="如 auto / cpu")
+    parser.add_argument("--max-new-tokens", type=int, default=max_new_tokens)
+    parser.add_argument("--answer-cache", help="批量结果同时写入 UI 的回答缓存（SQLite 文件路径）")
+    args = parser.parse_args()
 
-model = AutoModelForCausalLM.from_pretrained(
-    model_name,
-    torch_dtype="auto",
-    device_map="auto"
-)
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-
-if len(sys.argv) > 1:
-    prompt = sys.argv[1]
-else:
-    prompt = "Give me a short introduction to large language model."
-
-messages = [
-    {"role": "system", "content": "你是一个中医助手，善于根据知识图谱给出中药建议。"},
-    {"role": "user", "content": prompt}
-]
-
-text = tokenizer.apply_chat_template(
-    messages,
-    tokenize=False,
-    add_generation_prompt=True
-)
-model_inputs = tokenizer([text], return_tensors="pt").to(model.device)
-
-generated_ids = model.generate(
-    **model_inputs,
-    max_new_tokens=512
-)
-generated_ids = [
-    output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-]
-
-response = tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-print(response)
\ No newline at end of file
+    if args.batch:
+        run_batch(args)
+    else:
+        model, tokenizer = load_model(args.model, device_map=args.device_map)
+        response = generate(model, tokenizer, args.prompt, args.max_new_tokens)
+        print(response)
@@ -0,0 +1,190 @@
+"""
+常驻模型进程：启动时加载一次模型，通过本地 socket 接收 prompt 并返回生成结果。
+
+UI 中的 Flask 应用通过 UI/llm_client.py 与本进程通信，不再为每个 /suggest 请求
+启动 answer.py 子进程重新加载模型。请求带 stream=True 时逐段返回生成结果，
+客户端断开后停止生成；请求带 info=True 时返回模型标识与生成参数（供客户端的答案缓存作为 key）。
+
+    cd Script
+    python llm_worker.py                                   # Qwen2.5-7B-Instruct
+    python llm_worker.py --model /path/to/tiny-model --device-map cpu
+    python llm_worker.py --backend echo                    # 不加载模型，原样回显 prompt
+"""
+import argparse
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Listener
+
+WORKER_HOST = os.environ.get("LLM_WORKER_HOST", "127.0.0.1")
+WORKER_PORT = int(os.environ.get("LLM_WORKER_PORT", "6001"))
+WORKER_AUTHKEY = os.environ.get("LLM_WORKER_AUTHKEY", "kg_tcm").encode()
+MAX_BACKLOG = 8          # 排队中的请求上限，超过则直接返回 busy
+DEFAULT_TIMEOUT = 120.0  # 单个请求从入队到生成完成的最长等待时间（秒）
+LISTEN_BACKLOG = 64      # 未 accept 的连接队列长度（Listener 默认为 1，并发连接时客户端会因 SYN 重传等待 1 秒以上）
+
+
+class TransformersBackend:
+    """基于 answer.py 的 transformers 后端"""
+
+    def __init__(self, model_name, device_map="auto", max_new_tokens=None):
+        import answer
+        self.answer = answer
+        self.model_name = model_name
+        self.max_new_tokens = max_new_tokens or answer.max_new_tokens
+        self.model, self.tokenizer = answer.load_model(model_name, device_map=device_map)
+
+    @property
+    def params(self):
+        """影响生成结果的参数，与 answer.py 批量模式写入回答缓存时相同"""
+        return self.answer.generation_params(self.model, self.max_new_tokens)
+
+    def generate(self, prompt):
+        return self.answer.generate(self.model, self.tokenizer, prompt, self.max_new_tokens)
+
+    def stream(self, prompt, cancel):
+        return self.answer.stream_generate(self.model, self.tokenizer, prompt, self.max_new_tokens, cancel)
+
+
+class EchoBackend:
+    """不加载模型的替身后端，用于联调与压测"""
+
+    params = {}
+
+    def __init__(self, model_name="echo", device_map=None, max_new_tokens=None):
+        self.model_name = model_name
+
+    def generate(self, prompt):
+        return prompt
+
+    def stream(self, prompt, cancel):
+        for char in prompt:
+            if cancel.is_set():
+                return
+            yield char
+
+
+BACKENDS = {
+    "transformers": TransformersBackend,
+    "echo": EchoBackend,
+}
+
+
+class Job:
+    def __init__(self, prompt, timeout, stream=False):
+        self.prompt = prompt
+        self.deadline = time.monotonic() + timeout
+        self.done = threading.Event()
+        self.reply = None
+        self.error = None
+        # 流式请求：生成线程把片段放入 chunks（None 表示结束），连接线程负责转发；
+        # 客户端断开时连接线程置位 cancel，生成线程随即停止
+        self.stream = stream
+        self.chunks = queue.Queue()
+        self.cancel = threading.Event()
+
+
+class LLMWorker:
+    """
+    单个生成线程串行消费有界队列；每个连接一个线程负责收发，
+    队列满时立即返回 busy，超时的请求在出队时直接丢弃。
+    """
+
+    def __init__(self, backend, max_backlog=MAX_BACKLOG):
+        self.backend = backend
+        self.jobs = queue.Queue(maxsize=max_backlog)
+
+    def generate_loop(self):
+        while True:
+            job = self.jobs.get()
+            if job.cancel.is_set() or time.monotonic() >= job.deadline:
+                job.error = "timeout"
+            else:
+                try:
+                    if job.stream:
+                        for chunk in self.backend.stream(job.prompt, job.cancel):
+                            job.chunks.put(chunk)
+                    else:
+                        job.reply = self.backend.generate(job.prompt)
+                except Exception as e:
+                    job.error = f"generation failed: {e}"
+            job.chunks.put(None)
+            job.done.set()
+
+    def forward_stream(self, conn, job):
+        while True:
+            remaining = job.deadline - time.monotonic()
+            try:
+                chunk = job.chunks.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                job.cancel.set()
+                conn.send({"ok": False, "error": "timeout"})
+                return
+            if chunk is None:
+                break
+            try:
+                conn.send({"ok": True, "token": chunk})
+            except OSError:
+                job.cancel.set()
+                raise
+        if job.error is None:
+            conn.send({"ok": True, "done": True, "model": self.backend.model_name})
+        else:
+            conn.send({"ok": False, "error": job.error})
+
+    def handle(self, conn):
+        try:
+            request = conn.recv()
+            if request.get("info"):
+                conn.send({"ok": True, "model": self.backend.model_name, "params": self.backend.params})
+                return
+            timeout = float(request.get("timeout") or DEFAULT_TIMEOUT)
+            job = Job(request["prompt"], timeout, stream=bool(request.get("stream")))
+            try:
+                self.jobs.put_nowait(job)
+            except queue.Full:
+                conn.send({"ok": False, "error": "busy"})
+                return
+            if job.stream:
+                self.forward_stream(conn, job)
+            elif job.done.wait(timeout) and job.error is None:
+                conn.send({"ok": True, "reply": job.reply, "model": self.backend.model_name})
+            else:
+                conn.send({"ok": False, "error": job.error or "timeout"})
+        except (EOFError, OSError):
+            pass  # 客户端已断开
+        finally:
+            conn.close()
+
+    def serve(self, host=WORKER_HOST, port=WORKER_PORT, authkey=WORKER_AUTHKEY):
+        threading.Thread(target=self.generate_loop, daemon=True).start()
+        with Listener((host, port), backlog=LISTEN_BACKLOG, authkey=authkey) as listener:
+            print(f"LLM worker ({self.backend.model_name}) listening on {host}:{port}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    print(f"拒绝连接: {e}")
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="常驻 LLM 生成进程")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="transformers")
+    parser.add_argument("--model", default=None, help="模型路径，默认使用 answer.py 中的 model_name")
+    parser.add_argument("--device-map", default="auto", help="如 auto / cpu")
+    parser.add_argument("--max-new-tokens", type=int, default=None)
+    parser.add_argument("--max-backlog", type=int, default=MAX_BACKLOG)
+    parser.add_argument("--host", default=WORKER_HOST)
+    parser.add_argument("--port", type=int, default=WORKER_PORT)
+    args = parser.parse_args()
+
+    backend_cls = BACKENDS[args.backend]
+    if args.model is None and args.backend == "transformers":
+        import answer
+        args.model = answer.model_name
+    backend = backend_cls(args.model or args.backend, device_map=args.device_map,
+                          max_new_tokens=args.max_new_tokens)
+    LLMWorker(backend, max_backlog=args.max_backlog).serve(args.host, args.port)
@@ -0,0 +1,105 @@
+"""
+持久化的模型回答缓存：SQLite 单文件，key 为 (模型标识, 生成参数, prompt) 的哈希，
+按最近访问时间做容量受限的 LRU 淘汰。
+
+四个 UI 应用（可能是不同进程）通过 llm_client 共用同一个缓存文件，进程重启后缓存仍然有效；
+相同症状再次提问时直接返回已生成的回答，不再排队等待模型。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+ANSWER_CACHE_PATH = os.environ.get(
+    "ANSWER_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "answer_cache.sqlite3")
+)
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "10000"))
+
+
+def answer_key(model, params, prompt):
+    """生成参数按键排序后序列化，保证同一组参数得到同一个 key"""
+    payload = json.dumps([model, params, prompt], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+
+    def __init__(self, path=ANSWER_CACHE_PATH, maxsize=ANSWER_CACHE_SIZE):
+        self.path = path
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # 多个应用进程可能同时写入：WAL 允许读写并发，busy timeout 等待对方的写事务
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                reply TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS answers_accessed_at ON answers (accessed_at)")
+
+    def get(self, model, params, prompt):
+        """命中返回缓存的回答，否则返回 None"""
+        key = answer_key(model, params, prompt)
+        with self.lock:
+            row = self.conn.execute("SELECT reply FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE answers SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, model, params, prompt, reply):
+        key = answer_key(model, params, prompt)
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO answers (key, model, reply, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, model, reply, now, now)
+                )
+                excess = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.maxsize
+                if excess > 0:
+                    self.conn.execute(
+                        "DELETE FROM answers WHERE key IN "
+                        "(SELECT key FROM answers ORDER BY accessed_at LIMIT ?)",
+                        (excess,)
+                    )
+                    self.evictions += excess
+                self.conn.execute("COMMIT")
+            except sqlite3.Error:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM answers")
+
+    def stats(self):
+        with self.lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "size": size,
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
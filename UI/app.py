@@ -1,203 +1,150 @@
-from flask import Flask, request, render_template
-from neo4j import GraphDatabase
-from pyvis.network import Network
+from flask import Flask, request, render_template, Response, stream_with_context, jsonify
 import os
-import subprocess
+import json
+import llm_client
 import markdown
 from markupsafe import Markup
-import re
+import kg_graph
+import graph_api
+import metrics
+import prompt_context
+from kg_graph import build_graph
+from formula_compare import describe
+from formula_matrix import split_symptoms
 
 app = Flask(__name__)
+app.register_blueprint(graph_api.bp)
+# Server-Timing 响应头与 GET /metrics
+metrics.init_app(app, request)
 
 @app.template_filter('markdown')
 def markdown_filter(text):
     return Markup(markdown.markdown(text))
 
-driver = GraphDatabase.driver("bolt://localhost:7687", auth=("neo4j", "1qaz2wsx"))
-
-def build_graph(symptom, mode):
-    with driver.session() as session:
-        match = re.match(r"(.*)和(.*)可以一起服用吗？", symptom.strip())
-        if mode == 'inference' and match:
-            formula1 = match.group(1).strip()
-            formula2 = match.group(2).strip()
-            query = '''
-            MATCH (fn:方名)
-            WHERE fn.name IN [$formula1, $formula2]
-            OPTIONAL MATCH (fn)<-[:包含]-(fj:方剂)
-            OPTIONAL MATCH (fn)-[:功能主治]->(gn:功能主治)
-            OPTIONAL MATCH (fn)-[:配方]->(cf:处方)-[:中药组成]->(herb:中药名)
-            RETURN DISTINCT fj, fn, gn, cf, herb
-            '''
-            result = list(session.run(query, formula1=formula1, formula2=formula2))
-        else:
-            query = '''
-            MATCH (fj:方剂)-[:包含]->(fn:方名)-[:功能主治]->(gn:功能主治)
-            WHERE gn.name CONTAINS $symptom
-            MATCH (fn)-[:配方]->(cf:处方)
-            WITH DISTINCT fj, fn, gn, cf
-            MATCH (cf)-[:中药组成]->(herb:中药名)
-            RETURN fj, fn, gn, cf, herb
-            '''
-            result = list(session.run(query, symptom=symptom))
-
-        if not result:
-            return None, []
-
-        net = Network(height='600px', width='100%', directed=True)
-        net.set_options('''
-            {
-            "nodes": {
-                "font": {
-                "size": 18,
-                "bold": true
-                }
-            },
-            "edges": {
-                "font": {
-                "size": 10
-                }
-            }
-            }
-        ''')
-
-        nodes = set()
-        edges = set()
-        def add_edge(source, target, label):
-            edge_key = (source, target, label)
-            if edge_key not in edges:
-                edges.add(edge_key)
-                net.add_edge(source, target, label=label)
-
-        for record in result:
-            fj = record['fj']
-            fn = record['fn']
-            gn = record['gn']
-            cf = record['cf']
-            herb = record['herb']
-
-            def add_node(obj, label):
-                node_id = obj.element_id
-                if node_id not in nodes:
-                    nodes.add(node_id)
-                    color_map = {
-                        "方剂": "#C6EB87",
-                        "方名": "#87EBC1",
-                        "功能主治": "#EE90A1",
-                        "处方": "#FFD700",
-                        "中药名": "#69B2FF"
-                    }
-                    net.add_node(
-                        node_id,
-                        label=obj['name'],
-                        title=obj['name'],
-                        color=color_map.get(label, "#D3D3D3")
-                    )
-                return node_id
-
-            if fj: id_fj = add_node(fj, "方剂")
-            if fn: id_fn = add_node(fn, "方名")
-            if gn: id_gn = add_node(gn, "功能主治")
-            if cf: id_cf = add_node(cf, "处方")
-            if herb: id_herb = add_node(herb, "中药名")
-
-            if fj and fn: add_edge(id_fj, id_fn, "包含")
-            if fn and gn: add_edge(id_fn, id_gn, "功能主治")
-            if fn and cf: add_edge(id_fn, id_cf, "配方")
-            if cf and herb: add_edge(id_cf, id_herb, "中药组成")
-
-        if mode == 'inference' and match:
-            data_result = session.run('''
-            MATCH (fn:方名)
-            WHERE fn.name IN [$formula1, $formula2]
-            MATCH (fn)-[:配方]->(cf:处方)-[r:中药组成]->(herb)
-            OPTIONAL MATCH (fn)-[:功能主治]->(hgn:功能主治)
-            RETURN fn.name AS formula_name, herb.name AS herb_name, r.weight AS weight, collect(DISTINCT hgn.name) AS herb_gn
-            ''', formula1=formula1, formula2=formula2)
-        else:
-            data_result = session.run('''
-            MATCH (fj:方剂)-[:包含]->(fn:方名)-[:功能主治]->(gn:功能主治)
-            WHERE gn.name CONTAINS $symptom
-            MATCH (fn)-[:配方]->(cf:处方)-[r:中药组成]->(herb)
-            OPTIONAL MATCH (fn)-[:功能主治]->(hgn:功能主治)
-            RETURN fn.name AS formula_name, herb.name AS herb_name, r.weight AS weight, collect(DISTINCT hgn.name) AS herb_gn
-            ''', symptom=symptom)
-
-        table_data = [{
-            "方名": record["formula_name"],
-            "中药": record["herb_name"],
-            "剂量": record["weight"],
-            "中药功能主治": "；".join(record["herb_gn"]) if record["herb_gn"] else ""
-        } for record in data_result]
-
-        graph_path = os.path.join("static", "graph.html")
-        net.write_html(graph_path)
-        return graph_path, table_data
+NO_RESULT_REPLY = "未找到相关方剂和中药信息，建议您尝试更通用的描述。"
+
+def build_prompt(table_data, symptom, mode):
+    """按相关度与 token 预算选取事实（见 prompt_context.py）"""
+    if mode == 'inference':
+        comparison = kg_graph.compare_question(symptom)
+        return prompt_context.build_prompt(
+            table_data, "请根据以下中药方名和主治功能，回答问题：",
+            "用户问题：" + f"查看这两个中药的名称与主治功能：{symptom}",
+            kg_graph.parse_inference(symptom) or [], describe(comparison) if comparison else None)
+    return prompt_context.build_prompt(
+        table_data, "请根据以下中药方名和主治功能，给出中药建议：",
+        "用户问题：" + f"我最近出现了症状：{symptom}，可以用哪些中药治疗？", split_symptoms(symptom))
 
 def suggest_treatment(table_data, symptom, mode):
     if table_data:
-        unique_facts = set()
-        for item in table_data:
-            line = f"{item['方名']}：{item['中药功能主治'] or '暂无说明'}"
-            unique_facts.add(line)
-        facts = "\n".join(unique_facts)
-        if mode == 'inference':
-            user_question = f"查看这两个中药的名称与主治功能：{symptom}"
-            prompt = "请根据以下中药方名和主治功能，回答问题：\n" + facts + "\n用户问题：" + user_question
-        else:
-            user_question = f"我最近出现了症状：{symptom}，可以用哪些中药治疗？"
-            prompt = "请根据以下中药方名和主治功能，给出中药建议：\n" + facts + "\n用户问题：" + user_question
-
-        script_path = "../Script/answer.py"
+        with metrics.span("prompt"):
+            prompt = build_prompt(table_data, symptom, mode)
         try:
-            result = subprocess.run(
-                ["python", script_path, prompt],
-                env=dict(os.environ, MKL_THREADING_LAYER="GNU"),
-                capture_output=True,
-                text=True
-            )
-            model_reply = result.stdout.strip() if result.returncode == 0 else "模型生成失败，请稍后再试。"
+            model_reply = llm_client.generate(prompt)
+        except llm_client.LLMError:
+            model_reply = "模型生成失败，请稍后再试。"
         except Exception as e:
             model_reply = f"生成回复出错：{e}"
     else:
-        model_reply = "未找到相关方剂和中药信息，建议您尝试更通用的描述。"
+        model_reply = NO_RESULT_REPLY
     return model_reply
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_treatment(table_data, symptom, mode):
+    """
+    以 SSE 事件流返回模型建议：token 事件为增量文本，done 事件为完整回复渲染后的 HTML，
+    failed 事件为错误提示。浏览器断开时生成器被关闭，llm_client 随即断开模型进程连接以停止生成
+    """
+    if not table_data:
+        yield sse_event("done", str(markdown_filter(NO_RESULT_REPLY)))
+        return
+    tokens = llm_client.stream(build_prompt(table_data, symptom, mode))
+    chunks = []
+    try:
+        for token in tokens:
+            chunks.append(token)
+            yield sse_event("token", token)
+        yield sse_event("done", str(markdown_filter("".join(chunks).strip())))
+    except llm_client.LLMError:
+        yield sse_event("failed", "模型生成失败，请稍后再试。")
+    finally:
+        tokens.close()
+
 @app.route('/', methods=['GET'])
 def home():
-    return "请访问 /inference 或 /answer 使用系统"
+    return "请访问 /inference、/answer 或 /recommend 使用系统"
 
 @app.route('/inference', methods=['GET', 'POST'])
 def inference():
-    graph_path = None
+    graph_key = None
     table_data = None
+    comparison = None
     if request.method == 'POST':
         symptom = request.form.get('symptom')
         if symptom:
-            graph_path, table_data = build_graph(symptom, mode='inference')
-    return render_template('index_combine.html', graph_path=graph_path, table_data=table_data, mode='inference')
+            graph_key, table_data = build_graph(symptom, mode='inference')
+            comparison = kg_graph.compare_question(symptom)
+    return render_template('index_combine.html', graph_key=graph_key, table_data=table_data, comparison=comparison,
+                           mode='inference')
 
 @app.route('/answer', methods=['GET', 'POST'])
 def answer():
-    graph_path = None
+    graph_key = None
     table_data = None
     if request.method == 'POST':
         symptom = request.form.get('symptom')
         if symptom:
-            graph_path, table_data = build_graph(symptom, mode='answer')
-    return render_template('index_combine.html', graph_path=graph_path, table_data=table_data, mode='answer')
+            graph_key, table_data = build_graph(symptom, mode='answer')
+    return render_template('index_combine.html', graph_key=graph_key, table_data=table_data, mode='answer')
+
+@app.route('/recommend', methods=['GET', 'POST'])
+def recommend():
+    graph_key = None
+    table_data = None
+    ranking = None
+    if request.method == 'POST':
+        symptom = request.form.get('symptom')
+        if symptom:
+            ranking = kg_graph.recommend(symptom)
+            graph_key, table_data = build_graph(symptom, mode='recommend')
+    return render_template('index_combine.html', graph_key=graph_key, table_data=table_data, ranking=ranking,
+                           mode='recommend')
 
 @app.route('/suggest', methods=['POST'])
 def suggest():
     symptom = request.form.get('symptom')
     mode = request.form.get('mode')
     if symptom:
-        _, table_data = build_graph(symptom, mode)
+        table_data = kg_graph.query_table(symptom, mode)
         reply = suggest_treatment(table_data, symptom, mode)
         return f"<div style='white-space: pre-wrap; line-height: 1.6;'>{markdown_filter(reply)}</div>"
     else:
         return "请提供症状描述。", 400
 
+@app.route('/suggest_stream', methods=['GET'])
+def suggest_stream():
+    symptom = request.args.get('symptom')
+    mode = request.args.get('mode')
+    if not symptom:
+        return "请提供症状描述。", 400
+    table_data = kg_graph.query_table(symptom, mode)
+    return Response(
+        stream_with_context(stream_treatment(table_data, symptom, mode)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(kg_graph.cache.stats())
+
+@app.route('/cache/answers', methods=['GET'])
+def answer_cache_stats():
+    if llm_client.answers is None:
+        return jsonify({"enabled": False})
+    return jsonify(llm_client.answers.stats())
+
 if __name__ == '__main__':
-    os.makedirs("static", exist_ok=True)
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,233 @@
+"""
+app.py 的异步版本（Quart，路由与模板相同），用于高并发部署：
+
+    - 图查询经 kg_graph.query_graph_async 执行：Neo4j 使用异步驱动，内存引擎在独立的有界线程池中执行
+    - 模型任务由 llm_gate.LLMGate 在另一个有界线程池中执行，队列已满时立即返回“繁忙”，
+      /answer、/inference 的图查询不会排在模型任务之后
+    - GET /cache/pools 查看模型任务的排队与拒绝计数
+    - GET /expand.json、/recommend.json、/compare.json、/doses.json 与 POST /compare/batch.json、/batch.jsonl 与 graph_api 中的同名端点相同，不阻塞事件循环
+
+    cd UI
+    hypercorn app_async:app --bind 127.0.0.1:5000
+"""
+import asyncio
+from types import SimpleNamespace
+
+import markdown
+from markupsafe import Markup
+from quart import Blueprint, Quart, Response, abort, jsonify, render_template, request, send_from_directory
+
+import kg_graph
+import llm_client
+import metrics
+from app import NO_RESULT_REPLY, build_prompt, sse_event
+from graph_api import (GRAPH_CACHE_CONTROL, LIB_DIR, LIB_MAX_AGE, RequestError, batch_request, compare_batch_body,
+                       compare_body, doses_body, expand_body, expand_params, jsonl_lines, recommend_body)
+from llm_gate import LLMBusy, LLMGate
+
+BUSY_REPLY = "模型繁忙，请稍后再试。"
+FAILED_REPLY = "模型生成失败，请稍后再试。"
+
+app = Quart(__name__)
+metrics.init_app(app, request, is_async=True)
+gate = LLMGate()
+
+# 与 graph_api.bp 相同的端点名，模板中的 url_for('graph_api.*') 无需修改
+graph_api = Blueprint("graph_api", __name__)
+
+
+@graph_api.errorhandler(RequestError)
+async def request_error(error):
+    return jsonify(error.body), error.status
+
+
+@graph_api.route("/graph/<key>.json", methods=["GET"])
+async def graph_json(key):
+    graph = await kg_graph.find_graph_async(key, request.args.get("symptom"), request.args.get("mode"))
+    if graph is None:
+        abort(404)
+    headers = {"ETag": f'"{key}"', "Cache-Control": GRAPH_CACHE_CONTROL}
+    if key in request.if_none_match:
+        return Response("", status=304, headers=headers)
+    return Response(graph["body"], mimetype="application/json", headers=headers)
+
+
+@graph_api.route("/lib/<path:filename>", methods=["GET"])
+async def lib(filename):
+    response = await send_from_directory(LIB_DIR, filename)
+    response.cache_control.max_age = LIB_MAX_AGE
+    return response
+
+
+# 以下端点的参数解析、校验与结果组装都在 graph_api 中，同步部分放入线程执行
+@graph_api.route("/expand.json", methods=["GET"])
+async def expand_json():
+    return jsonify(expand_body(await kg_graph.expand_async(*expand_params(request.args))))
+
+
+@graph_api.route("/recommend.json", methods=["GET"])
+async def recommend_json():
+    return jsonify(await asyncio.to_thread(recommend_body, request.args))
+
+
+@graph_api.route("/compare.json", methods=["GET"])
+async def compare_json():
+    return jsonify(await asyncio.to_thread(compare_body, request.args))
+
+
+@graph_api.route("/compare/batch.json", methods=["POST"])
+async def compare_batch_json():
+    return jsonify(await asyncio.to_thread(compare_batch_body, await request.get_json(silent=True)))
+
+
+@graph_api.route("/doses.json", methods=["GET"])
+async def doses_json():
+    return jsonify(await asyncio.to_thread(doses_body, request.args))
+
+
+@graph_api.route("/batch.jsonl", methods=["POST"])
+async def batch_jsonl():
+    batches = kg_graph.query_batches(*batch_request(await request.get_json(silent=True)))
+
+    async def lines():
+        # 每批在线程中查询，事件循环只负责写出
+        while True:
+            results = await asyncio.to_thread(next, batches, None)
+            if results is None:
+                return
+            yield jsonl_lines(results)
+
+    return Response(lines(), mimetype="application/x-ndjson")
+
+
+app.register_blueprint(graph_api)
+
+
+@app.template_filter('markdown')
+def markdown_filter(text):
+    return Markup(markdown.markdown(text))
+
+
+def busy_response():
+    return Response(f"<div style='white-space: pre-wrap; line-height: 1.6;'>{BUSY_REPLY}</div>",
+                    status=503, headers={"Retry-After": "1"})
+
+
+async def render_page(mode):
+    form = await request.form
+    graph_key = None
+    table_data = None
+    ranking = None
+    comparison = None
+    symptom = form.get('symptom')
+    if request.method == 'POST' and symptom:
+        if mode == 'recommend':
+            ranking = await asyncio.to_thread(kg_graph.recommend, symptom)
+        elif mode == 'inference':
+            comparison = await asyncio.to_thread(kg_graph.compare_question, symptom)
+        graph, table_data = await kg_graph.query_graph_async(symptom, mode)
+        graph_key = graph["key"] if graph is not None else None
+    # 模板中的 request.form 在 Quart 中是协程，这里传入已解析的表单
+    return await render_template('index_combine.html', graph_key=graph_key, table_data=table_data, ranking=ranking,
+                                 comparison=comparison, mode=mode, request=SimpleNamespace(form=form, args=request.args))
+
+
+@app.route('/', methods=['GET'])
+async def home():
+    return "请访问 /inference、/answer 或 /recommend 使用系统"
+
+
+@app.route('/inference', methods=['GET', 'POST'])
+async def inference():
+    return await render_page('inference')
+
+
+@app.route('/answer', methods=['GET', 'POST'])
+async def answer():
+    return await render_page('answer')
+
+
+@app.route('/recommend', methods=['GET', 'POST'])
+async def recommend():
+    return await render_page('recommend')
+
+
+@app.route('/suggest', methods=['POST'])
+async def suggest():
+    form = await request.form
+    symptom = form.get('symptom')
+    mode = form.get('mode')
+    if not symptom:
+        return "请提供症状描述。", 400
+    _, table_data = await kg_graph.query_graph_async(symptom, mode)
+    if table_data:
+        try:
+            reply = await gate.generate(await asyncio.to_thread(build_prompt, table_data, symptom, mode))
+        except LLMBusy:
+            return busy_response()
+        except llm_client.LLMError:
+            reply = FAILED_REPLY
+    else:
+        reply = NO_RESULT_REPLY
+    return f"<div style='white-space: pre-wrap; line-height: 1.6;'>{markdown_filter(reply)}</div>"
+
+
+@app.route('/suggest_stream', methods=['GET'])
+async def suggest_stream():
+    symptom = request.args.get('symptom')
+    mode = request.args.get('mode')
+    if not symptom:
+        return "请提供症状描述。", 400
+    _, table_data = await kg_graph.query_graph_async(symptom, mode)
+
+    async def events(tokens=None, reply=None):
+        if tokens is None:
+            yield sse_event("done", str(markdown_filter(reply)))
+            return
+        chunks = []
+        try:
+            async for token in tokens:
+                chunks.append(token)
+                yield sse_event("token", token)
+            yield sse_event("done", str(markdown_filter("".join(chunks).strip())))
+        except llm_client.LLMError:
+            yield sse_event("failed", FAILED_REPLY)
+        finally:
+            await tokens.aclose()
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    if not table_data:
+        return Response(events(reply=NO_RESULT_REPLY), mimetype='text/event-stream', headers=headers)
+    prompt = await asyncio.to_thread(build_prompt, table_data, symptom, mode)
+    reply = await gate.cached(prompt)
+    if reply is not None:
+        return Response(events(reply=reply), mimetype='text/event-stream', headers=headers)
+    try:
+        tokens = gate.stream(prompt)
+    except LLMBusy:
+        # 返回一个 failed 事件，页面直接显示繁忙提示，不触发 EventSource 重连
+        async def busy():
+            yield sse_event("failed", BUSY_REPLY)
+        return Response(busy(), mimetype='text/event-stream', headers=headers)
+    return Response(events(tokens), mimetype='text/event-stream', headers=headers)
+
+
+@app.route('/cache/stats', methods=['GET'])
+async def cache_stats():
+    return jsonify(kg_graph.cache.stats())
+
+
+@app.route('/cache/answers', methods=['GET'])
+async def answer_cache_stats():
+    if llm_client.answers is None:
+        return jsonify({"enabled": False})
+    return jsonify(llm_client.answers.stats())
+
+
+@app.route('/cache/pools', methods=['GET'])
+async def pool_stats():
+    return jsonify({"llm": gate.stats()})
+
+
+if __name__ == '__main__':
+    app.run()
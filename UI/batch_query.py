@@ -0,0 +1,69 @@
+"""
+离线评测的批量查询：逐行读取症状或方名对，按批查询（与 POST /batch.jsonl 相同），按输入顺序写出 JSONL，
+输入与输出都是流式的，内存占用与输入行数无关。
+
+输入每行为一个症状（纯文本），或一个 JSON 值（.jsonl）：
+    "头痛" / ["麻黄汤", "桂枝汤"] / {"symptom": "头痛，发热", "mode": "recommend"} / {"formulas": ["麻黄汤", "桂枝汤"]}
+
+    cd UI
+    KG_BACKEND=memory python batch_query.py symptoms.txt --output results.jsonl
+    python batch_query.py pairs.jsonl --mode inference --batch-size 500
+    cat symptoms.txt | python batch_query.py - > results.jsonl
+"""
+import argparse
+import json
+import sys
+import time
+
+import kg_graph
+
+
+def read_inputs(lines, as_json):
+    """每行一项；不是合法 JSON 的行产出 kg_graph.UnparsedInput，由 query_batch 作为该项的错误写出"""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if not as_json:
+            yield line
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            yield kg_graph.UnparsedInput(line=number, error=f"invalid JSON: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量查询症状 / 方名对，输出 JSONL")
+    parser.add_argument("input", help="输入文件，每行一项；.jsonl 按 JSON 解析；- 为标准输入")
+    parser.add_argument("--output", default="-", help="输出的 JSONL 文件，默认标准输出")
+    parser.add_argument("--mode", default="answer", choices=["answer", "inference", "recommend"],
+                        help="症状输入的查询模式（方名对总是 inference）")
+    parser.add_argument("--batch-size", type=int, default=kg_graph.BATCH_QUERY_SIZE, help="每次查询的输入数")
+    parser.add_argument("--json", action="store_true", help="按 JSON 解析每行（输入文件以 .jsonl 结尾时默认开启）")
+    args = parser.parse_args()
+
+    fr = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    fw = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    as_json = args.json or args.input.endswith(".jsonl")
+    count = errors = 0
+    start = time.perf_counter()
+    try:
+        for results in kg_graph.query_batches(read_inputs(fr, as_json), args.mode, args.batch_size):
+            for result in results:
+                fw.write(json.dumps(result, ensure_ascii=False) + "\n")
+                errors += "error" in result
+            count += len(results)
+            fw.flush()
+    finally:
+        if fr is not sys.stdin:
+            fr.close()
+        if fw is not sys.stdout:
+            fw.close()
+    elapsed = time.perf_counter() - start
+    print(f"{count} 项（{errors} 项输入有误），用时 {elapsed:.2f}s，"
+          f"{count / elapsed if elapsed else 0:.0f} 项/s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
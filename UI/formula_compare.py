@@ -0,0 +1,214 @@
+"""
+中药共用查询（“X和Y可以一起服用吗？”）的结构化比较：由图谱一次性构建每个方名 / 处方的药材位集与功能主治位集
+（numpy uint64 数组，每位对应一味中药或一条功能主治），两方比较只需按 64 位字做与 / 或运算再计数，
+耗时与字数成正比，不再为每次提问遍历图谱：
+
+    - shared_herbs / unique_herbs：共有药材（附两方剂量与合计克数）与各自独有的药材
+    - herb_overlap：共有药材数 / 两方药材并集数（Jaccard），function_overlap 同理
+    - compare_batch：多组方名对一次向量化计算，只返回计数与比例，用于离线筛查
+
+方名的位集为其全部处方的并集；处方的功能主治取其所属方名。剂量克数取后端返回的 grams
+（建图时由 build/dose_parser.py 解析，含传统单位换算），无法换算时为 None（合计时跳过）。
+"""
+import math
+
+import numpy as np
+
+COMPARE_CHUNK = 4096  # compare_batch 每次计算的方名对数，限制 方名对 × 药材 剂量矩阵的内存
+
+
+def pack_bits(rows, width):
+    """[[位编号, ...], ...] -> (行数, 字数) 的 uint64 位集，第 i 位在第 i // 64 个字的第 i % 64 位"""
+    words = (width + 63) // 64
+    bits = np.zeros((len(rows), words * 8), dtype=np.uint8)
+    for row, ids in enumerate(rows):
+        ids = np.fromiter(ids, dtype=np.int64)
+        np.bitwise_or.at(bits[row], ids >> 3, (1 << (ids & 7)).astype(np.uint8))
+    return bits.view("<u8")
+
+
+def unpack_bits(words):
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder="little"))
+
+
+def popcount(words):
+    return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+
+
+def ratio(part, whole):
+    return np.divide(part, whole, out=np.zeros(np.shape(part), dtype=np.float64), where=np.asarray(whole) > 0)
+
+
+def grams_value(value):
+    return None if math.isnan(value) else round(float(value), 2)
+
+
+def describe(comparison):
+    """比较结果的文字描述，供模型提示词使用"""
+    name1, name2 = comparison["formulas"]
+    shared = "、".join(
+        item["中药"] + (f"（合计{item['combined_grams']:g}克）" if item["combined_grams"] is not None else "")
+        for item in comparison["shared_herbs"]
+    ) or "无"
+    lines = [
+        f"{name1}与{name2}的共有药材：{shared}",
+        f"{name1}独有药材：{'、'.join(item['中药'] for item in comparison['unique_herbs'][name1]) or '无'}",
+        f"{name2}独有药材：{'、'.join(item['中药'] for item in comparison['unique_herbs'][name2]) or '无'}",
+        f"药材重合度：{comparison['herb_overlap']:.0%}，"
+        f"共同功能主治：{'、'.join(comparison['shared_functions']) or '无'}",
+    ]
+    return "\n".join(lines)
+
+
+class HerbSetIndex:
+
+    def __init__(self, compositions, functions):
+        """
+        :param compositions: (方名, 处方, 中药名, 剂量文本, 克数) 可迭代对象，克数可为 None
+        :param functions: (方名, 功能主治) 可迭代对象
+        """
+        self.entities = []     # [(label, name)]，行号即位集的行
+        self.rows = {}         # (label, name) -> 行号
+        self.herbs = []
+        self.functions = []
+        herb_ids = {}
+        function_ids = {}
+        herb_rows = []
+        function_rows = []
+        doses = {}             # (行号, 药材编号) -> [(剂量文本, 克数), ...]
+        prescription_formulas = {}
+
+        def row_of(label, name):
+            row = self.rows.get((label, name))
+            if row is None:
+                row = self.rows[(label, name)] = len(self.entities)
+                self.entities.append((label, name))
+                herb_rows.append(set())
+                function_rows.append(set())
+            return row
+
+        for formula, prescription, herb, weight, grams in compositions:
+            h = herb_ids.setdefault(herb, len(herb_ids))
+            prescription_formulas.setdefault(prescription, set()).add(formula)
+            for row in (row_of("方名", formula), row_of("处方", prescription)):
+                if h not in herb_rows[row]:
+                    herb_rows[row].add(h)
+                    doses[(row, h)] = []
+                doses[(row, h)].append((weight or "", math.nan if grams is None else grams))
+        for formula, function in functions:
+            g = function_ids.setdefault(function, len(function_ids))
+            function_rows[row_of("方名", formula)].add(g)
+        for prescription, formulas in prescription_formulas.items():
+            row = self.rows[("处方", prescription)]
+            for formula in formulas:
+                function_rows[row] |= function_rows[self.rows[("方名", formula)]]
+
+        self.herbs = list(herb_ids)
+        self.functions = list(function_ids)
+        self.herb_bits = pack_bits(herb_rows, len(self.herbs))
+        self.function_bits = pack_bits(function_rows, len(self.functions))
+        # 各行每味药的克数（同一方名多个处方含同一味药时相加，任一剂量无克数则为 NaN）
+        self.grams = np.full((len(self.entities), len(self.herbs)), np.nan, dtype=np.float32)
+        self.weights = {}
+        for (row, h), items in doses.items():
+            self.grams[row, h] = sum(grams for _, grams in items)
+            self.weights[(row, h)] = "；".join(text for text, _ in items if text)
+
+    def find(self, name):
+        """按方名查找，找不到时按处方名查找，返回行号或 None"""
+        row = self.rows.get(("方名", name))
+        return self.rows.get(("处方", name)) if row is None else row
+
+    def herb_list(self, row, herb_ids):
+        return [{"中药": self.herbs[h], "剂量": self.weights[(row, h)], "grams": grams_value(self.grams[row, h])}
+                for h in herb_ids]
+
+    def compare(self, name1, name2):
+        """
+        :return: 两方的结构化比较，任一名称不存在时为 None
+        """
+        i, j = self.find(name1), self.find(name2)
+        if i is None or j is None:
+            return None
+        a, b = self.herb_bits[i], self.herb_bits[j]
+        shared_ids = unpack_bits(a & b)
+        shared = []
+        for h in shared_ids:
+            grams = (grams_value(self.grams[i, h]), grams_value(self.grams[j, h]))
+            shared.append({
+                "中药": self.herbs[h],
+                "剂量": [self.weights[(i, h)], self.weights[(j, h)]],
+                "grams": list(grams),
+                "combined_grams": None if None in grams else round(grams[0] + grams[1], 2),
+            })
+        fa, fb = self.function_bits[i], self.function_bits[j]
+        return {
+            "formulas": [name1, name2],
+            "shared_herbs": shared,
+            "unique_herbs": {
+                name1: self.herb_list(i, unpack_bits(a & ~b)),
+                name2: self.herb_list(j, unpack_bits(b & ~a)),
+            },
+            "herb_overlap": round(float(ratio(len(shared_ids), popcount(a | b))), 4),
+            "combined_grams": round(sum(item["combined_grams"] or 0.0 for item in shared), 2),
+            "shared_functions": [self.functions[g] for g in unpack_bits(fa & fb)],
+            "function_overlap": round(float(ratio(popcount(fa & fb), popcount(fa | fb))), 4),
+        }
+
+    def compare_batch(self, pairs):
+        """
+        多组方名对的向量化比较
+        :param pairs: [(方名1, 方名2), ...]
+        :return: 与 pairs 顺序一致的列表，每项为计数与比例；名称不存在时为 {"formulas", "missing"}
+        """
+        pairs = [tuple(pair) for pair in pairs]
+        rows = [(self.find(name1), self.find(name2)) for name1, name2 in pairs]
+        valid = np.array([i is not None and j is not None for i, j in rows], dtype=bool)
+        index = np.array([(i, j) for i, j in rows if i is not None and j is not None], dtype=np.int64).reshape(-1, 2)
+        columns = {key: [] for key in ("shared", "unique1", "unique2", "herb_overlap", "combined_grams",
+                                       "shared_functions", "function_overlap")}
+        for start in range(0, len(index), COMPARE_CHUNK):
+            i, j = index[start:start + COMPARE_CHUNK].T
+            a, b = self.herb_bits[i], self.herb_bits[j]
+            shared_bits = a & b
+            shared = popcount(shared_bits)
+            fa, fb = self.function_bits[i], self.function_bits[j]
+            shared_functions = popcount(fa & fb)
+            mask = np.unpackbits(shared_bits.view(np.uint8), axis=1, bitorder="little")[:, :len(self.herbs)]
+            combined = np.nansum(np.where(mask, self.grams[i] + self.grams[j], np.nan), axis=1)
+            columns["shared"].append(shared)
+            columns["unique1"].append(popcount(a) - shared)
+            columns["unique2"].append(popcount(b) - shared)
+            columns["herb_overlap"].append(ratio(shared, popcount(a | b)))
+            columns["combined_grams"].append(combined)
+            columns["shared_functions"].append(shared_functions)
+            columns["function_overlap"].append(ratio(shared_functions, popcount(fa | fb)))
+        columns = {key: np.concatenate(values).tolist() if values else [] for key, values in columns.items()}
+
+        results = []
+        k = 0
+        for (name1, name2), ok in zip(pairs, valid):
+            if not ok:
+                results.append({"formulas": [name1, name2],
+                                "missing": [name for name in (name1, name2) if self.find(name) is None]})
+                continue
+            results.append({
+                "formulas": [name1, name2],
+                "shared_herbs": columns["shared"][k],
+                "unique_herbs": [columns["unique1"][k], columns["unique2"][k]],
+                "herb_overlap": round(columns["herb_overlap"][k], 4),
+                "combined_grams": round(columns["combined_grams"][k], 2),
+                "shared_functions": columns["shared_functions"][k],
+                "function_overlap": round(columns["function_overlap"][k], 4),
+            })
+            k += 1
+        return results
+
+    def stats(self):
+        return {
+            "formulas": sum(1 for label, _ in self.entities if label == "方名"),
+            "prescriptions": sum(1 for label, _ in self.entities if label == "处方"),
+            "herbs": len(self.herbs),
+            "functions": len(self.functions),
+            "words": int(self.herb_bits.shape[1] + self.function_bits.shape[1]),
+        }
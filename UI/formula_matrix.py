@@ -0,0 +1,110 @@
+"""
+多症状方剂推荐：由图谱一次性构建 方名 × 功能主治 的稀疏关联矩阵（scipy.sparse CSR），
+对多个症状的排序全部用矩阵运算完成，所有方名的打分只需毫秒级。
+
+每个查询症状按子串匹配（symptom_index 的 n-gram 索引，与症状模式的 CONTAINS 语义一致）得到一组
+功能主治列，构成 列 × 症状 的查询矩阵 Q，H = A @ Q 即每个方名在每个症状上命中的功能主治数：
+    - idf：命中某症状的方名越少，该症状越有区分度，idf = ln((N + 1) / (df + 1)) + 1
+    - score：按 idf 加权的症状覆盖率（0 ~ 1），为主排序键
+    - specificity：命中数 × idf 之和除以该方名的功能主治总数，覆盖率相同时偏向主治更集中的方名
+"""
+import os
+import re
+
+import numpy as np
+from scipy import sparse
+
+from symptom_index import SymptomIndex
+
+RECOMMEND_TOP_K = int(os.environ.get("RECOMMEND_TOP_K", "10"))
+RECOMMEND_MAX_K = int(os.environ.get("RECOMMEND_MAX_K", "100"))  # /recommend.json 的 k 上限
+SYMPTOM_SEPARATORS = re.compile(r"[，,、；;。\s]+")
+
+
+def split_symptoms(text):
+    """'头痛，发热 无汗' -> ['头痛', '发热', '无汗']（去重，保持顺序）"""
+    return list(dict.fromkeys(term for term in SYMPTOM_SEPARATORS.split(text.strip()) if term))
+
+
+class FormulaSymptomMatrix:
+
+    def __init__(self, pairs):
+        """
+        :param pairs: (方名, 功能主治) 可迭代对象，重复的组合只计一次
+        """
+        formula_ids = {}
+        symptom_ids = {}
+        rows, cols = [], []
+        for formula, symptom in pairs:
+            rows.append(formula_ids.setdefault(formula, len(formula_ids)))
+            cols.append(symptom_ids.setdefault(symptom, len(symptom_ids)))
+        self.formulas = list(formula_ids)
+        self.symptoms = list(symptom_ids)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(self.formulas), len(self.symptoms)),
+        )
+        matrix.sum_duplicates()
+        matrix.data[:] = 1.0
+        self.matrix = matrix
+        self.lengths = np.asarray(matrix.sum(axis=1), dtype=np.float32).ravel()
+        self.index = SymptomIndex(self.symptoms)
+
+    def query_matrix(self, terms):
+        """列 × 症状 的 0/1 查询矩阵，以及各症状匹配到的功能主治列"""
+        term_cols = [self.index.lookup_ids(term) for term in terms]
+        cols = np.fromiter((c for ids in term_cols for c in ids), dtype=np.int64)
+        term_ids = np.repeat(np.arange(len(terms)), [len(ids) for ids in term_cols])
+        query = sparse.csr_matrix(
+            (np.ones(len(cols), dtype=np.float32), (cols, term_ids)),
+            shape=(len(self.symptoms), len(terms)),
+        )
+        return query, term_cols
+
+    def rank(self, symptoms, k=RECOMMEND_TOP_K):
+        """
+        :param symptoms: 症状列表，或以逗号 / 顿号 / 空格分隔的字符串
+        :param k: 返回的方名数
+        :return: [{"方名", "score", "specificity", "coverage", "matched": {症状: [功能主治, ...]}}]，按得分降序
+        """
+        terms = split_symptoms(symptoms) if isinstance(symptoms, str) else list(dict.fromkeys(symptoms))
+        if not terms or not self.formulas:
+            return []
+        query, term_cols = self.query_matrix(terms)
+        hits = (self.matrix @ query).toarray()          # 方名 × 症状
+        covered = hits > 0
+        df = covered.sum(axis=0)
+        idf = np.where(df > 0, np.log((len(self.formulas) + 1) / (df + 1)) + 1, 0.0)
+        if not idf.any():
+            return []
+        score = covered @ idf / idf.sum()
+        specificity = (hits @ idf) / np.maximum(self.lengths, 1.0)
+
+        candidates = np.flatnonzero(score > 0)
+        if len(candidates) > k:
+            # 先按得分取出前 k 的候选（含与第 k 名同分者），再精确排序
+            threshold = np.partition(score[candidates], -k)[-k]
+            candidates = candidates[score[candidates] >= threshold]
+        order = candidates[np.lexsort((candidates, -specificity[candidates], -score[candidates]))][:k]
+
+        results = []
+        for f in order:
+            row = set(self.matrix.indices[self.matrix.indptr[f]:self.matrix.indptr[f + 1]].tolist())
+            results.append({
+                "方名": self.formulas[f],
+                "score": round(float(score[f]), 4),
+                "specificity": round(float(specificity[f]), 4),
+                "coverage": int(covered[f].sum()),
+                "matched": {
+                    term: [self.symptoms[c] for c in cols if c in row]
+                    for term, cols, hit in zip(terms, term_cols, covered[f]) if hit
+                },
+            })
+        return results
+
+    def stats(self):
+        return {
+            "formulas": len(self.formulas),
+            "symptoms": len(self.symptoms),
+            "nonzeros": int(self.matrix.nnz),
+        }
@@ -0,0 +1,189 @@
+"""
+图谱 JSON 接口与前端静态库，四个 UI 应用通过 app.register_blueprint(graph_api.bp) 共用。
+
+    GET /graph/<key>.json   按内容哈希返回图模型，内容不可变，带 ETag 与长期缓存头
+    GET /lib/<path>         UI/lib 下的 vis-network 等前端库
+    GET /expand.json?type=中药名&name=桂枝&limit=50
+                            节点的邻居（点击图中节点时按需展开），total 为邻居总数
+    GET /recommend.json?symptoms=头痛,发热,无汗&k=10
+                            多症状推荐排名（score / coverage / 命中的功能主治），k 为正整数，最大 RECOMMEND_MAX_K
+    GET /compare.json?formulas=麻黄汤,桂枝汤
+                            两方的结构化比较（共有 / 独有药材、重合度、合计剂量、共同功能主治）
+    POST /compare/batch.json  {"pairs": [["麻黄汤", "桂枝汤"], ...]}
+                            多组方名对的向量化比较，只返回计数与比例，用于离线筛查
+    GET /doses.json?herb=桂枝&min=6&max=10
+                            某味药在各方中的剂量（克数由建图时解析，min / max 为克数范围，可省略），按克数降序
+    POST /batch.jsonl       {"queries": ["头痛", ["麻黄汤", "桂枝汤"], {"symptom": "...", "mode": "recommend"}],
+                             "mode": "answer"}
+                            批量查询，按输入顺序逐行返回 JSONL（index / input / mode / formulas / table_data），
+                            每 BATCH_QUERY_SIZE 项只向后端提交一次查询，不生成图谱
+
+请求参数的解析与校验（*_params / *_body）与框架无关，app_async.py 的 Quart 端点调用同一组函数；
+参数有误或对象不存在时抛出 RequestError，由两边注册的错误处理返回 {"error": ...} 与对应状态码。
+"""
+import json
+import os
+
+from flask import Blueprint, Response, abort, jsonify, request, send_from_directory, stream_with_context
+
+import kg_graph
+from formula_matrix import RECOMMEND_MAX_K, RECOMMEND_TOP_K, split_symptoms
+
+bp = Blueprint("graph_api", __name__)
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lib")
+LIB_MAX_AGE = 86400
+# /graph/<key>.json 的 key 即内容哈希，同一 URL 的内容永不改变
+GRAPH_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class RequestError(Exception):
+    """请求参数有误（400）或查询的对象不存在（404），body 为返回的 JSON"""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.body = {"error": message, **extra}
+
+
+def expand_params(args):
+    """?type=中药名&name=桂枝&limit=50 -> (type, name, limit)"""
+    limit = args.get("limit")
+    if limit is None:
+        limit = kg_graph.GRAPH_EXPAND_LIMIT
+    elif not limit.strip().isdecimal() or int(limit) < 1:
+        raise RequestError("limit 应为正整数")
+    else:
+        limit = int(limit)
+    return args.get("type", ""), args.get("name", ""), limit
+
+
+def expand_body(result):
+    if result is None:
+        raise RequestError("节点不存在", 404)
+    return result
+
+
+def recommend_k(args):
+    """查询参数 k：缺省为 RECOMMEND_TOP_K，大于 RECOMMEND_MAX_K 时取上限，不是正整数时为 None"""
+    k = args.get("k")
+    if k is None:
+        return RECOMMEND_TOP_K
+    if not k.strip().isdecimal() or int(k) < 1:
+        return None
+    return min(int(k), RECOMMEND_MAX_K)
+
+
+def recommend_body(args):
+    symptoms = split_symptoms(args.get("symptoms", ""))
+    if not symptoms:
+        raise RequestError("请提供症状，如 ?symptoms=头痛,发热")
+    k = recommend_k(args)
+    if k is None:
+        raise RequestError("k 应为正整数")
+    return {"symptoms": symptoms, "ranking": kg_graph.recommend(symptoms, k)}
+
+
+def compare_body(args):
+    formulas = split_symptoms(args.get("formulas", ""))
+    if len(formulas) != 2:
+        raise RequestError("请提供两个方名，如 ?formulas=麻黄汤,桂枝汤")
+    comparison = kg_graph.compare(*formulas)
+    if comparison is None:
+        index = kg_graph.herb_index()
+        raise RequestError("方名不存在", 404, missing=[name for name in formulas if index.find(name) is None])
+    return comparison
+
+
+def batch_pairs(body):
+    """{"pairs": [[方名1, 方名2], ...]} -> [(方名1, 方名2), ...]"""
+    pairs = body.get("pairs") if isinstance(body, dict) else None
+    if not isinstance(pairs, list) or not all(
+            isinstance(pair, list) and len(pair) == 2 and all(isinstance(name, str) for name in pair)
+            for pair in pairs):
+        raise RequestError("请求体应为 {\"pairs\": [[方名1, 方名2], ...]}")
+    return [tuple(pair) for pair in pairs]
+
+
+def compare_batch_body(body):
+    return {"results": kg_graph.compare_batch(batch_pairs(body))}
+
+
+def doses_body(args):
+    herb = args.get("herb", "").strip()
+    if not herb:
+        raise RequestError("请提供中药名，如 ?herb=桂枝&min=6&max=10")
+    try:
+        min_grams, max_grams = (None if args.get(name) is None else float(args[name]) for name in ("min", "max"))
+    except ValueError:
+        raise RequestError("min / max 应为克数")
+    return {"herb": herb, "doses": kg_graph.herb_doses(herb, min_grams, max_grams)}
+
+
+def batch_request(body):
+    """{"queries": [...], "mode": "answer"} -> (queries, mode)"""
+    queries = body.get("queries") if isinstance(body, dict) else None
+    if not isinstance(queries, list):
+        raise RequestError("请求体应为 {\"queries\": [...], \"mode\": \"answer\"}")
+    return queries, body.get("mode", "answer")
+
+
+def jsonl_lines(results):
+    return "".join(json.dumps(result, ensure_ascii=False) + "\n" for result in results)
+
+
+@bp.errorhandler(RequestError)
+def request_error(error):
+    return jsonify(error.body), error.status
+
+
+@bp.route("/graph/<key>.json", methods=["GET"])
+def graph_json(key):
+    graph = kg_graph.find_graph(key, request.args.get("symptom"), request.args.get("mode"))
+    if graph is None:
+        abort(404)
+    response = Response(graph["body"], mimetype="application/json")
+    response.set_etag(key)
+    response.headers["Cache-Control"] = GRAPH_CACHE_CONTROL
+    return response.make_conditional(request)
+
+
+@bp.route("/lib/<path:filename>", methods=["GET"])
+def lib(filename):
+    return send_from_directory(LIB_DIR, filename, max_age=LIB_MAX_AGE)
+
+
+@bp.route("/expand.json", methods=["GET"])
+def expand_json():
+    return jsonify(expand_body(kg_graph.expand(*expand_params(request.args))))
+
+
+@bp.route("/recommend.json", methods=["GET"])
+def recommend_json():
+    return jsonify(recommend_body(request.args))
+
+
+@bp.route("/compare.json", methods=["GET"])
+def compare_json():
+    return jsonify(compare_body(request.args))
+
+
+@bp.route("/compare/batch.json", methods=["POST"])
+def compare_batch_json():
+    return jsonify(compare_batch_body(request.get_json(silent=True)))
+
+
+@bp.route("/doses.json", methods=["GET"])
+def doses_json():
+    return jsonify(doses_body(request.args))
+
+
+@bp.route("/batch.jsonl", methods=["POST"])
+def batch_jsonl():
+    parsed = batch_request(request.get_json(silent=True))
+
+    def lines():
+        for results in kg_graph.query_batches(*parsed):
+            yield jsonl_lines(results)
+
+    return Response(stream_with_context(lines()), mimetype="application/x-ndjson")
@@ -0,0 +1,101 @@
+"""
+图模型的服务端布局：按方名分扇区的放射状布局，一次遍历算出所有节点坐标，随图模型一起缓存，
+前端关闭物理模拟直接按坐标绘制，大图也不必等待浏览器端的布局收敛。
+
+    - 方名均匀分布在内圈，方剂（通常只有一个）位于圆心
+    - 只属于一个方名的功能主治 / 处方 / 中药在该方名的扇区内向外逐行排开
+    - 被多个方名共用的节点放在这些方名的平均方向上、方名圈内侧的一圈，按角度排开
+"""
+import math
+
+NODE_SPACING = 60    # 同一行相邻节点的最小间距
+RING_GAP = 90        # 相邻两行的半径差
+MIN_RADIUS = 150     # 方名圈的最小半径
+# 扇区内由内向外的顺序
+RING_ORDER = {"功能主治": 0, "处方": 1, "中药名": 2}
+
+
+def place_row(nodes, radius, start, width, positions):
+    """在半径 radius、角度 [start, start + width) 的圆弧上均匀放置 nodes"""
+    step = width / len(nodes)
+    for i, node in enumerate(nodes):
+        angle = start + step * (i + 0.5)
+        positions[node] = (radius * math.cos(angle), radius * math.sin(angle))
+
+
+def fan_out(nodes, radius, start, width, positions):
+    """从半径 radius 开始放置，圆弧放不下时逐行向外排开"""
+    while nodes:
+        capacity = max(1, int(radius * width / NODE_SPACING))
+        place_row(nodes[:capacity], radius, start, width, positions)
+        nodes = nodes[capacity:]
+        radius += RING_GAP
+
+
+def radial_layout(types, edges):
+    """
+    :param types: 节点编号 -> label（方名 / 方剂 / 功能主治 / 处方 / 中药名）
+    :param edges: [(from, to), ...]
+    :return: 节点编号 -> (x, y)，坐标取整
+    """
+    neighbours = [set() for _ in types]
+    for source, target in edges:
+        neighbours[source].add(target)
+        neighbours[target].add(source)
+    formulas = [n for n, label in enumerate(types) if label == "方名"]
+    # 每个非方名节点归属的方名：直接相连的方名，中药经由处方归属
+    owners = [set() for _ in types]
+    for fn in formulas:
+        for n in neighbours[fn]:
+            owners[n].add(fn)
+    for n, label in enumerate(types):
+        if label == "中药名":
+            for cf in neighbours[n]:
+                if types[cf] == "处方":
+                    owners[n] |= owners[cf]
+
+    private = {fn: [] for fn in formulas}
+    shared = []
+    centre = []
+    for n, label in enumerate(types):
+        if label == "方名":
+            continue
+        if label == "方剂" or not owners[n]:
+            centre.append(n)
+        elif len(owners[n]) == 1:
+            private[next(iter(owners[n]))].append(n)
+        else:
+            shared.append(n)
+
+    positions = {}
+    width = 2 * math.pi / max(len(formulas), 1)
+    # 方名圈的周长容纳全部方名（间距加倍），半径的一半处的内圈容纳全部共用节点
+    radius = max(MIN_RADIUS, (len(formulas) * 2 + len(shared) * 2) * NODE_SPACING / (2 * math.pi))
+    angles = {}
+    for i, fn in enumerate(formulas):
+        angles[fn] = width * i
+        positions[fn] = (radius * math.cos(angles[fn]), radius * math.sin(angles[fn]))
+
+    for fn, nodes in private.items():
+        nodes.sort(key=lambda n: RING_ORDER.get(types[n], len(RING_ORDER)))
+        fan_out(nodes, radius + RING_GAP, angles[fn] - width / 2, width, positions)
+
+    if shared:
+        def mean_angle(n):
+            x = sum(math.cos(angles[fn]) for fn in owners[n])
+            y = sum(math.sin(angles[fn]) for fn in owners[n])
+            return math.atan2(y, x) % (2 * math.pi)
+        shared.sort(key=mean_angle)
+        inner = radius / 2
+        # 尽量保持各自的平均方向，相邻节点过近时顺延
+        previous = None
+        for n in shared:
+            angle = mean_angle(n)
+            if previous is not None:
+                angle = max(angle, previous + NODE_SPACING / inner)
+            positions[n] = (inner * math.cos(angle), inner * math.sin(angle))
+            previous = angle
+
+    for i, n in enumerate(centre):
+        positions[n] = (0.0, 0.0) if i == 0 else (NODE_SPACING * math.cos(i), NODE_SPACING * math.sin(i))
+    return {n: (round(x), round(y)) for n, (x, y) in positions.items()}
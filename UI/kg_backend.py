@@ -0,0 +1,338 @@
+"""
+图查询后端：Neo4j（默认）或进程内的 MemoryGraph（kg_engine.py），通过环境变量选择：
+
+    KG_BACKEND=neo4j   连接 NEO4J_URI 上的 Neo4j 服务
+    KG_BACKEND=memory  直接载入 KG_DATA_PATH 指向的三元组 JSON / JSONL，或 mmap 映射 *.snap 快照，无需 Neo4j 服务
+
+两种后端提供相同的查询方法（症状模式 / 两方共用模式各一次查询），返回记录的字段一致。
+异步服务（app_async.py）通过 get_async_backend 取得协程版本：Neo4j 使用 neo4j 异步驱动，
+内存引擎放入独立的有界线程池执行；并发查询数均由 GRAPH_CONCURRENCY 限制。
+症状查询先用 build/symptom_index.py 的 n-gram 索引解析出匹配的功能主治名称，
+再以 `gn.name IN $names` 遍历，避免 `CONTAINS` 扫描全部功能主治节点；图谱重建后索引随版本号自动重新载入。
+"""
+import asyncio
+import contextvars
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "build")
+if BUILD_DIR not in sys.path:
+    sys.path.append(BUILD_DIR)
+
+from query_cache import GRAPH_VERSION_PATH, VERSION_CHECK_INTERVAL, read_graph_version
+from symptom_index import SymptomIndex
+
+KG_BACKEND = os.environ.get("KG_BACKEND", "neo4j")
+NEO4J_URI = os.environ.get("NEO4J_URI", "bolt://localhost:7687")
+NEO4J_AUTH = (os.environ.get("NEO4J_USER", "neo4j"), os.environ.get("NEO4J_PASSWORD", "1qaz2wsx"))
+KG_DATA_PATH = os.environ.get(
+    "KG_DATA_PATH",
+    os.path.join(BUILD_DIR, "data", "TCM.json")
+)
+# KG_build.py 建图时写出；文件不存在时 Neo4j 后端退回 CONTAINS 查询
+KG_SYMPTOM_INDEX = os.environ.get("KG_SYMPTOM_INDEX", os.path.join(BUILD_DIR, "data", "symptom_index.json"))
+NODE_LABELS = ("方剂", "方名", "功能主治", "处方", "中药名")
+GRAPH_CONCURRENCY = int(os.environ.get("GRAPH_CONCURRENCY", "16"))  # 异步服务中同时执行的图查询上限
+
+
+class SymptomIndexFile:
+    """
+    symptom_index.json 的进程内副本。KG_build.py 每次建图都会重写索引并递增图谱版本号，
+    与 QueryCache 相同，每隔 VERSION_CHECK_INTERVAL 秒检查版本号与文件修改时间，变化时重新载入，
+    新增或改名的功能主治无需重启进程即可查到
+    """
+
+    def __init__(self, path, version_path=GRAPH_VERSION_PATH):
+        self.path = path
+        self.version_path = version_path
+        self.index = None
+        self.signature = None
+        self.checked = float("-inf")
+        self.lock = threading.Lock()
+        self.current()
+
+    def read_signature(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        return read_graph_version(self.version_path), mtime
+
+    def current(self):
+        """当前的索引，索引文件不存在时为 None"""
+        now = time.monotonic()
+        if now - self.checked < VERSION_CHECK_INTERVAL:
+            return self.index
+        with self.lock:
+            if now - self.checked >= VERSION_CHECK_INTERVAL:
+                signature = self.read_signature()
+                if signature != self.signature:
+                    self.index = SymptomIndex.load(self.path) if signature[1] is not None else None
+                    self.signature = signature
+                self.checked = now
+        return self.index
+
+
+class Neo4jBackend:
+
+    # 一次查询同时取回可视化所需的节点与表格所需的剂量、功能主治，每个方名一行：
+    #   fn, fjs（方剂）, gns（可视化中展示的功能主治）,
+    #   compositions（[{cf, herb, weight, grams, confidence}]，grams / confidence 为建图时解析的剂量数值与可信度）,
+    #   functions（该方全部功能主治名称）
+    # {symptom_filter}: 有索引时为 gn.name IN $names，否则为 gn.name CONTAINS $symptom
+    SYMPTOM_QUERY = '''
+    MATCH (fj:方剂)-[:包含]->(fn:方名)-[:功能主治]->(gn:功能主治)
+    WHERE {symptom_filter}
+    WITH fn, collect(DISTINCT fj) AS fjs, collect(DISTINCT gn) AS gns
+    MATCH (fn)-[:配方]->(cf:处方)-[r:中药组成]->(herb:中药名)
+    WITH fn, fjs, gns, collect({{cf: cf, herb: herb, weight: r.weight, grams: r.grams, confidence: r.dose_confidence}}) AS compositions
+    OPTIONAL MATCH (fn)-[:功能主治]->(hgn:功能主治)
+    RETURN fn, fjs, gns, compositions, collect(DISTINCT hgn.name) AS functions
+    '''
+
+    FORMULA_QUERY = '''
+    MATCH (fn:方名)
+    WHERE fn.name IN $names
+    OPTIONAL MATCH (fn)<-[:包含]-(fj:方剂)
+    WITH fn, collect(DISTINCT fj) AS fjs
+    OPTIONAL MATCH (fn)-[:功能主治]->(gn:功能主治)
+    WITH fn, fjs, collect(DISTINCT gn) AS gns
+    OPTIONAL MATCH (fn)-[:配方]->(cf:处方)-[r:中药组成]->(herb:中药名)
+    WITH fn, fjs, gns, collect({cf: cf, herb: herb, weight: r.weight, grams: r.grams, confidence: r.dose_confidence}) AS matched
+    RETURN fn, fjs, gns, [c IN matched WHERE c.herb IS NOT NULL] AS compositions,
+           [g IN gns | g.name] AS functions
+    '''
+
+    # 批量查询（离线评测）：UNWIND 一批输入，一次查询取回全部子图，每行另带输入序号 i
+    SYMPTOM_BATCH_QUERY = '''
+    UNWIND $batch AS item
+    MATCH (fj:方剂)-[:包含]->(fn:方名)-[:功能主治]->(gn:功能主治)
+    WHERE {symptom_filter}
+    WITH item.i AS i, fn, collect(DISTINCT fj) AS fjs, collect(DISTINCT gn) AS gns
+    MATCH (fn)-[:配方]->(cf:处方)-[r:中药组成]->(herb:中药名)
+    WITH i, fn, fjs, gns, collect({{cf: cf, herb: herb, weight: r.weight, grams: r.grams, confidence: r.dose_confidence}}) AS compositions
+    OPTIONAL MATCH (fn)-[:功能主治]->(hgn:功能主治)
+    RETURN i, fn, fjs, gns, compositions, collect(DISTINCT hgn.name) AS functions
+    '''
+
+    FORMULA_BATCH_QUERY = '''
+    UNWIND $batch AS item
+    MATCH (fn:方名)
+    WHERE fn.name IN item.names
+    OPTIONAL MATCH (fn)<-[:包含]-(fj:方剂)
+    WITH item.i AS i, fn, collect(DISTINCT fj) AS fjs
+    OPTIONAL MATCH (fn)-[:功能主治]->(gn:功能主治)
+    WITH i, fn, fjs, collect(DISTINCT gn) AS gns
+    OPTIONAL MATCH (fn)-[:配方]->(cf:处方)-[r:中药组成]->(herb:中药名)
+    WITH i, fn, fjs, gns, collect({cf: cf, herb: herb, weight: r.weight, grams: r.grams, confidence: r.dose_confidence}) AS matched
+    RETURN i, fn, fjs, gns, [c IN matched WHERE c.herb IS NOT NULL] AS compositions,
+           [g IN gns | g.name] AS functions
+    '''
+
+    # 多症状推荐的 方名 × 功能主治 关联矩阵
+    PAIRS_QUERY = '''
+    MATCH (fn:方名)-[:功能主治]->(gn:功能主治)
+    RETURN fn.name AS formula, gn.name AS symptom
+    '''
+
+    # 中药共用比较的药材位集
+    COMPOSITIONS_QUERY = '''
+    MATCH (fn:方名)-[:配方]->(cf:处方)-[r:中药组成]->(herb:中药名)
+    RETURN fn.name AS formula, cf.name AS prescription, herb.name AS herb, r.weight AS weight, r.grams AS grams
+    '''
+
+    # 某味药在各方中的剂量，按克数过滤与排序（r.grams 有索引，见 build/KG_build.py create_dose_index）
+    HERB_DOSES_QUERY = '''
+    MATCH (fn:方名)-[:配方]->(cf:处方)-[r:中药组成]->(herb:中药名 {name: $herb})
+    WHERE r.grams IS NOT NULL
+      AND ($min_grams IS NULL OR r.grams >= $min_grams)
+      AND ($max_grams IS NULL OR r.grams <= $max_grams)
+    RETURN fn.name AS formula, r.weight AS weight, r.grams AS grams, r.dose_confidence AS confidence
+    ORDER BY grams DESC, formula
+    '''
+
+    # 节点的全部邻居（展开节点用），{label} 只取自 NODE_LABELS
+    NEIGHBOURS_QUERY = '''
+    MATCH (n:{label} {{name: $name}})
+    OPTIONAL MATCH (n)-[r]-(m)
+    WITH n, r, m ORDER BY type(r), m.name
+    RETURN count(r) AS total,
+           collect(CASE WHEN r IS NOT NULL THEN {{relation: type(r), outgoing: startNode(r) = n,
+                   type: labels(m)[0], label: m.name, weight: r.weight}} END)[..$limit] AS neighbours
+    '''
+
+    def __init__(self, uri=NEO4J_URI, auth=NEO4J_AUTH, index_path=KG_SYMPTOM_INDEX):
+        from neo4j import GraphDatabase
+        self.driver = GraphDatabase.driver(uri, auth=auth)
+        self.symptom_index_file = SymptomIndexFile(index_path)
+
+    @property
+    def symptom_index(self):
+        return self.symptom_index_file.current()
+
+    def run(self, query, **params):
+        with self.driver.session() as session:
+            return list(session.run(query, **params))
+
+    @staticmethod
+    def symptom_query(query, symptom, index):
+        """返回 (Cypher, 参数)；index 为当前的症状索引（None 时退回 CONTAINS），索引中没有匹配的功能主治时返回 None"""
+        if index is None:
+            return query.format(symptom_filter="gn.name CONTAINS $symptom"), {"symptom": symptom}
+        names = index.lookup(symptom)
+        if not names:
+            return None
+        return query.format(symptom_filter="gn.name IN $names"), {"names": names}
+
+    def run_symptom(self, query, symptom):
+        prepared = self.symptom_query(query, symptom, self.symptom_index)
+        if prepared is None:
+            return []
+        return self.run(prepared[0], **prepared[1])
+
+    def symptom_subgraph(self, symptom):
+        return self.run_symptom(self.SYMPTOM_QUERY, symptom)
+
+    def formula_subgraph(self, formula1, formula2):
+        return self.formulas_subgraph([formula1, formula2])
+
+    def formulas_subgraph(self, names):
+        """指定方名的子图，每个方名一行（行序不保证与 names 一致）"""
+        return self.run(self.FORMULA_QUERY, names=list(names))
+
+    @staticmethod
+    def group_batch(records, size):
+        """按输入序号 i 分组，返回与输入顺序一致的行列表"""
+        grouped = [[] for _ in range(size)]
+        for record in records:
+            grouped[record["i"]].append(record)
+        return grouped
+
+    def symptom_subgraphs(self, symptoms):
+        """批量症状查询，每个症状一个行列表（与 symptom_subgraph 相同），整批只执行一次查询"""
+        index = self.symptom_index
+        if index is None:
+            query = self.SYMPTOM_BATCH_QUERY.format(symptom_filter="gn.name CONTAINS item.symptom")
+            batch = [{"i": i, "symptom": symptom} for i, symptom in enumerate(symptoms)]
+        else:
+            query = self.SYMPTOM_BATCH_QUERY.format(symptom_filter="gn.name IN item.names")
+            batch = []
+            for i, symptom in enumerate(symptoms):
+                names = index.lookup(symptom)
+                if names:
+                    batch.append({"i": i, "names": names})
+        return self.group_batch(self.run(query, batch=batch) if batch else [], len(symptoms))
+
+    def formulas_subgraphs(self, name_lists):
+        """批量方名查询，每组方名一个行列表（与 formulas_subgraph 相同），整批只执行一次查询"""
+        batch = [{"i": i, "names": list(names)} for i, names in enumerate(name_lists)]
+        return self.group_batch(self.run(self.FORMULA_BATCH_QUERY, batch=batch) if batch else [], len(batch))
+
+    def formula_symptom_pairs(self):
+        return [(record["formula"], record["symptom"]) for record in self.run(self.PAIRS_QUERY)]
+
+    def formula_compositions(self):
+        return [(record["formula"], record["prescription"], record["herb"], record["weight"], record["grams"])
+                for record in self.run(self.COMPOSITIONS_QUERY)]
+
+    def herb_doses(self, herb, min_grams=None, max_grams=None):
+        """某味药在各方中的剂量（库内按克数过滤、排序）：[{"方名", "weight", "grams", "confidence"}]"""
+        records = self.run(self.HERB_DOSES_QUERY, herb=herb, min_grams=min_grams, max_grams=max_grams)
+        return [{"方名": record["formula"], "weight": record["weight"], "grams": record["grams"],
+                 "confidence": record["confidence"]} for record in records]
+
+    def neighbours_query(self, label):
+        if label not in NODE_LABELS:
+            raise ValueError(f"未知的节点类型: {label}")
+        return self.NEIGHBOURS_QUERY.format(label=label)
+
+    @staticmethod
+    def neighbours_result(records):
+        if not records:
+            return None
+        return {"total": records[0]["total"], "neighbours": [dict(item) for item in records[0]["neighbours"]]}
+
+    def neighbours(self, label, name, limit):
+        """
+        :return: {"total": 邻居总数, "neighbours": [{relation, outgoing, type, label, weight}, ...]（至多 limit 个）}，
+                 节点不存在时为 None
+        """
+        return self.neighbours_result(self.run(self.neighbours_query(label), name=name, limit=limit))
+
+
+class AsyncNeo4jBackend(Neo4jBackend):
+    """neo4j 异步驱动，连接池与并发查询数均为 GRAPH_CONCURRENCY"""
+
+    def __init__(self, uri=NEO4J_URI, auth=NEO4J_AUTH, index_path=KG_SYMPTOM_INDEX, concurrency=GRAPH_CONCURRENCY):
+        from neo4j import AsyncGraphDatabase
+        self.driver = AsyncGraphDatabase.driver(uri, auth=auth, max_connection_pool_size=concurrency)
+        self.symptom_index_file = SymptomIndexFile(index_path)
+        self.slots = asyncio.Semaphore(concurrency)
+
+    async def run(self, query, **params):
+        async with self.slots:
+            async with self.driver.session() as session:
+                result = await session.run(query, **params)
+                return [record async for record in result]
+
+    async def symptom_subgraph(self, symptom):
+        # 检查版本文件与（建图后）重新读入索引都是阻塞 IO，放到线程中执行
+        index = await asyncio.to_thread(self.symptom_index_file.current)
+        prepared = self.symptom_query(self.SYMPTOM_QUERY, symptom, index)
+        if prepared is None:
+            return []
+        return await self.run(prepared[0], **prepared[1])
+
+    async def formula_subgraph(self, formula1, formula2):
+        return await self.formulas_subgraph([formula1, formula2])
+
+    async def formulas_subgraph(self, names):
+        return await self.run(self.FORMULA_QUERY, names=list(names))
+
+    async def neighbours(self, label, name, limit):
+        return self.neighbours_result(await self.run(self.neighbours_query(label), name=name, limit=limit))
+
+
+class ThreadedBackend:
+    """将同步后端（内存引擎）的查询放入独立的有界线程池，不阻塞事件循环，也不与模型任务争用线程"""
+
+    def __init__(self, backend, concurrency=GRAPH_CONCURRENCY):
+        self.backend = backend
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix="graph")
+
+    async def call(self, method, *args):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, context.run, method, *args)
+
+    async def symptom_subgraph(self, symptom):
+        return await self.call(self.backend.symptom_subgraph, symptom)
+
+    async def formula_subgraph(self, formula1, formula2):
+        return await self.call(self.backend.formula_subgraph, formula1, formula2)
+
+    async def formulas_subgraph(self, names):
+        return await self.call(self.backend.formulas_subgraph, names)
+
+    async def neighbours(self, label, name, limit):
+        return await self.call(self.backend.neighbours, label, name, limit)
+
+
+def get_async_backend(backend, name=KG_BACKEND):
+    """
+    :param backend: get_backend() 已创建的同步后端，内存引擎直接复用，不重复载入数据
+    """
+    if name == "neo4j":
+        return AsyncNeo4jBackend()
+    return ThreadedBackend(backend)
+
+
+def get_backend(name=KG_BACKEND):
+    if name == "memory":
+        from kg_engine import MemoryGraph
+        return MemoryGraph.from_json(KG_DATA_PATH)
+    if name == "neo4j":
+        return Neo4jBackend()
+    raise ValueError(f"未知的 KG_BACKEND: {name}")
@@ -0,0 +1,360 @@
+"""
+嵌入式内存图查询引擎：将 TCM.json 三元组载入进程内，替代 Neo4j 回答 build_graph 所需的查询。
+
+节点按 (label, name) 驻留为连续整数 id；每种关系各建一份正向与反向 CSR 邻接
+（offsets / targets 数组），边上的 weight 按边序号存放。
+功能主治的 CONTAINS 查询走 build/symptom_index.py 的 n-gram 倒排索引。
+也可直接映射 build/graph_snapshot.py 编译的二进制快照（*.snap），邻接与字符串表零拷贝共享页缓存；
+按 label 的节点列表与功能主治的 n-gram 索引不在快照中，仍在每个进程启动时构建。
+边上的剂量除原始文本 weight 外，另有 build/dose_parser.py 解析的 grams 与 dose_confidence（与 Neo4j 中的关系属性相同）。
+"""
+import json
+import os
+import sys
+from array import array
+from collections import defaultdict
+
+BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "build")
+if BUILD_DIR not in sys.path:
+    sys.path.append(BUILD_DIR)
+
+from dose_parser import parse_dose
+from graph_snapshot import GraphSnapshot
+from symptom_index import SymptomIndex
+
+
+class MemoryNode:
+    """与 neo4j.graph.Node 在 build_graph 中的用法兼容：element_id / id / node['name']"""
+    __slots__ = ("id", "element_id", "label", "name")
+
+    def __init__(self, node_id, label, name):
+        self.id = node_id
+        self.element_id = str(node_id)
+        self.label = label
+        self.name = name
+
+    def __getitem__(self, key):
+        if key == "name":
+            return self.name
+        raise KeyError(key)
+
+    def __eq__(self, other):
+        return isinstance(other, MemoryNode) and other.id == self.id
+
+    def __hash__(self):
+        return self.id
+
+
+class CSR:
+    """单一关系方向上的压缩邻接表"""
+
+    def __init__(self, num_nodes, pairs):
+        """
+        :param num_nodes: 节点总数
+        :param pairs: [(源节点 id, 目标节点 id, 边序号), ...]
+        """
+        counts = [0] * (num_nodes + 1)
+        for src, _, _ in pairs:
+            counts[src + 1] += 1
+        for i in range(num_nodes):
+            counts[i + 1] += counts[i]
+        self.offsets = array("l", counts)
+        self.targets = array("l", [0] * len(pairs))
+        self.edge_ids = array("l", [0] * len(pairs))
+        cursor = list(counts[:num_nodes])
+        for src, dst, edge_id in pairs:
+            pos = cursor[src]
+            self.targets[pos] = dst
+            self.edge_ids[pos] = edge_id
+            cursor[src] += 1
+
+    def neighbors(self, node_id):
+        return self.targets[self.offsets[node_id]:self.offsets[node_id + 1]]
+
+    def edges(self, node_id):
+        start, end = self.offsets[node_id], self.offsets[node_id + 1]
+        return zip(self.targets[start:end], self.edge_ids[start:end])
+
+
+class SnapshotNodeIds:
+    """快照上 (label, name) -> id 的只读映射，二分查找代替驻留字典"""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def get(self, key, default=None):
+        node_id = self.snapshot.find(*key)
+        return default if node_id is None else node_id
+
+
+class SnapshotDoses:
+    """快照上 边序号 -> (grams, dose_confidence) 的只读映射"""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __getitem__(self, edge_id):
+        return self.snapshot.dose(edge_id)
+
+
+class MemoryGraph:
+
+    def __init__(self, triples):
+        self.node_ids = {}         # (label, name) -> id
+        self.label_ids = {}        # label -> label 序号
+        self.label_names = []      # label 序号 -> label
+        self.node_labels = array("l")
+        self.node_names = []
+        self.weights = []          # 边序号 -> weight
+        self.doses = []            # 边序号 -> (grams, dose_confidence)
+        self.label_nodes = defaultdict(list)
+        relation_pairs = defaultdict(list)
+
+        for triple in triples:
+            src = self.intern(*triple["node_1"].split("\t"))
+            dst = self.intern(*triple["node_2"].split("\t"))
+            relation_pairs[triple["relation"]].append((src, dst, len(self.weights)))
+            self.weights.append(triple.get("weight"))
+            self.doses.append(parse_dose(triple.get("weight"))[1:])
+
+        num_nodes = len(self.node_names)
+        self.out = {}
+        self.inc = {}
+        for relation, pairs in relation_pairs.items():
+            self.out[relation] = CSR(num_nodes, pairs)
+            self.inc[relation] = CSR(num_nodes, [(dst, src, e) for src, dst, e in pairs])
+
+        self.build_symptom_index()
+
+    def build_symptom_index(self):
+        # 索引下标与 label_nodes["功能主治"] 中的位置一一对应
+        self.symptom_ids = self.label_nodes["功能主治"]
+        self.symptom_index = SymptomIndex([self.node_names[n] for n in self.symptom_ids])
+
+    @classmethod
+    def from_json(cls, path):
+        """TCM.json，或 build/data/pipeline.py 输出的 TCM.jsonl（逐行读取），或 *.snap 快照"""
+        if path.endswith(".snap"):
+            return cls.from_snapshot(path)
+        with open(path, "r", encoding="utf-8") as fr:
+            if path.endswith(".jsonl"):
+                return cls(json.loads(line) for line in fr if line.strip())
+            return cls(json.load(fr))
+
+    @classmethod
+    def from_snapshot(cls, path):
+        """
+        mmap 映射快照：CSR、label 数组直接使用快照中的 memoryview，节点名与 weight 按需解码；
+        label_nodes 与症状索引在此遍历节点构建（耗时与节点数、功能主治数成正比）
+        """
+        snapshot = GraphSnapshot(path)
+        graph = cls.__new__(cls)
+        graph.snapshot = snapshot
+        graph.node_ids = SnapshotNodeIds(snapshot)
+        graph.label_names = snapshot.label_names
+        graph.label_ids = {label: i for i, label in enumerate(snapshot.label_names)}
+        graph.node_labels = snapshot.node_labels
+        graph.node_names = snapshot.node_names
+        graph.weights = snapshot.weights
+        graph.doses = SnapshotDoses(snapshot)
+        graph.label_nodes = defaultdict(list)
+        for node_id, label_id in enumerate(snapshot.node_labels):
+            graph.label_nodes[snapshot.label_names[label_id]].append(node_id)
+        graph.out = snapshot.out
+        graph.inc = snapshot.inc
+        graph.build_symptom_index()
+        return graph
+
+    def intern(self, label, name):
+        key = (label, name)
+        node_id = self.node_ids.get(key)
+        if node_id is None:
+            node_id = len(self.node_names)
+            self.node_ids[key] = node_id
+            if label not in self.label_ids:
+                self.label_ids[label] = len(self.label_names)
+                self.label_names.append(label)
+            self.node_labels.append(self.label_ids[label])
+            self.node_names.append(name)
+            self.label_nodes[label].append(node_id)
+        return node_id
+
+    def label_of(self, node_id):
+        return self.label_names[self.node_labels[node_id]]
+
+    def node(self, node_id):
+        if node_id is None:
+            return None
+        return MemoryNode(node_id, self.label_of(node_id), self.node_names[node_id])
+
+    def out_nodes(self, node_id, relation, label):
+        csr = self.out.get(relation)
+        if csr is None:
+            return []
+        return [n for n in csr.neighbors(node_id) if self.label_of(n) == label]
+
+    def in_nodes(self, node_id, relation, label):
+        csr = self.inc.get(relation)
+        if csr is None:
+            return []
+        return [n for n in csr.neighbors(node_id) if self.label_of(n) == label]
+
+    def out_edges(self, node_id, relation, label=None):
+        """[(目标节点, 边序号)]，边上的 weight / 剂量数值见 self.weights / self.doses"""
+        csr = self.out.get(relation)
+        if csr is None:
+            return []
+        return [(n, e) for n, e in csr.edges(node_id) if label is None or self.label_of(n) == label]
+
+    def in_edges(self, node_id, relation, label=None):
+        csr = self.inc.get(relation)
+        if csr is None:
+            return []
+        return [(n, e) for n, e in csr.edges(node_id) if label is None or self.label_of(n) == label]
+
+    def composition(self, cf, herb, edge_id):
+        """与 Neo4jBackend 查询中的 {cf, herb, weight, grams, confidence} 对应"""
+        grams, confidence = self.doses[edge_id]
+        return {"cf": self.node(cf), "herb": self.node(herb), "weight": self.weights[edge_id],
+                "grams": grams, "confidence": confidence}
+
+    def find(self, label, name):
+        return self.node_ids.get((label, name))
+
+    # === build_graph 使用的查询形状
+
+    def symptom_nodes(self, symptom):
+        """WHERE gn.name CONTAINS $symptom"""
+        return [self.symptom_ids[i] for i in self.symptom_index.lookup_ids(symptom)]
+
+    def symptom_formulas(self, symptom):
+        """(fj:方剂)-[:包含]->(fn:方名)-[:功能主治]->(gn:功能主治) 的 (fj, fn, gn) 组合"""
+        matches = []
+        for gn in self.symptom_nodes(symptom):
+            for fn in self.in_nodes(gn, "功能主治", "方名"):
+                for fj in self.in_nodes(fn, "包含", "方剂"):
+                    matches.append((fj, fn, gn))
+        return matches
+
+    def symptom_subgraph(self, symptom):
+        """
+        MATCH (fj:方剂)-[:包含]->(fn:方名)-[:功能主治]->(gn:功能主治)
+        WHERE gn.name CONTAINS $symptom
+        WITH fn, collect(DISTINCT fj) AS fjs, collect(DISTINCT gn) AS gns
+        MATCH (fn)-[:配方]->(cf:处方)-[r:中药组成]->(herb:中药名)
+        ...
+        每个方名一行，无组成的方名不返回
+        """
+        grouped = {}
+        for fj, fn, gn in self.symptom_formulas(symptom):
+            fjs, gns = grouped.setdefault(fn, ({}, {}))
+            fjs[fj] = None
+            gns[gn] = None
+        rows = []
+        for fn, (fjs, gns) in grouped.items():
+            row = self.subgraph_row(fn, fjs, gns)
+            if row["compositions"]:
+                rows.append(row)
+        return rows
+
+    def formula_subgraph(self, formula1, formula2):
+        """
+        MATCH (fn:方名) WHERE fn.name IN [$formula1, $formula2]
+        OPTIONAL MATCH (fn)<-[:包含]-(fj:方剂)
+        OPTIONAL MATCH (fn)-[:功能主治]->(gn:功能主治)
+        OPTIONAL MATCH (fn)-[:配方]->(cf:处方)-[r:中药组成]->(herb:中药名)
+        ...
+        每个方名一行，gns 为该方的全部功能主治
+        """
+        return self.formulas_subgraph([formula1, formula2])
+
+    def formulas_subgraph(self, names):
+        return [
+            self.subgraph_row(fn, self.in_nodes(fn, "包含", "方剂"), self.out_nodes(fn, "功能主治", "功能主治"))
+            for fn in self.formula_nodes(*names)
+        ]
+
+    def symptom_subgraphs(self, symptoms):
+        """批量症状查询，与 Neo4jBackend.symptom_subgraphs 相同；进程内逐个查询 n-gram 索引"""
+        return [self.symptom_subgraph(symptom) for symptom in symptoms]
+
+    def formulas_subgraphs(self, name_lists):
+        return [self.formulas_subgraph(names) for names in name_lists]
+
+    def formula_symptom_pairs(self):
+        """(方名, 功能主治) 组合，用于构建多症状推荐的关联矩阵"""
+        return [
+            (self.node_names[fn], self.node_names[gn])
+            for fn in self.label_nodes["方名"]
+            for gn in self.out_nodes(fn, "功能主治", "功能主治")
+        ]
+
+    def formula_compositions(self):
+        """(方名, 处方, 中药名, 剂量, 克数) 组合，用于构建中药共用比较的药材位集"""
+        return [
+            (self.node_names[fn], self.node_names[cf], self.node_names[herb], self.weights[e], self.doses[e][0])
+            for fn in self.label_nodes["方名"]
+            for cf in self.out_nodes(fn, "配方", "处方")
+            for herb, e in self.out_edges(cf, "中药组成", "中药名")
+        ]
+
+    def herb_doses(self, herb, min_grams=None, max_grams=None):
+        """
+        某味药在各方中的剂量，按克数范围过滤、克数降序，与 Neo4jBackend.herb_doses 相同
+        :return: [{"方名", "weight", "grams", "confidence"}]
+        """
+        node = self.find("中药名", herb)
+        if node is None:
+            return []
+        doses = []
+        for cf, e in self.in_edges(node, "中药组成", "处方"):
+            grams, confidence = self.doses[e]
+            if grams is None or (min_grams is not None and grams < min_grams) \
+                    or (max_grams is not None and grams > max_grams):
+                continue
+            for fn in self.in_nodes(cf, "配方", "方名"):
+                doses.append({"方名": self.node_names[fn], "weight": self.weights[e],
+                              "grams": grams, "confidence": confidence})
+        doses.sort(key=lambda item: (-item["grams"], item["方名"]))
+        return doses
+
+    def neighbours(self, label, name, limit):
+        """
+        节点的全部邻居（展开节点用），与 Neo4jBackend.neighbours 相同：
+        {"total": 邻居总数, "neighbours": [{relation, outgoing, type, label, weight}, ...]}，节点不存在时为 None
+        """
+        node = self.find(label, name)
+        if node is None:
+            return None
+        edges = [(relation, True, n, e) for relation, csr in self.out.items() for n, e in csr.edges(node)]
+        edges += [(relation, False, n, e) for relation, csr in self.inc.items() for n, e in csr.edges(node)]
+        edges.sort(key=lambda edge: (edge[0], self.node_names[edge[2]]))
+        return {
+            "total": len(edges),
+            "neighbours": [
+                {"relation": relation, "outgoing": outgoing, "type": self.label_of(n),
+                 "label": self.node_names[n], "weight": self.weights[e]}
+                for relation, outgoing, n, e in edges[:limit]
+            ],
+        }
+
+    def formula_nodes(self, *names):
+        ids = (self.find("方名", name) for name in dict.fromkeys(names))
+        return [n for n in ids if n is not None]
+
+    def subgraph_row(self, fn, fjs, gns):
+        """与 Neo4jBackend 的 RETURN fn, fjs, gns, compositions, functions 对应"""
+        compositions = [
+            self.composition(cf, herb, e)
+            for cf in self.out_nodes(fn, "配方", "处方")
+            for herb, e in self.out_edges(cf, "中药组成", "中药名")
+        ]
+        functions = list(dict.fromkeys(
+            self.node_names[gn] for gn in self.out_nodes(fn, "功能主治", "功能主治")))
+        return {
+            "fn": self.node(fn),
+            "fjs": [self.node(fj) for fj in dict.fromkeys(fjs)],
+            "gns": [self.node(gn) for gn in dict.fromkeys(gns)],
+            "compositions": compositions,
+            "functions": functions,
+        }
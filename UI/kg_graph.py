@@ -0,0 +1,475 @@
+"""
+四个 UI 应用共用的图谱查询：查询走 kg_backend 选定的后端（Neo4j 或内存引擎），
+每次请求只查询一次子图，可视化与表格都由同一结果在 Python 中生成。
+
+可视化不再由 pyvis 渲染成共享的 static/graph.html，而是生成紧凑的 JSON 图模型
+（nodes / edges / 颜色），以内容哈希为 key 存放，由 graph_api 的 /graph/<key>.json 返回，
+页面用 UI/lib 中的 vis-network 在浏览器端绘制。
+异步服务（app_async.py）使用 *_async 版本，与同步版本共用缓存。
+query / table / render 各阶段计时与结果规模记录到 metrics（Server-Timing 与 /metrics）。
+
+recommend 模式接受多个症状（逗号 / 顿号 / 空格分隔），由 formula_matrix 对全部方名打分取前 k 个，
+再取这些方名的子图，按排名顺序生成表格与图谱（图中只保留命中的功能主治）。
+
+结果预算：每次至多取 GRAPH_MAX_FORMULAS 个方名生成图谱与表格（症状模式按命中的功能主治数排序后截取），
+节点坐标由 graph_layout 在服务端算好并随图模型缓存，前端关闭物理模拟直接绘制；
+点击节点时经 expand() 按需取回该节点的邻居（至多 GRAPH_EXPAND_LIMIT 个）。
+
+query_batches() 供离线评测批量查询：每批输入只向后端提交一次查询（Neo4j 为 UNWIND 参数化查询），
+逐项返回 table_data，不生成图模型、不写入查询缓存。
+
+inference 模式另由 formula_compare 的药材位集给出两方的结构化比较（共有 / 独有药材、重合度、合计剂量）。
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import re
+
+import kg_backend
+import metrics
+from formula_compare import HerbSetIndex
+from formula_matrix import RECOMMEND_TOP_K, FormulaSymptomMatrix
+from graph_layout import radial_layout
+from query_cache import QueryCache
+
+GRAPH_MAX_FORMULAS = int(os.environ.get("GRAPH_MAX_FORMULAS", "30"))  # 单次结果的方名上限
+GRAPH_EXPAND_LIMIT = int(os.environ.get("GRAPH_EXPAND_LIMIT", "50"))  # 展开节点时返回的邻居上限
+BATCH_QUERY_SIZE = int(os.environ.get("BATCH_QUERY_SIZE", "200"))     # 批量查询每次提交给后端的输入数
+
+backend = kg_backend.get_backend()
+# /answer、/inference 与随后的 /suggest 共用同一份查询结果
+cache = QueryCache()
+# 内容哈希 -> 图模型，供 /graph/<key>.json 读取
+graphs = QueryCache()
+# 异步服务的后端，在事件循环中首次使用时创建
+_async_backend = None
+# 方名 × 功能主治 关联矩阵与药材位集，首次使用时构建，重建图谱（版本号变化）后重新构建
+matrices = QueryCache(maxsize=2, ttl=float("inf"))
+# (label, name, limit) -> 邻居
+neighbour_cache = QueryCache()
+
+COLOR_MAP = {
+    "方剂": "#C6EB87",
+    "方名": "#87EBC1",
+    "功能主治": "#EE90A1",
+    "处方": "#FFD700",
+    "中药名": "#69B2FF"
+}
+
+
+def parse_inference(symptom):
+    """解析 “X和Y可以一起服用吗？”，返回 (X, Y) 或 None"""
+    match = re.match(r"(.*)和(.*)可以一起服用吗？", symptom.strip())
+    if match:
+        return match.group(1).strip(), match.group(2).strip()
+    return None
+
+
+def formula_matrix():
+    matrix = matrices.get("formula_symptom")
+    if matrix is None:
+        with metrics.span("matrix"):
+            matrix = FormulaSymptomMatrix(backend.formula_symptom_pairs())
+        matrices.put("formula_symptom", matrix)
+    return matrix
+
+
+def recommend(symptom, k=RECOMMEND_TOP_K):
+    """多症状推荐排名，见 formula_matrix.FormulaSymptomMatrix.rank"""
+    matrix = formula_matrix()
+    with metrics.span("rank"):
+        return matrix.rank(symptom, k)
+
+
+def herb_index():
+    index = matrices.get("herb_sets")
+    if index is None:
+        with metrics.span("herb_index"):
+            index = HerbSetIndex(backend.formula_compositions(), backend.formula_symptom_pairs())
+        matrices.put("herb_sets", index)
+    return index
+
+
+def compare(formula1, formula2):
+    """两方的结构化比较，见 formula_compare.HerbSetIndex.compare"""
+    index = herb_index()
+    with metrics.span("compare"):
+        return index.compare(formula1, formula2)
+
+
+def compare_question(symptom):
+    """“X和Y可以一起服用吗？” 的比较结果，无法解析或方名不存在时为 None"""
+    formulas = parse_inference(symptom)
+    return compare(*formulas) if formulas else None
+
+
+def compare_batch(pairs):
+    index = herb_index()
+    with metrics.span("compare"):
+        return index.compare_batch(pairs)
+
+
+def herb_doses(herb, min_grams=None, max_grams=None):
+    """某味药在各方中的剂量，按克数过滤（Neo4j 后端在库内用 r.grams 索引过滤）"""
+    with metrics.span("query"):
+        return backend.herb_doses(herb, min_grams, max_grams)
+
+
+def ranked_rows(ranking, rows):
+    """子图行按排名排序，gns 只保留命中查询症状的功能主治"""
+    by_name = {row['fn']['name']: row for row in rows}
+    ordered = []
+    for item in ranking:
+        row = by_name.get(item['方名'])
+        if row is None:
+            continue
+        matched = {name for names in item['matched'].values() for name in names}
+        row = {key: row[key] for key in row.keys()}
+        row['gns'] = [gn for gn in row['gns'] if gn['name'] in matched]
+        ordered.append(row)
+    return ordered
+
+
+def query_subgraph(symptom, mode):
+    """一次查询取回子图，每个方名一行（见 kg_backend.Neo4jBackend.SYMPTOM_QUERY）"""
+    if mode == 'recommend':
+        ranking = recommend(symptom)
+        return ranked_rows(ranking, backend.formulas_subgraph([item['方名'] for item in ranking])) if ranking else []
+    formulas = parse_inference(symptom) if mode == 'inference' else None
+    if formulas:
+        return backend.formula_subgraph(*formulas)
+    return backend.symptom_subgraph(symptom)
+
+
+def async_backend():
+    global _async_backend
+    if _async_backend is None:
+        _async_backend = kg_backend.get_async_backend(backend)
+    return _async_backend
+
+
+async def query_subgraph_async(symptom, mode):
+    if mode == 'recommend':
+        # 矩阵首次构建需要读取全图，放到线程中执行
+        ranking = await asyncio.to_thread(recommend, symptom)
+        if not ranking:
+            return []
+        return ranked_rows(ranking, await async_backend().formulas_subgraph([item['方名'] for item in ranking]))
+    formulas = parse_inference(symptom) if mode == 'inference' else None
+    if formulas:
+        return await async_backend().formula_subgraph(*formulas)
+    return await async_backend().symptom_subgraph(symptom)
+
+
+def prune(result, mode, limit=GRAPH_MAX_FORMULAS):
+    """
+    结果预算：症状模式按命中的功能主治数（多者优先）、该方功能主治总数（少者优先）排序后取前 limit 个方名；
+    推荐模式已按得分排序，直接截取
+    """
+    if mode == 'answer':
+        result = sorted(result, key=lambda row: (-len(row['gns']), len(row['functions']), row['fn']['name']))
+    return result[:limit]
+
+
+def to_table(result):
+    """表格行：按 (方名, 中药, 剂量) 去重，与原先 collect() 聚合的分组一致"""
+    table_data = []
+    seen = set()
+    for row in result:
+        formula_name = row['fn']['name']
+        herb_gn = "；".join(row['functions']) if row['functions'] else ""
+        for composition in row['compositions']:
+            key = (formula_name, composition['herb']['name'], composition['weight'])
+            if key in seen:
+                continue
+            seen.add(key)
+            table_data.append({
+                "方名": key[0],
+                "中药": key[1],
+                "剂量": key[2],
+                "克数": composition.get('grams'),
+                "中药功能主治": herb_gn
+            })
+    return table_data
+
+
+def cache_key(symptom, mode):
+    return symptom.strip(), mode if mode in ('inference', 'recommend') else 'answer'
+
+
+def query_graph(symptom, mode):
+    """
+    查询并构建 (图模型, table_data)，结果按规范化后的 (symptom, mode) 缓存；
+    无结果时返回 (None, [])
+    """
+    key = cache_key(symptom, mode)
+    cached = lookup(key)
+    if cached is None:
+        with metrics.span("query"):
+            result = query_subgraph(*key)
+        cached = store_result(key, result)
+    return cached
+
+
+async def query_graph_async(symptom, mode):
+    key = cache_key(symptom, mode)
+    cached = lookup(key)
+    if cached is None:
+        with metrics.span("query"):
+            result = await query_subgraph_async(*key)
+        cached = store_result(key, result)
+    return cached
+
+
+def lookup(key):
+    cached = cache.get(key)
+    metrics.graph_cache.inc("miss" if cached is None else "hit")
+    return cached
+
+
+def store_result(key, result):
+    if result:
+        total = len(result)
+        result = prune(result, key[1])
+        with metrics.span("render"):
+            graph = to_graph(result, total)
+        with metrics.span("table"):
+            table_data = to_table(result)
+        metrics.result_size.observe(total, "formulas")
+        metrics.result_size.observe(graph["nodes"], "nodes")
+        metrics.result_size.observe(graph["edges"], "edges")
+        metrics.result_size.observe(len(table_data), "rows")
+        cached = (graph, table_data)
+    else:
+        metrics.result_size.observe(0, "formulas")
+        cached = (None, [])
+    cache.put(key, cached)
+    if cached[0] is not None:
+        graphs.put(cached[0]["key"], cached[0])
+    return cached
+
+
+def query_table(symptom, mode):
+    """只需要表格数据时使用（如 /suggest）"""
+    return query_graph(symptom, mode)[1]
+
+
+def build_graph(symptom, mode):
+    """返回 (图模型的内容哈希, table_data)；无结果时为 (None, [])"""
+    graph, table_data = query_graph(symptom, mode)
+    if graph is None:
+        return None, []
+    return graph["key"], table_data
+
+
+class UnparsedInput(dict):
+    """读入时已无法解析的一项输入 {"line": 行号, "error": ...}（如 batch_query.py 中不是合法 JSON 的行）；
+    单独的类型与合法输入中的 "error" 字段区分，输出时按普通 dict 写出"""
+
+
+def batch_plan(item, mode):
+    """
+    批量查询的一项输入 -> (mode, 查询类型, 值)，格式不对时抛出 ValueError：
+        "头痛"、{"symptom": "头痛", "mode": "recommend"}      症状（按 mode 查询）
+        ["麻黄汤", "桂枝汤"]、{"formulas": ["麻黄汤", "桂枝汤"]}  方名对（inference），formulas 须为列表
+        UnparsedInput(line=3, error="...")                  读入时已出错的输入，原样报告该错误
+    """
+    if isinstance(item, UnparsedInput):
+        raise ValueError(item["error"])
+    if isinstance(item, dict):
+        if "formulas" in item:
+            item = item["formulas"]
+            if not isinstance(item, list):
+                raise ValueError("方名对应为两个方名")
+        else:
+            mode = item.get("mode", mode)
+            item = item.get("symptom")
+    if isinstance(item, list):
+        if len(item) != 2 or not all(isinstance(name, str) and name.strip() for name in item):
+            raise ValueError("方名对应为两个方名")
+        return 'inference', 'formulas', [name.strip() for name in item]
+    if not isinstance(item, str) or not item.strip():
+        raise ValueError("缺少症状")
+    symptom, mode = cache_key(item, mode)
+    if mode == 'recommend':
+        return mode, 'recommend', symptom
+    formulas = parse_inference(symptom) if mode == 'inference' else None
+    if formulas:
+        return mode, 'formulas', list(formulas)
+    return mode, 'symptom', symptom
+
+
+def query_batch(items, mode='answer', start=0):
+    """
+    一批输入的 table_data：全部症状与全部方名组各只向后端提交一次查询
+    :return: [{"index", "input", "mode", "formulas": {"shown", "total"}, "table_data"}]，
+             输入格式不对时该项为 {"index", "input", "error"}
+    """
+    plans = []
+    for item in items:
+        try:
+            plans.append(batch_plan(item, mode))
+        except ValueError as e:
+            plans.append(e)
+    valid = [plan for plan in plans if not isinstance(plan, ValueError)]
+    with metrics.span("rank"):
+        rankings = [recommend(value) for _, kind, value in valid if kind == 'recommend']
+    pairs = [value for _, kind, value in valid if kind == 'formulas']
+    # 方名对与推荐结果的方名合并为一次方名查询
+    with metrics.span("query"):
+        symptom_rows = iter(backend.symptom_subgraphs([value for _, kind, value in valid if kind == 'symptom']))
+        formula_rows = backend.formulas_subgraphs(pairs + [[item['方名'] for item in ranking] for ranking in rankings])
+    pair_rows = iter(formula_rows[:len(pairs)])
+    ranked = iter(map(ranked_rows, rankings, formula_rows[len(pairs):]))
+
+    results = []
+    with metrics.span("table"):
+        for index, (item, plan) in enumerate(zip(items, plans), start):
+            if isinstance(plan, ValueError):
+                results.append({"index": index, "input": item, "error": str(plan)})
+                continue
+            plan_mode, kind, _ = plan
+            rows = next(symptom_rows if kind == 'symptom' else pair_rows if kind == 'formulas' else ranked)
+            shown = prune(rows, plan_mode)
+            results.append({
+                "index": index,
+                "input": item,
+                "mode": plan_mode,
+                "formulas": {"shown": len(shown), "total": len(rows)},
+                "table_data": to_table(shown),
+            })
+    return results
+
+
+def query_batches(items, mode='answer', size=BATCH_QUERY_SIZE):
+    """
+    逐批读取 items（可为惰性的迭代器）并查询，每批产出一个结果列表，内存占用与输入总数无关
+    """
+    items = iter(items)
+    start = 0
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield query_batch(chunk, mode, start)
+        start += len(chunk)
+
+
+def find_graph(key, symptom=None, mode=None):
+    """
+    按内容哈希取图模型；已被淘汰（或进程重启）时，若提供了原查询则重新查询并核对哈希
+    """
+    graph = graphs.get(key)
+    if graph is None and symptom:
+        graph, _ = query_graph(symptom, mode)
+        if graph is not None:
+            graphs.put(graph["key"], graph)
+    if graph is None or graph["key"] != key:
+        return None
+    return graph
+
+
+async def find_graph_async(key, symptom=None, mode=None):
+    graph = graphs.get(key)
+    if graph is None and symptom:
+        graph, _ = await query_graph_async(symptom, mode)
+        if graph is not None:
+            graphs.put(graph["key"], graph)
+    if graph is None or graph["key"] != key:
+        return None
+    return graph
+
+
+def to_graph(result, total=None):
+    """
+    由子图查询结果生成 vis-network 所需的紧凑图模型：
+    节点 id 为按出现顺序编号的整数，type 为节点类型（展开节点时使用），x / y 为服务端布局坐标，
+    title / 形状 / 箭头等展示属性由前端补齐；formulas 记录展示的方名数与匹配的方名总数
+    """
+    node_index = {}
+    nodes = []
+    edges = []
+    edge_keys = set()
+
+    def add_node(obj, label):
+        node_id = node_index.get(obj.element_id)
+        if node_id is None:
+            node_id = node_index[obj.element_id] = len(nodes)
+            nodes.append({"id": node_id, "label": obj['name'], "type": label, "color": COLOR_MAP.get(label, "#D3D3D3")})
+        return node_id
+
+    def add_edge(source, target, label):
+        edge_key = (source, target, label)
+        if edge_key not in edge_keys:
+            edge_keys.add(edge_key)
+            edges.append({"from": source, "to": target, "label": label})
+
+    for row in result:
+        id_fn = add_node(row['fn'], "方名")
+        for fj in row['fjs']:
+            add_edge(add_node(fj, "方剂"), id_fn, "包含")
+        for gn in row['gns']:
+            add_edge(id_fn, add_node(gn, "功能主治"), "功能主治")
+        for composition in row['compositions']:
+            id_cf = add_node(composition['cf'], "处方")
+            add_edge(id_fn, id_cf, "配方")
+            add_edge(id_cf, add_node(composition['herb'], "中药名"), "中药组成")
+
+    with metrics.span("layout"):
+        positions = radial_layout([node["type"] for node in nodes], [(edge["from"], edge["to"]) for edge in edges])
+    for node in nodes:
+        node["x"], node["y"] = positions[node["id"]]
+
+    formulas = {"shown": len(result), "total": len(result) if total is None else total}
+    body = json.dumps({"nodes": nodes, "edges": edges, "formulas": formulas},
+                      ensure_ascii=False, separators=(",", ":"))
+    return {
+        "key": hashlib.sha1(body.encode("utf-8")).hexdigest()[:16],
+        "body": body,
+        "nodes": len(nodes),
+        "edges": len(edges),
+    }
+
+
+def expand_key(label, name, limit):
+    if label not in COLOR_MAP or not name:
+        return None
+    return label, name, min(max(limit, 1), GRAPH_EXPAND_LIMIT)
+
+
+def expanded(key, result):
+    if result is not None:
+        for item in result["neighbours"]:
+            item["color"] = COLOR_MAP.get(item["type"], "#D3D3D3")
+        result = dict(result, type=key[0], label=key[1])
+        neighbour_cache.put(key, result)
+    return result
+
+
+def expand(label, name, limit=GRAPH_EXPAND_LIMIT):
+    """
+    节点的邻居（前端点击节点时按需展开），至多 limit 个，结果按 (label, name, limit) 缓存
+    :return: {"type", "label", "total", "neighbours": [{relation, outgoing, type, label, weight, color}]}，
+             节点不存在或类型未知时为 None
+    """
+    key = expand_key(label, name, limit)
+    if key is None:
+        return None
+    result = neighbour_cache.get(key)
+    if result is None:
+        with metrics.span("expand"):
+            result = expanded(key, backend.neighbours(*key))
+    return result
+
+
+async def expand_async(label, name, limit=GRAPH_EXPAND_LIMIT):
+    key = expand_key(label, name, limit)
+    if key is None:
+        return None
+    result = neighbour_cache.get(key)
+    if result is None:
+        with metrics.span("expand"):
+            result = expanded(key, await async_backend().neighbours(*key))
+    return result
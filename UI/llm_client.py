@@ -0,0 +1,154 @@
+"""
+与 Script/llm_worker.py 常驻模型进程通信的客户端。
+
+回答先查 answer_cache.py 的持久化缓存（key 含模型标识与生成参数，由模型进程的 info 请求取得），
+命中时不再请求模型进程；设置 ANSWER_CACHE_PATH 为空字符串可关闭缓存。
+缓存查询（answer_cache）与模型调用（llm，流式为首段 llm_first_token 与整段 llm_stream）计入 metrics，
+失败按原因计入 kg_llm_failures_total。
+"""
+import os
+import threading
+import time
+from multiprocessing.connection import Client
+
+import metrics
+from answer_cache import ANSWER_CACHE_PATH, AnswerCache
+
+WORKER_HOST = os.environ.get("LLM_WORKER_HOST", "127.0.0.1")
+WORKER_PORT = int(os.environ.get("LLM_WORKER_PORT", "6001"))
+WORKER_AUTHKEY = os.environ.get("LLM_WORKER_AUTHKEY", "kg_tcm").encode()
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "120"))
+INFO_TTL = 30.0  # 模型标识与生成参数的刷新间隔（秒），模型进程换模型后随之换 key
+
+answers = AnswerCache() if ANSWER_CACHE_PATH else None
+_info = {"value": None, "checked": None}
+_info_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    """模型进程不可用、繁忙、超时或生成失败"""
+
+    def __init__(self, message, reason="error"):
+        super().__init__(message)
+        self.reason = reason
+        metrics.llm_failures.inc(reason)
+
+
+def response_error(response):
+    error = response.get("error", "unknown error")
+    return LLMError(error, reason=error if error in ("busy", "timeout") else "generation")
+
+
+def worker_info(timeout=5.0):
+    """
+    模型进程当前的 (模型标识, 生成参数)，每 INFO_TTL 秒刷新一次（取不到时同样 INFO_TTL 秒后再试）；
+    模型进程不可用时沿用上次的结果，从未取得过则返回 None。
+    同一时刻只有一个线程连接模型进程，其他线程直接返回当前结果
+    """
+    with _info_lock:
+        now = time.monotonic()
+        if _info["checked"] is not None and now - _info["checked"] < INFO_TTL:
+            return _info["value"]
+        _info["checked"] = now
+    try:
+        conn = Client((WORKER_HOST, WORKER_PORT), authkey=WORKER_AUTHKEY)
+        try:
+            conn.send({"info": True})
+            if conn.poll(timeout):
+                response = conn.recv()
+                if response.get("ok"):
+                    with _info_lock:
+                        _info["value"] = (response["model"], response.get("params") or {})
+        finally:
+            conn.close()
+    except (EOFError, OSError):
+        pass
+    return _info["value"]
+
+
+def cached_reply(prompt):
+    """返回 (缓存的回答或 None, 写入缓存所需的 (模型标识, 生成参数) 或 None)"""
+    if answers is None:
+        return None, None
+    with metrics.span("answer_cache"):
+        info = worker_info()
+        if info is None:
+            return None, None
+        return answers.get(*info, prompt), info
+
+
+def generate(prompt, timeout=LLM_TIMEOUT):
+    """
+    返回 prompt 的回复：先查回答缓存，未命中再发送给常驻模型进程并等待回复
+    :param prompt: 完整的用户 prompt
+    :param timeout: 最长等待时间（秒），同时作为模型进程侧的排队 + 生成时限
+    :return: 模型回复文本
+    """
+    reply, info = cached_reply(prompt)
+    if reply is not None:
+        return reply
+    with metrics.span("llm"):
+        try:
+            conn = Client((WORKER_HOST, WORKER_PORT), authkey=WORKER_AUTHKEY)
+        except OSError as e:
+            raise LLMError(f"无法连接模型进程：{e}", reason="unavailable")
+        try:
+            conn.send({"prompt": prompt, "timeout": timeout})
+            # 多留一点余量，让模型进程先给出明确的 timeout 响应
+            if not conn.poll(timeout + 5):
+                raise LLMError("timeout", reason="timeout")
+            response = conn.recv()
+        except (EOFError, OSError) as e:
+            raise LLMError(f"模型进程连接中断：{e}", reason="disconnected")
+        finally:
+            conn.close()
+    if not response.get("ok"):
+        raise response_error(response)
+    reply = response["reply"].strip()
+    if info is not None and info[0] == response.get("model"):
+        answers.put(*info, prompt, reply)
+    return reply
+
+
+def stream(prompt, timeout=LLM_TIMEOUT):
+    """
+    流式生成：逐段产出模型回复。提前关闭生成器（如浏览器断开）会断开与模型进程的连接，
+    模型进程随之停止生成。缓存命中时整段回答作为一个片段返回；只有完整生成的回答才写入缓存
+    :param prompt: 完整的用户 prompt
+    :param timeout: 整个生成过程的最长时间（秒）
+    :return: 文本片段生成器
+    """
+    reply, info = cached_reply(prompt)
+    if reply is not None:
+        yield reply
+        return
+    start = time.perf_counter()
+    try:
+        conn = Client((WORKER_HOST, WORKER_PORT), authkey=WORKER_AUTHKEY)
+    except OSError as e:
+        raise LLMError(f"无法连接模型进程：{e}", reason="unavailable")
+    chunks = []
+    model = None
+    try:
+        conn.send({"prompt": prompt, "timeout": timeout, "stream": True})
+        while True:
+            if not conn.poll(timeout + 5):
+                raise LLMError("timeout", reason="timeout")
+            response = conn.recv()
+            if not response.get("ok"):
+                raise response_error(response)
+            if response.get("done"):
+                model = response.get("model")
+                break
+            if not chunks:
+                metrics.record("llm_first_token", time.perf_counter() - start)
+            chunks.append(response["token"])
+            yield response["token"]
+    except (EOFError, OSError) as e:
+        raise LLMError(f"模型进程连接中断：{e}", reason="disconnected")
+    finally:
+        conn.close()
+        metrics.record("llm_stream", time.perf_counter() - start)
+    # 与 generate 相同：只有生成回答的模型与缓存 key 中的模型一致时才写入（模型进程可能已换模型重启）
+    if info is not None and info[0] == model:
+        answers.put(*info, prompt, "".join(chunks).strip())
@@ -0,0 +1,128 @@
+"""
+异步服务（app_async.py）中模型任务的准入控制。
+
+模型调用（llm_client.generate / stream 是阻塞的 socket 通信）放在独立的线程池中执行，
+与图查询线程池分开；正在执行与排队中的任务总数达到 LLM_CONCURRENCY + LLM_QUEUE_SIZE 时
+立即抛出 LLMBusy，由路由返回“繁忙”响应，而不是让请求堆积占满服务。
+回答缓存命中时不占用名额。计数只在事件循环线程中修改，无需加锁。
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import llm_client
+import metrics
+
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "2"))  # 同时与模型进程通信的任务数
+LLM_QUEUE_SIZE = int(os.environ.get("LLM_QUEUE_SIZE", "4"))    # 等待执行的任务上限
+
+
+class LLMBusy(Exception):
+    """模型任务队列已满"""
+
+
+class LLMGate:
+
+    def __init__(self, concurrency=LLM_CONCURRENCY, queue_size=LLM_QUEUE_SIZE):
+        self.concurrency = concurrency
+        self.capacity = concurrency + queue_size
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix="llm")
+        self.pending = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.cache_hits = 0
+
+    def admit(self):
+        if self.pending >= self.capacity:
+            self.rejected += 1
+            metrics.llm_failures.inc("rejected")
+            raise LLMBusy()
+        self.pending += 1
+        self.admitted += 1
+
+    def release(self, _future=None):
+        self.pending -= 1
+
+    def submit(self, func, *args):
+        """
+        占用一个名额并在模型线程池中执行，线程结束时（而不是调用方取消时）才归还名额；
+        复制当前上下文执行，使 llm_client 中的计时计入本请求的 Server-Timing
+        """
+        self.admit()
+        context = contextvars.copy_context()
+        future = asyncio.get_running_loop().run_in_executor(self.executor, context.run, func, *args)
+        future.add_done_callback(self.release)
+        return future
+
+    async def cached(self, prompt):
+        """回答缓存命中时返回回答，否则返回 None"""
+        context = contextvars.copy_context()
+        reply, _ = await asyncio.get_running_loop().run_in_executor(None, context.run, llm_client.cached_reply, prompt)
+        if reply is not None:
+            self.cache_hits += 1
+        return reply
+
+    async def generate(self, prompt):
+        reply = await self.cached(prompt)
+        if reply is not None:
+            return reply
+        # shield：请求被取消时模型线程仍在运行，名额由 done 回调归还
+        return await asyncio.shield(self.submit(llm_client.generate, prompt))
+
+    def stream(self, prompt):
+        """
+        立即占用名额（队列已满时抛出 LLMBusy），返回异步文本片段生成器；
+        生成器被关闭或被回收（如客户端在响应开始前断开，生成器从未被迭代）时通知模型线程停止读取，
+        llm_client 随即断开与模型进程的连接，名额随之归还
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        cancel = threading.Event()
+
+        def produce():
+            tokens = llm_client.stream(prompt)
+            item = (None, None)
+            try:
+                for token in tokens:
+                    if cancel.is_set():
+                        break
+                    loop.call_soon_threadsafe(chunks.put_nowait, (token, None))
+            except llm_client.LLMError as e:
+                item = (None, e)
+            except Exception as e:
+                # 其他异常同样作为错误交给消费方，不能被当作正常结束，把截断的回答当成完整回答
+                item = (None, llm_client.LLMError(f"生成出错：{e!r}", reason="internal"))
+            finally:
+                tokens.close()
+            loop.call_soon_threadsafe(chunks.put_nowait, item)
+
+        self.submit(produce)
+
+        async def consume():
+            try:
+                while True:
+                    token, error = await chunks.get()
+                    if error is not None:
+                        raise error
+                    if token is None:
+                        return
+                    yield token
+            finally:
+                cancel.set()
+
+        tokens = consume()
+        weakref.finalize(tokens, cancel.set)
+        return tokens
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "capacity": self.capacity,
+            "pending": self.pending,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "cache_hits": self.cache_hits,
+        }
@@ -0,0 +1,190 @@
+"""
+请求内的分阶段计时与 Prometheus 文本格式指标（不依赖 prometheus_client）。
+
+    with metrics.span("query"):      # 记录到 kg_stage_duration_seconds{stage="query"}，
+        ...                          # 并加入当前请求的 Server-Timing 响应头
+    metrics.init_app(app, request)   # Flask / Quart：Server-Timing、请求耗时直方图与 GET /metrics
+
+当前请求的计时列表存放在 contextvars 中，Flask 的请求线程与 Quart 的协程都互不干扰；
+放入线程池执行的任务需用 contextvars.copy_context().run 执行才会计入 Server-Timing（直方图不受影响）。
+每次计时只有两次 perf_counter 与一次加锁的桶计数，可在生产环境常开。指标按进程统计。
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+TOKEN_BUCKETS = (64, 128, 256, 512, 768, 1024, 1536, 2048, 4096, 8192, 16384)
+
+_timings = contextvars.ContextVar("kg_timings", default=None)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [各桶计数（非累计）..., +Inf 桶, sum]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((labels, list(series)) for labels, series in self.series.items())
+        names = self.labelnames + ("le",)
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = bound if bound == "+Inf" else format_value(bound)
+                lines.append(f"{self.name}_bucket{format_labels(names, labels + (le,))} {cumulative}")
+            label_text = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {series[-1]!r}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+stage_seconds = Histogram("kg_stage_duration_seconds", "Duration of request stages", ["stage"])
+request_seconds = Histogram("kg_http_request_duration_seconds", "HTTP request duration",
+                            ["endpoint", "method", "status"])
+result_size = Histogram("kg_result_size", "Size of graph query results", ["kind"], buckets=SIZE_BUCKETS)
+graph_cache = Counter("kg_query_cache_total", "Graph query cache lookups", ["result"])
+llm_failures = Counter("kg_llm_failures_total", "Failed LLM generations", ["reason"])
+prompt_tokens = Histogram("kg_prompt_tokens", "LLM prompt size in tokens", ["kind"], buckets=TOKEN_BUCKETS)
+
+REGISTRY = [stage_seconds, request_seconds, result_size, graph_cache, llm_failures, prompt_tokens]
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def start_request():
+    """开始记录当前请求（上下文）的分阶段计时"""
+    _timings.set([])
+
+
+def record(stage, seconds):
+    stage_seconds.observe(seconds, stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def server_timing(total=None):
+    """当前请求的 Server-Timing 响应头；同名阶段出现多次时合并耗时"""
+    merged = {}
+    for stage, seconds in _timings.get() or ():
+        merged[stage] = merged.get(stage, 0.0) + seconds
+    if total is not None:
+        merged["total"] = total
+    return ", ".join(f"{stage};dur={seconds * 1e3:.2f}" for stage, seconds in merged.items())
+
+
+def init_app(app, request, is_async=False):
+    """
+    注册请求计时钩子与 GET /metrics
+    :param app: Flask 或 Quart 应用
+    :param request: 对应框架的 request 代理
+    :param is_async: Quart 应用为 True（同步钩子会在复制的上下文中执行，计时列表无法传回请求）
+    """
+    started = contextvars.ContextVar("kg_request_started", default=None)
+
+    def before_request():
+        start_request()
+        started.set(time.perf_counter())
+
+    def after_request(response):
+        start = started.get()
+        if start is None:
+            return response
+        total = time.perf_counter() - start
+        response.headers["Server-Timing"] = server_timing(total)
+        # 以路由规则而非原始路径作为标签，避免 /graph/<key>.json 造成标签爆炸
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        request_seconds.observe(total, endpoint, request.method, str(response.status_code))
+        return response
+
+    def metrics_view():
+        return app.response_class(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+    if is_async:
+        async def before_request_async():
+            before_request()
+
+        async def after_request_async(response):
+            return after_request(response)
+
+        async def metrics_view_async():
+            return metrics_view()
+
+        app.before_request(before_request_async)
+        app.after_request(after_request_async)
+        app.add_url_rule("/metrics", "metrics", metrics_view_async, methods=["GET"])
+    else:
+        app.before_request(before_request)
+        app.after_request(after_request)
+        app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
+    return app
@@ -0,0 +1,176 @@
+"""
+模型提示词的上下文选择：table_data 中每个方名一条“方名：功能主治”事实，按与查询的相关度排序、去重后，
+在 PROMPT_TOKEN_BUDGET 个 token 内装入提示词，常见症状匹配到几十个方名时提示词不再无限增长（预填充耗时随之下降）。
+
+    - 排序：命中查询症状（或推理问题中的方名）的功能主治条数，其次为字符二元组重合数，再次为原有顺序
+    - 去重：同一方名内被其他条目包含的功能主治（“头痛” ⊂ “偏正头痛”）只保留较长者，功能主治完全相同的方名合为一行
+    - 装填：先按排名放入各方名命中查询的功能主治，再用剩余预算按排名补入其余条目；排名第一的事实总会保留
+
+token 数用模型自己的分词器计算（只加载分词器）：默认取模型进程正在使用的模型目录（llm_client.worker_info，
+模型进程换模型后随之更换），PROMPT_TOKENIZER 可另行指定。模型进程不可用、目录在本机不可读或没有安装 transformers 时
+退回按字符数估计并记录 WARNING 日志，此时预算只是近似值。每次构建的 token 数计入
+kg_prompt_tokens{kind="selected|candidate"}（GET /metrics），并以 INFO 级别写入日志。
+"""
+import logging
+import os
+import threading
+
+import llm_client
+import metrics
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", "1024"))  # 整个用户提示词的 token 上限
+PROMPT_TOKENIZER = os.environ.get("PROMPT_TOKENIZER", "")                 # 分词器路径，默认与模型进程相同
+FACT_SEPARATOR = "；"
+
+logger = logging.getLogger(__name__)
+_tokenizer = {"path": None, "value": None, "loaded": False}
+_tokenizer_lock = threading.Lock()
+
+
+def tokenizer_path():
+    """PROMPT_TOKENIZER，未设置时为模型进程加载的模型目录，模型进程不可用时为 None"""
+    if PROMPT_TOKENIZER:
+        return PROMPT_TOKENIZER
+    info = llm_client.worker_info()
+    return info[0] if info is not None else None
+
+
+def load_tokenizer():
+    """当前模型的分词器，每个路径只加载一次；不可用时返回 None（按字符数估计）"""
+    path = tokenizer_path()
+    with _tokenizer_lock:
+        if not _tokenizer["loaded"] or path != _tokenizer["path"]:
+            _tokenizer.update(path=path, value=None, loaded=True)
+            if path is None:
+                logger.warning("模型进程不可用，暂按字符数估计 token")
+            elif not PROMPT_TOKENIZER and not os.path.isdir(path):
+                logger.warning("模型进程的模型 %s 不是本机目录，按字符数估计 token（可设置 PROMPT_TOKENIZER）", path)
+            else:
+                try:
+                    from transformers import AutoTokenizer
+                    _tokenizer["value"] = AutoTokenizer.from_pretrained(path)
+                except (ImportError, OSError, ValueError) as e:
+                    logger.warning("分词器 %s 不可用，按字符数估计 token：%s", path, e)
+        return _tokenizer["value"]
+
+
+def count_tokens(texts):
+    """每段文本的 token 数"""
+    tokenizer = load_tokenizer()
+    if tokenizer is None or not texts:
+        return [len(text) for text in texts]
+    return [len(ids) for ids in tokenizer(list(texts), add_special_tokens=False)["input_ids"]]
+
+
+def bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def formula_facts(table_data):
+    """table_data -> [(方名, [功能主治, ...])]，按表格中首次出现的顺序"""
+    facts = {}
+    for item in table_data:
+        if item["方名"] not in facts:
+            functions = [f for f in (item["中药功能主治"] or "").split(FACT_SEPARATOR) if f]
+            facts[item["方名"]] = list(dict.fromkeys(functions))
+    return list(facts.items())
+
+
+def dedupe_functions(functions):
+    """去掉被同一方名中其他条目包含的功能主治"""
+    return [f for f in functions if not any(f != other and f in other for other in functions)]
+
+
+def rank_facts(facts, terms):
+    """
+    按相关度排序并合并功能主治相同的方名
+    :param facts: [(方名, [功能主治, ...])]
+    :param terms: 查询症状或方名
+    :return: [([方名, ...], [功能主治, ...], 命中数)]，每行命中查询的功能主治排在前面
+    """
+    query_grams = set().union(*(bigrams(term) for term in terms)) if terms else set()
+    ranked = []
+    for position, (name, functions) in enumerate(facts):
+        functions = dedupe_functions(functions)
+        hits = [f for f in functions if any(term in f or f in term for term in terms)]
+        if any(term in name or name in term for term in terms):
+            score = len(functions) + 1  # 推理问题中点名的方名排在最前
+        else:
+            score = len(hits)
+        overlap = sum(len(bigrams(f) & query_grams) for f in functions)
+        ordered = hits + [f for f in functions if f not in hits]
+        ranked.append(((-score, -overlap, position), name, ordered, len(hits)))
+    ranked.sort(key=lambda item: item[0])
+
+    lines = {}
+    for _, name, functions, relevant in ranked:
+        lines.setdefault(frozenset(functions), (functions, relevant, []))[2].append(name)
+    return [(names, functions, relevant) for functions, relevant, names in lines.values()]
+
+
+def fact_line(names, functions):
+    return f"{'、'.join(names)}：{FACT_SEPARATOR.join(functions) or '暂无说明'}"
+
+
+def pack_facts(lines, budget):
+    """
+    在 budget 个 token 内放入事实行：第一轮按排名放入各行命中查询的功能主治（没有命中时放第一条），
+    第二轮按排名把各行其余的功能主治补入剩余预算。
+    各段分别计数之和不小于整段的 token 数（BPE 合并只会减少 token），按它装填不会超出预算
+    :param lines: rank_facts 的结果
+    :return: 放入的文本行，按排名排列
+    """
+    heads = count_tokens([fact_line(names, []) for names, _, _ in lines])
+    flat = count_tokens([FACT_SEPARATOR + f for _, functions, _ in lines for f in functions])
+    costs = []
+    for _, functions, _ in lines:
+        costs.append(flat[:len(functions)])
+        flat = flat[len(functions):]
+
+    kept = {}
+    used = 0
+    for i, (_, functions, relevant) in enumerate(lines):
+        cost = heads[i] + 1  # 换行符
+        count = 0
+        for item_cost in costs[i][:max(relevant, 1)]:
+            if used + cost + item_cost > budget:
+                break
+            cost += item_cost
+            count += 1
+        if kept and (used + cost > budget or (functions and count == 0)):
+            continue
+        if functions and count == 0:
+            count, cost = 1, cost + costs[i][0]  # 排名第一的事实至少保留一条功能主治
+        kept[i] = count
+        used += cost
+    for i in kept:
+        for item_cost in costs[i][kept[i]:]:
+            if used + item_cost > budget:
+                break
+            used += item_cost
+            kept[i] += 1
+    return [fact_line(lines[i][0], lines[i][1][:count]) for i, count in kept.items()]
+
+
+def build_prompt(table_data, header, question, terms, extra=None, budget=PROMPT_TOKEN_BUDGET):
+    """
+    :param table_data: kg_graph.query_table 的结果
+    :param header: 提示词开头的指令
+    :param question: 结尾的 “用户问题：...”
+    :param terms: 用于排序的查询症状或方名
+    :param extra: 必须完整保留的附加内容（如两方的结构化比较）
+    :param budget: 整个提示词的 token 上限
+    :return: 提示词
+    """
+    fixed = [header] + ([extra] if extra else []) + [question]
+    lines = rank_facts(formula_facts(table_data), terms)
+    selected = pack_facts(lines, budget - sum(count_tokens(fixed)) - len(fixed))
+    prompt = "\n".join([header] + selected + fixed[1:])
+
+    candidate = "\n".join([header] + [fact_line(names, functions) for names, functions, _ in lines] + fixed[1:])
+    selected_tokens, candidate_tokens = count_tokens([prompt, candidate])
+    metrics.prompt_tokens.observe(selected_tokens, "selected")
+    metrics.prompt_tokens.observe(candidate_tokens, "candidate")
+    logger.info("prompt tokens: %d / %d（事实 %d / %d 行，预算 %d）",
+                selected_tokens, candidate_tokens, len(selected), len(lines), budget)
+    return prompt
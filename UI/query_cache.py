@@ -0,0 +1,102 @@
+"""
+进程内查询结果缓存：容量受限的 LRU + TTL，并以图谱版本号失效。
+
+KG_build.py 每次重建图谱都会改写 build/data/graph_version.json，缓存发现版本变化时整体清空，
+避免重建后继续返回旧图谱的结果。命中 / 未命中 / 淘汰计数通过 stats() 暴露，便于调整容量与 TTL。
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "256"))
+QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", "600"))
+GRAPH_VERSION_PATH = os.environ.get(
+    "GRAPH_VERSION_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "build", "data", "graph_version.json")
+)
+VERSION_CHECK_INTERVAL = 5.0  # 最多每隔几秒读取一次版本文件
+
+
+def read_graph_version(path=GRAPH_VERSION_PATH):
+    """读取 KG_build.py 写出的图谱版本号，文件不存在时返回 None"""
+    try:
+        with open(path, "r", encoding="utf-8") as fr:
+            return json.load(fr).get("version")
+    except (OSError, ValueError):
+        return None
+
+
+class QueryCache:
+
+    def __init__(self, maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL, version_path=GRAPH_VERSION_PATH):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version_path = version_path
+        self.version = read_graph_version(version_path)
+        self.version_checked = time.monotonic()
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def check_version(self, now):
+        if now - self.version_checked < VERSION_CHECK_INTERVAL:
+            return
+        self.version_checked = now
+        version = read_graph_version(self.version_path)
+        if version != self.version:
+            self.version = version
+            self.entries.clear()
+            self.invalidations += 1
+
+    def get(self, key):
+        """命中返回缓存值，否则返回 None"""
+        now = time.monotonic()
+        with self.lock:
+            self.check_version(now)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= now:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "graph_version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
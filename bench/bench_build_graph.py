@@ -0,0 +1,76 @@
+"""
+build_graph() 分阶段微基准：症状模式与两方共用（inference）模式，各查询绕过查询缓存重复执行，
+分别统计 query（后端子图查询）、table（表格行）、render（图模型 + JSON 序列化）三个阶段。
+pyvis 渲染与 write_html 已由 render 阶段（返回给 /graph/<key>.json 的紧凑 JSON）代替。
+
+默认使用内存引擎（KG_BACKEND=memory），设置 KG_BACKEND=neo4j 可测本地 Neo4j：
+
+    python bench/bench_build_graph.py
+    KG_BACKEND=neo4j python bench/bench_build_graph.py --repeat 50 --output bench/results/build_graph.json
+"""
+import argparse
+import os
+import time
+
+from common import (DATA_PATH, SYMPTOMS, UI_DIR, add_path, formula_pairs, inference_question, load_triples,
+                    summarize, timed, write_results)
+
+os.environ.setdefault("KG_BACKEND", "memory")
+add_path(UI_DIR)
+
+STAGES = ("query", "table", "render")
+
+
+def run_case(kg_graph, symptom, mode, repeat):
+    samples = {stage: [] for stage in STAGES + ("total",)}
+    sizes = {}
+    key = kg_graph.cache_key(symptom, mode)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result, seconds = timed(kg_graph.query_subgraph, *key)
+        samples["query"].append(seconds)
+        table, seconds = timed(kg_graph.to_table, result)
+        samples["table"].append(seconds)
+        graph, seconds = timed(kg_graph.to_graph, result) if result else (None, 0.0)
+        samples["render"].append(seconds)
+        samples["total"].append(time.perf_counter() - start)
+        sizes = {
+            "rows": len(result),
+            "table_rows": len(table),
+            "nodes": graph["nodes"] if graph else 0,
+            "edges": graph["edges"] if graph else 0,
+            "bytes": len(graph["body"].encode("utf-8")) if graph else 0,
+        }
+    return {"symptom": symptom, "mode": mode, **sizes,
+            "stages": {stage: summarize(values) for stage, values in samples.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--pairs", type=int, default=4, help="inference 模式的方剂对数")
+    parser.add_argument("--output", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    import kg_graph
+    load_seconds = time.perf_counter() - start
+
+    cases = [(symptom, "answer") for symptom in SYMPTOMS]
+    cases += [(inference_question(pair), "inference") for pair in formula_pairs(load_triples(DATA_PATH), args.pairs)]
+    results = []
+    print(f"{'mode':<9} {'query':<24} {'rows':>5} {'nodes':>6} {'query ms':>9} {'table ms':>9} {'render ms':>10}")
+    for symptom, mode in cases:
+        case = run_case(kg_graph, symptom, mode, args.repeat)
+        results.append(case)
+        stages = case["stages"]
+        print(f"{mode:<9} {symptom[:22]:<24} {case['rows']:>5} {case['nodes']:>6} "
+              f"{stages['query']['p50_ms']:>9.2f} {stages['table']['p50_ms']:>9.2f} {stages['render']['p50_ms']:>10.2f}")
+
+    write_results(args.output, "build_graph",
+                  {"backend": os.environ["KG_BACKEND"], "repeat": args.repeat, "backend_load_s": load_seconds},
+                  results)
+
+
+if __name__ == "__main__":
+    main()
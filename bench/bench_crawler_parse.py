@@ -0,0 +1,111 @@
+"""
+爬虫页面解析吞吐量基准：对已保存的页面（--pages 目录下的 *.html）执行 parse_formula_blocks
+与 assign_formula_names，不发网络请求、不调用 LLM。未指定 --pages 时由 TCM.json 按原站的
+【方剂名】/【出处】/【组成】/【功效】段落结构合成夹具页面（每页 --per-page 个方剂）：
+
+    python bench/bench_crawler_parse.py
+    python bench/bench_crawler_parse.py --pages ./saved_pages --repeat 3 --output bench/results/crawler_parse.json
+"""
+import argparse
+import glob
+import html
+import os
+import time
+from collections import defaultdict
+
+from common import BUILD_DIR, DATA_PATH, add_path, load_triples, summarize, write_results
+
+add_path(os.path.join(BUILD_DIR, "Crawler"))
+
+import tcm_crawler
+
+
+def synth_pages(triples, per_page=4):
+    """由三元组还原各方剂的段落，返回 [(页面名, html)]"""
+    formulas = defaultdict(lambda: defaultdict(list))
+    prescriptions = defaultdict(list)
+    for ele in triples:
+        name1 = ele["node_1"].split("\t")[1]
+        name2 = ele["node_2"].split("\t")[1]
+        if ele["relation"] == "中药组成":
+            prescriptions[name1].append(name2 + (ele.get("weight") or ""))
+        elif ele["relation"] in ("来源", "别名", "功能主治", "配方"):
+            formulas[name1][ele["relation"]].append(name2)
+
+    blocks = []
+    for name, sections in formulas.items():
+        paragraphs = [f"【方剂名】{name}"]
+        if sections["来源"]:
+            paragraphs.append(f"【出处】{'；'.join(sections['来源'])}")
+        if sections["别名"]:
+            paragraphs.append(f"【别名】{'、'.join(sections['别名'])}")
+        for prescription in sections["配方"]:
+            paragraphs.append(f"【组成】{'，'.join(prescriptions[prescription])}")
+        if sections["功能主治"]:
+            paragraphs.append(f"【功效】{'，'.join(sections['功能主治'])}")
+        blocks.append("".join(f"<p>{html.escape(p)}</p>" for p in paragraphs))
+
+    pages = []
+    for i in range(0, len(blocks), per_page):
+        body = "".join(blocks[i:i + per_page])
+        pages.append((f"{i // per_page + 1}.html",
+                      f"<html><head><meta charset='utf-8'></head><body><div class='content'>{body}</div></body></html>"))
+    return pages
+
+
+def load_pages(directory):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        with open(path, "r", encoding="utf-8", errors="replace") as fr:
+            pages.append((os.path.basename(path), fr.read()))
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", help="已保存页面目录（*.html），默认由 TCM.json 合成")
+    parser.add_argument("--per-page", type=int, default=4, help="合成页面时每页的方剂数")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages) if args.pages else synth_pages(load_triples(DATA_PATH), args.per_page)
+    total_bytes = sum(len(text.encode("utf-8")) for _, text in pages)
+
+    parse_samples, name_samples = [], []
+    blocks = formulas = 0
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        tcm_crawler.formula_name_counts.clear()
+        blocks = formulas = 0
+        for _, text in pages:
+            t0 = time.perf_counter()
+            parsed = tcm_crawler.parse_formula_blocks(text)
+            t1 = time.perf_counter()
+            named = tcm_crawler.assign_formula_names(parsed)
+            t2 = time.perf_counter()
+            parse_samples.append(t1 - t0)
+            name_samples.append(t2 - t1)
+            blocks += len(parsed)
+            formulas += len(named)
+    seconds = (time.perf_counter() - start) / args.repeat
+
+    results = {
+        "pages": len(pages),
+        "bytes": total_bytes,
+        "blocks": blocks,
+        "formulas": formulas,
+        "pages_per_sec": len(pages) / seconds,
+        "mb_per_sec": total_bytes / seconds / 1e6,
+        "parse": summarize(parse_samples),
+        "assign_names": summarize(name_samples),
+    }
+    print(f"{len(pages)} pages, {blocks} blocks, {formulas} formulas, {total_bytes / 1e3:.0f} KB")
+    print(f"{results['pages_per_sec']:.0f} pages/s, {results['mb_per_sec']:.2f} MB/s, "
+          f"parse p50 {results['parse']['p50_ms']:.2f} ms / p95 {results['parse']['p95_ms']:.2f} ms per page")
+    write_results(args.output, "crawler_parse",
+                  {"source": args.pages or "synthetic", "per_page": args.per_page, "repeat": args.repeat}, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+建图吞吐量基准（triples/sec）。
+
+离线阶段（不需要 Neo4j）：read（iter_triples 解析 JSON / JSONL）、group（KG_build.grouped_batches
+按 label / 关系分组为 UNWIND 批）、symptom_index、memory_graph（内存引擎建 CSR）、snapshot（编译二进制快照）。
+加 --neo4j 时再对本地 Neo4j 执行 create_graph_bulk（会清空该库，只应指向测试用的本地实例），
+按 --batch-sizes 分别计时：
+
+    python bench/bench_ingest.py
+    python bench/bench_ingest.py --data build/data/TCM.jsonl --neo4j --batch-sizes 500 1000 5000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from common import BUILD_DIR, DATA_PATH, UI_DIR, add_path, summarize, write_results
+
+add_path(BUILD_DIR, UI_DIR)
+
+import KG_build
+from graph_snapshot import compile_snapshot
+from kg_engine import MemoryGraph
+from symptom_index import SymptomIndex
+
+
+def offline_stages(data_path, repeat):
+    triples = list(KG_build.iter_triples(data_path))
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_path = os.path.join(tmp, "TCM.snap")
+        stages = {
+            "read": lambda: list(KG_build.iter_triples(data_path)),
+            "group": lambda: list(KG_build.grouped_batches(triples)),
+            "symptom_index": lambda: SymptomIndex.from_triples(triples),
+            "memory_graph": lambda: MemoryGraph(triples),
+            "snapshot": lambda: compile_snapshot(triples, snapshot_path),
+        }
+        results = {}
+        for name, stage in stages.items():
+            samples = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                stage()
+                samples.append(time.perf_counter() - start)
+            summary = summarize(samples)
+            summary["triples_per_sec"] = len(triples) / (summary["p50_ms"] / 1e3)
+            results[name] = summary
+    return len(triples), results
+
+
+def neo4j_bulk(data_path, batch_sizes):
+    """KG_build 使用相对路径（./data/...），在 build 目录下执行"""
+    data_path = os.path.abspath(data_path)
+    cwd = os.getcwd()
+    os.chdir(BUILD_DIR)
+    results = {}
+    try:
+        for batch_size in batch_sizes:
+            start = time.perf_counter()
+            KG_build.create_graph_bulk(batch_size, data_path)
+            results[str(batch_size)] = {"seconds": time.perf_counter() - start}
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=DATA_PATH, help="TCM.json 或 TCM.jsonl")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--neo4j", action="store_true", help="同时对本地 Neo4j 执行 bulk 导入（会清空图谱）")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[KG_build.BATCH_SIZE])
+    parser.add_argument("--output", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    count, results = offline_stages(args.data, args.repeat)
+    print(f"{count} triples from {args.data}")
+    print(f"{'stage':<14} {'p50 ms':>9} {'triples/s':>12}")
+    for name, summary in results.items():
+        print(f"{name:<14} {summary['p50_ms']:>9.1f} {summary['triples_per_sec']:>12.0f}")
+
+    if args.neo4j:
+        bulk = neo4j_bulk(args.data, args.batch_sizes)
+        for batch_size, summary in bulk.items():
+            summary["triples_per_sec"] = count / summary["seconds"]
+            print(f"neo4j bulk batch={batch_size:<6} {summary['seconds']:>8.2f}s {summary['triples_per_sec']:>10.0f} triples/s")
+        results["neo4j_bulk"] = bulk
+
+    write_results(args.output, "ingest", {"data": os.path.basename(args.data), "triples": count,
+                                          "repeat": args.repeat, "neo4j": args.neo4j}, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+功能主治 n-gram 索引查询延迟随词表规模增长的基准测试（对比 CONTAINS 式线性扫描）。
+
+以 TCM.json 中的功能主治名称为种子，随机拼接真实名称的片段扩充词表，
+在每个规模上对同一组症状查询分别计时：
+
+    python bench/bench_symptom_index.py
+    python bench/bench_symptom_index.py --sizes 2500 10000 40000 160000 --repeat 20
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.append(os.path.join(ROOT, "build"))
+
+from symptom_index import SymptomIndex
+
+DATA_PATH = os.path.join(ROOT, "build", "data", "TCM.json")
+QUERIES = ["痛", "头痛", "无汗", "发热", "恶寒发热", "咳嗽", "脉浮", "小便不利", "舌苔白腻", "腹泻"]
+
+
+def load_seed_names(path=DATA_PATH):
+    with open(path, "r", encoding="utf-8") as fr:
+        return SymptomIndex.from_triples(json.load(fr)).names
+
+
+def grow_vocabulary(seed, size, rng):
+    names = list(seed)
+    seen = set(names)
+    while len(names) < size:
+        a, b = rng.sample(seed, 2)
+        name = a[:rng.randint(1, len(a))] + b[rng.randint(0, len(b) - 1):]
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names[:size]
+
+
+def time_per_query(fn, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for q in queries:
+            fn(q)
+    return (time.perf_counter() - start) / (repeat * len(queries)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2500, 10000, 40000, 160000])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    seed_names = load_seed_names()
+    results = []
+    print(f"{'names':>8} {'build ms':>9} {'scan us':>9} {'index us':>9} {'speedup':>8}")
+    for size in args.sizes:
+        names = grow_vocabulary(seed_names, size, rng)
+        start = time.perf_counter()
+        index = SymptomIndex(names)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        for q in QUERIES:
+            assert index.lookup(q) == [n for n in names if q in n], q
+
+        scan_us = time_per_query(lambda q: [n for n in names if q in n], QUERIES, args.repeat)
+        index_us = time_per_query(index.lookup, QUERIES, args.repeat)
+        results.append({"names": size, "build_ms": build_ms, "scan_us": scan_us, "index_us": index_us})
+        print(f"{size:>8} {build_ms:>9.1f} {scan_us:>9.1f} {index_us:>9.1f} {scan_us / index_us:>7.1f}x")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fw:
+            json.dump({"queries": QUERIES, "results": results}, fw, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+基准测试共用的路径、统计与结果输出。
+
+各脚本的 --output 写出同一格式的 JSON：
+    {"benchmark": 名称, "meta": {时间、Python、平台、git 提交}, "config": 参数, "results": 结果}
+便于与历史结果比较做回归跟踪。
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+BUILD_DIR = os.path.join(ROOT, "build")
+UI_DIR = os.path.join(ROOT, "UI")
+SCRIPT_DIR = os.path.join(ROOT, "Script")
+DATA_PATH = os.path.join(BUILD_DIR, "data", "TCM.json")
+
+SYMPTOMS = ["头痛", "咳嗽", "发热", "恶寒发热", "腹泻", "小便不利", "失眠", "痛"]
+
+
+def add_path(*paths):
+    for path in paths:
+        if path not in sys.path:
+            sys.path.append(path)
+
+
+def load_triples(path=DATA_PATH):
+    with open(path, "r", encoding="utf-8") as fr:
+        return json.load(fr)
+
+
+def formula_pairs(triples, count=8):
+    """取数据中有组成的方名，两两组成“X和Y可以一起服用吗？”的共用查询"""
+    names = []
+    for ele in triples:
+        if ele["relation"] == "配方" and ele["node_1"].startswith("方名\t"):
+            name = ele["node_1"].split("\t")[1]
+            if name not in names:
+                names.append(name)
+        if len(names) >= count * 2:
+            break
+    return [(names[i], names[i + 1]) for i in range(0, len(names) - 1, 2)]
+
+
+def inference_question(pair):
+    return f"{pair[0]}和{pair[1]}可以一起服用吗？"
+
+
+def percentile(sorted_values, q):
+    """最近秩百分位，sorted_values 需已排序"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(seconds):
+    """耗时样本（秒）-> 毫秒统计"""
+    values = sorted(s * 1e3 for s in seconds)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "min_ms": values[0],
+        "max_ms": values[-1],
+    }
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_results(path, benchmark, config, results):
+    payload = {
+        "benchmark": benchmark,
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "commit": git_commit(),
+        },
+        "config": config,
+        "results": results,
+    }
+    if path:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fw:
+            json.dump(payload, fw, ensure_ascii=False, indent=2)
+    return payload
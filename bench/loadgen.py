@@ -0,0 +1,176 @@
+"""
+闭环 HTTP 压测：--concurrency 个客户端各自串行发送请求（收到响应后立即发下一个），
+按场景分别统计每个端点的 p50 / p95 / p99 延迟、RPS 与非 2xx 计数（503 单独计为 busy）。
+
+场景：answer（POST /answer）、inference（POST /inference，两方共用问题）、suggest（POST /suggest）、
+mixed（三者轮流）。加 --serve 时在本地启动离线环境：echo 模型进程 + KG_BACKEND=memory 的 UI 应用
+（--app app 为 Flask，--app app_async 为 hypercorn），默认关闭回答缓存，测完自动退出：
+
+    python bench/loadgen.py --serve --duration 10 --concurrency 8 --output bench/results/loadgen.json
+    python bench/loadgen.py --serve --app app_async --scenarios suggest mixed
+    python bench/loadgen.py --url http://127.0.0.1:5000 --scenarios answer
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from common import (DATA_PATH, SCRIPT_DIR, SYMPTOMS, UI_DIR, formula_pairs, inference_question, load_triples,
+                    summarize, write_results)
+
+SCENARIOS = ("answer", "inference", "suggest", "mixed")
+
+
+def build_plans(pairs):
+    answer = [("answer", "/answer", {"symptom": s}) for s in SYMPTOMS]
+    inference = [("inference", "/inference", {"symptom": inference_question(p)}) for p in pairs]
+    suggest = [("suggest", "/suggest", {"symptom": s, "mode": "answer"}) for s in SYMPTOMS]
+    mixed = [item for group in zip(answer, inference * len(answer), suggest) for item in group]
+    return {"answer": answer, "inference": inference, "suggest": suggest, "mixed": mixed}
+
+
+def client(base_url, plan, offset, warmup_until, stop_at, samples, timeout):
+    session = requests.Session()
+    i = offset
+    while True:
+        now = time.perf_counter()
+        if now >= stop_at:
+            break
+        endpoint, path, data = plan[i % len(plan)]
+        i += 1
+        try:
+            status = session.post(base_url + path, data=data, timeout=timeout).status_code
+        except requests.RequestException:
+            status = None
+        if now >= warmup_until:
+            samples.append((endpoint, time.perf_counter() - now, status))
+
+
+def run_scenario(base_url, plan, concurrency, duration, warmup, timeout):
+    samples = []
+    start = time.perf_counter()
+    warmup_until = start + warmup
+    stop_at = warmup_until + duration
+    threads = [threading.Thread(target=client, args=(base_url, plan, n, warmup_until, stop_at, samples, timeout))
+               for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # RPS 按计时窗口计算，不受窗口结束后仍在等待的慢请求影响
+    elapsed = duration
+
+    def report(items):
+        latencies = [seconds for _, seconds, _ in items]
+        statuses = [status for _, _, status in items]
+        return {
+            "requests": len(items),
+            "rps": len(items) / elapsed,
+            "errors": sum(1 for s in statuses if s is None or (s >= 400 and s != 503)),
+            "busy": sum(1 for s in statuses if s == 503),
+            **summarize(latencies),
+        }
+
+    endpoints = sorted({endpoint for endpoint, _, _ in samples})
+    return {
+        "all": report(samples),
+        "endpoints": {e: report([s for s in samples if s[0] == e]) for e in endpoints},
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_port(port, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"端口 {port} 在 {timeout:.0f} 秒内未就绪")
+
+
+@contextmanager
+def local_stack(app, answer_cache):
+    """echo 模型进程 + 内存图后端的 UI 应用，返回 base_url"""
+    worker_port, app_port = free_port(), free_port()
+    env = dict(os.environ, KG_BACKEND="memory", KG_DATA_PATH=os.environ.get("KG_DATA_PATH", DATA_PATH),
+               LLM_WORKER_PORT=str(worker_port), ANSWER_CACHE_PATH=answer_cache)
+    if app == "app_async":
+        command = [sys.executable, "-m", "hypercorn", "app_async:app", "--bind", f"127.0.0.1:{app_port}"]
+    else:
+        command = [sys.executable, "-m", "flask", "--app", app, "run", "--port", str(app_port), "--with-threads"]
+    processes = []
+    try:
+        processes.append(subprocess.Popen([sys.executable, "llm_worker.py", "--backend", "echo"], cwd=SCRIPT_DIR,
+                                          env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        wait_port(worker_port)
+        processes.append(subprocess.Popen(command, cwd=UI_DIR, env=env,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        wait_port(app_port)
+        yield f"http://127.0.0.1:{app_port}"
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="被测服务地址（未指定 --serve 时）")
+    parser.add_argument("--serve", action="store_true", help="在本地启动 echo 模型进程与内存后端的 UI 应用")
+    parser.add_argument("--app", default="app", choices=["app", "app_async"], help="--serve 时启动的应用")
+    parser.add_argument("--answer-cache", default="", help="--serve 时的 ANSWER_CACHE_PATH，默认关闭回答缓存")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="每个场景的计时时长（秒）")
+    parser.add_argument("--warmup", type=float, default=2.0, help="每个场景开始时不计入统计的时长（秒）")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="将结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    plans = build_plans(formula_pairs(load_triples(DATA_PATH)))
+
+    def run(base_url):
+        results = {}
+        print(f"{'scenario':<10} {'endpoint':<10} {'reqs':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'err':>4} {'busy':>5}")
+        for scenario in args.scenarios:
+            result = run_scenario(base_url, plans[scenario], args.concurrency, args.duration, args.warmup,
+                                  args.timeout)
+            results[scenario] = result
+            for endpoint, r in [("all", result["all"])] + sorted(result["endpoints"].items()):
+                if not r["requests"]:
+                    continue
+                print(f"{scenario:<10} {endpoint:<10} {r['requests']:>6} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} "
+                      f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>4} {r['busy']:>5}")
+        return results
+
+    if args.serve:
+        with local_stack(args.app, args.answer_cache) as base_url:
+            results = run(base_url)
+    else:
+        results = run(args.url.rstrip("/"))
+
+    write_results(args.output, "loadgen", {
+        "url": "local" if args.serve else args.url, "app": args.app if args.serve else None,
+        "concurrency": args.concurrency, "duration": args.duration, "warmup": args.warmup,
+    }, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+依次运行全部基准（离线：内存图后端 + echo 模型），各自的 JSON 结果写入 --output-dir：
+
+    python bench/run_suite.py
+    python bench/run_suite.py --output-dir bench/results/$(git rev-parse --short HEAD) --quick
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SUITE = {
+    "build_graph": ["bench_build_graph.py"],
+    "ingest": ["bench_ingest.py"],
+    "crawler_parse": ["bench_crawler_parse.py"],
+    "symptom_index": ["bench_symptom_index.py"],
+    "loadgen": ["loadgen.py", "--serve"],
+}
+QUICK_ARGS = {
+    "build_graph": ["--repeat", "5"],
+    "ingest": ["--repeat", "2"],
+    "crawler_parse": ["--repeat", "1"],
+    "symptom_index": ["--sizes", "2500", "10000", "--repeat", "3"],
+    "loadgen": ["--duration", "3", "--warmup", "1"],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output-dir", default=os.path.join(BENCH_DIR, "results"))
+    parser.add_argument("--only", nargs="+", choices=list(SUITE), default=list(SUITE))
+    parser.add_argument("--quick", action="store_true", help="缩短重复次数与压测时长，用于冒烟检查")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    failed = []
+    for name in args.only:
+        output = os.path.join(args.output_dir, f"{name}.json")
+        command = [sys.executable, *SUITE[name], "--output", output] + (QUICK_ARGS[name] if args.quick else [])
+        print(f"=== {name}")
+        if subprocess.run(command, cwd=BENCH_DIR).returncode != 0:
+            failed.append(name)
+    if failed:
+        print(f"failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
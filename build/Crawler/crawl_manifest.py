@@ -0,0 +1,188 @@
+# -*- coding = utf-8 -*-
+"""
+    file name: crawl_manifest.py
+    function:
+        爬虫的追加写清单（DATA_FOLDER/manifest.jsonl），代替启动与结束时逐个 json.load 全部页面文件：
+            {"type": "page", "page_id": 12, "file": "12.json", "triples": 35, "names": {"麻黄汤": 1}, "sha256": "..."}
+            {"type": "aggregate", "output": "...", "entries": 280, "digest": "...", "triples": 5954, "bytes": 1234567}
+        - page 记录在页面文件写入（原子替换）之后追加，断点续爬只读清单即可恢复
+          已处理页面与方剂名计数，不再解析页面文件；目录中不在清单内的旧页面文件会被补登记一次。
+        - aggregate 记录上次聚合输出的位置：下次聚合只把之后新增的页面追加到输出文件末尾；
+          输出文件被改动、页面被重新爬取或删除时才整体重新流式写出。
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import Counter
+
+MANIFEST_NAME = "manifest.jsonl"
+ARRAY_END = b"\n]"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def formula_names(triples):
+    """页面中各方剂名（去掉编号后缀）的出现次数，与原先启动时的统计方式一致"""
+    names = Counter()
+    for triple in triples:
+        if "方名\t" in triple["node_2"] and triple["relation"] == "include":
+            full_formula_name = triple["node_2"].split('\t')[1]
+            names[re.sub(r'\d+$', '', full_formula_name)] += 1
+    return names
+
+
+def triple_json(triple):
+    """与 json.dump(list, indent=2) 中单个元素的写法一致"""
+    return "  " + json.dumps(triple, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+
+
+class CrawlManifest:
+
+    def __init__(self, data_folder):
+        self.data_folder = data_folder
+        self.path = os.path.join(data_folder, MANIFEST_NAME)
+        self.lock = threading.Lock()
+        self.pages = []          # page 记录，按追加顺序
+        self.aggregate = None    # 最后一条 aggregate 记录
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 写到一半中断的最后一行
+                if record.get("type") == "page":
+                    self.pages.append(record)
+                elif record.get("type") == "aggregate":
+                    self.aggregate = record
+
+    def append(self, record):
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if record["type"] == "page":
+                self.pages.append(record)
+            else:
+                self.aggregate = record
+
+    def latest_pages(self):
+        """page_id -> 最新的 page 记录（只保留页面文件仍存在的）"""
+        files = set(os.listdir(self.data_folder))
+        latest = {}
+        for record in self.pages:
+            latest[record["page_id"]] = record
+        return {page_id: record for page_id, record in latest.items() if record["file"] in files}
+
+    def register_untracked(self):
+        """补登记目录中存在、清单中没有的页面文件（旧版本爬取的数据或崩溃前刚写完的文件）"""
+        tracked = {record["file"] for record in self.pages}
+        added = 0
+        for filename in sorted(os.listdir(self.data_folder)):
+            if not filename.endswith(".json") or filename in tracked:
+                continue
+            try:
+                page_id = int(filename.replace(".json", ""))
+                with open(os.path.join(self.data_folder, filename), 'r', encoding='utf-8') as f:
+                    triples = json.load(f)
+            except (ValueError, json.JSONDecodeError) as e:
+                print(f"警告: 无法加载或解析文件 {filename}: {e}")
+                continue
+            self.record_page(page_id, filename, triples)
+            added += 1
+        return added
+
+    def record_page(self, page_id, filename, triples):
+        self.append({
+            "type": "page",
+            "page_id": page_id,
+            "file": filename,
+            "triples": len(triples),
+            "names": dict(formula_names(triples)),
+            "sha256": file_sha256(os.path.join(self.data_folder, filename)),
+        })
+
+    def save_page(self, page_id, triples):
+        """原子写入页面文件并追加 page 记录"""
+        filename = f"{page_id}.json"
+        path = os.path.join(self.data_folder, filename)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(triples, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        self.record_page(page_id, filename, triples)
+        return path
+
+    def resume_state(self):
+        """返回 (已处理页面 ID 集合, 方剂名计数, 三元组总数)"""
+        pages = self.latest_pages()
+        names = Counter()
+        for record in pages.values():
+            names.update(record["names"])
+        return set(pages), names, sum(record["triples"] for record in pages.values())
+
+    @staticmethod
+    def entries_digest(entries):
+        digest = hashlib.sha256()
+        for record in entries:
+            digest.update(f"{record['file']}:{record['sha256']}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def write_aggregate(self, output_file):
+        """
+        将全部页面的三元组流式写入 output_file（JSON 数组，格式同 json.dump(indent=2)）。
+        上次聚合之后只新增了页面时，仅把新页面追加到输出末尾。
+        :return: (三元组总数, 本次写入的页面数)
+        """
+        pages = self.latest_pages()
+        entries = [record for record in self.pages if pages.get(record["page_id"]) is record]
+        output_path = os.path.abspath(output_file)
+        start, total = 0, 0
+        last = self.aggregate
+        if (last and last["triples"] and last["output"] == output_path
+                and os.path.exists(output_file) and os.path.getsize(output_file) == last["bytes"]
+                and last["entries"] <= len(entries)
+                and self.entries_digest(entries[:last["entries"]]) == last["digest"]):
+            start, total = last["entries"], last["triples"]
+
+        with open(output_file, "r+b" if start else "wb") as f:
+            if start:
+                # 去掉结尾的 "\n]"，在最后一个元素后继续追加
+                f.seek(-len(ARRAY_END), os.SEEK_END)
+                f.truncate()
+                separator = b",\n"
+            else:
+                f.write(b"[")
+                separator = b"\n"
+            for record in entries[start:]:
+                with open(os.path.join(self.data_folder, record["file"]), 'r', encoding='utf-8') as page:
+                    for triple in json.load(page):
+                        f.write(separator + triple_json(triple).encode("utf-8"))
+                        separator = b",\n"
+                        total += 1
+            f.write(ARRAY_END if total else b"]")
+            size = f.tell()
+
+        self.append({
+            "type": "aggregate",
+            "output": output_path,
+            "entries": len(entries),
+            "digest": self.entries_digest(entries),
+            "triples": total,
+            "bytes": size,
+        })
+        return total, len(entries) - start
@@ -0,0 +1,80 @@
+# -*- coding = utf-8 -*-
+"""
+    file name: fake_llm_server.py
+    function:
+        本地 OpenAI 兼容的 /v1/chat/completions 替身服务，用规则代替大模型完成 llm_extractor 的批量抽取，
+        便于离线联调爬虫与统计请求次数（不消耗 API 额度）。
+
+        python fake_llm_server.py --port 8001
+        DEEPSEEK_BASE_URL=http://127.0.0.1:8001/v1 python tcm_crawler.py --base-url http://127.0.0.1:8000/
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 剂量以数字 / 中文数字 / “各” / “适量” 开头
+DOSE_PATTERN = re.compile(r'^(.+?)((?:各)?(?:[\d.]+|[一二三四五六七八九十百半两]+|适量).*)$')
+
+
+def split_items(text):
+    return [item.strip() for item in re.split(r'[，,、；;。\s]+', text) if item.strip()]
+
+
+def extract_composition(text):
+    herbs = []
+    for item in split_items(text):
+        match = DOSE_PATTERN.match(item)
+        name, dose = (match.group(1), match.group(2)) if match else (item, "适量")
+        herbs.append({"herb_name": name, "dosage": dose})
+    return {"herbs_data": herbs}
+
+
+def extract_functions(text):
+    return {"functions_list": split_items(text)}
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests_served = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        messages = {m["role"]: m["content"] for m in body["messages"]}
+        extract = extract_composition if "herbs_data" in messages["system"] else extract_functions
+        items = json.loads(messages["user"])
+        content = json.dumps({"results": [{"id": item["id"], **extract(item["text"])} for item in items]},
+                             ensure_ascii=False)
+        with Handler.lock:
+            Handler.requests_served += 1
+        payload = json.dumps({
+            "id": f"chatcmpl-{Handler.requests_served}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+    print(f"fake LLM listening on http://{args.host}:{args.port}/v1")
+    ThreadingHTTPServer((args.host, args.port), Handler).serve_forever()
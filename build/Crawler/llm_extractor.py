@@ -0,0 +1,231 @@
+# -*- coding = utf-8 -*-
+"""
+    file name: llm_extractor.py
+    function:
+        爬虫的 LLM 抽取阶段：把多个方剂块的【组成】/【功效】文本打包进同一次 chat completion，
+        限制同时进行的请求数，并将结果持久化缓存（SQLite），key 为 (抽取类型, 提示词版本, 模型, 原始文本) 的哈希，
+        重新爬取时已抽取过的文本不再调用 API。
+        修改下方提示词时请同步提高 PROMPT_VERSION，使旧缓存失效。
+
+        extractor = BatchExtractor(client, model)
+        future = extractor.submit("composition", "人参三钱 黄芪二钱")
+        future.result()  # [("人参", "三钱"), ("黄芪", "二钱")]
+"""
+
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+PROMPT_VERSION = "batch-v1"
+EXTRACTION_CACHE_PATH = os.environ.get("EXTRACTION_CACHE_PATH", "extraction_cache.sqlite3")
+LLM_BATCH_SIZE = 8 # 每次请求最多打包的文本条数
+LLM_BATCH_WAIT = 0.5 # 凑批的最长等待时间（秒）
+LLM_MAX_IN_FLIGHT = 4 # 同时进行的 API 请求数上限
+
+BATCH_INPUT_NOTE = (
+    "用户会提供一个JSON数组，每个元素包含 'id' 和 'text' 两个键，请对每个元素的 text 分别处理。"
+    "请以一个JSON对象的形式返回结果，该对象必须包含一个名为 'results' 的键，其值是一个JSON数组，"
+    "数组中每个元素对应一条输入，必须带有与输入相同的 'id'。"
+    "请严格遵守JSON格式，不要包含任何额外说明或解释。"
+)
+
+COMPOSITION_PROMPT = (
+    "你是一位专业的中药方剂分析助手。你的任务是从中药组成文本中，"
+    "准确地提取出每味中药的名称及其对应的剂量。请确保提取的剂量是原始文本中描述的完整剂量信息（包括单位和括号内的数值，如'四两（120g）'）。"
+    "如果文本中某个剂量适用于多味中药（例如'A、B、C 各一钱'），请将该剂量分别赋给每味中药。"
+    "如果某味中药没有明确的剂量，请使用'适量'作为其剂量。"
+    + BATCH_INPUT_NOTE +
+    "每个结果元素还应包含一个名为 'herbs_data' 的数组，数组中的每个对象都应包含'herb_name'和'dosage'两个键。"
+    "例如：{\"results\": [{\"id\": 0, \"herbs_data\": [{\"herb_name\": \"人参\", \"dosage\": \"3g\"}]}]}"
+)
+
+FUNCTIONS_PROMPT = (
+    "你是一位专业的中药方剂分析助手。你的任务是从功能主治文本中，"
+    "准确地提取出所有独立的功效和主治条目。请将每个条目视为一个独立的短语或句子。"
+    + BATCH_INPUT_NOTE +
+    "每个结果元素还应包含一个名为 'functions_list' 的数组，数组中的每个元素都应是一个表示独立功效或主治的字符串。"
+    "例如：{\"results\": [{\"id\": 0, \"functions_list\": [\"疏风清热\", \"活血散瘀\"]}]}"
+)
+
+
+def parse_composition(item):
+    herbs = item.get("herbs_data")
+    if not isinstance(herbs, list):
+        return None
+    return [(herb["herb_name"], herb["dosage"]) for herb in herbs
+            if isinstance(herb, dict) and "herb_name" in herb and "dosage" in herb]
+
+
+def parse_functions(item):
+    functions = item.get("functions_list")
+    if not isinstance(functions, list):
+        return None
+    return list(dict.fromkeys(f.strip() for f in functions if isinstance(f, str) and f.strip()))
+
+
+# 抽取类型 -> (系统提示词, 单条结果解析函数)；解析失败返回 None
+KINDS = {
+    "composition": (COMPOSITION_PROMPT, parse_composition),
+    "functions": (FUNCTIONS_PROMPT, parse_functions),
+}
+
+
+def extraction_key(kind, model, text):
+    payload = json.dumps([kind, PROMPT_VERSION, model, text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """抽取结果的持久化缓存，多个抽取线程共用"""
+
+    def __init__(self, path=EXTRACTION_CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS extractions (key TEXT PRIMARY KEY, kind TEXT NOT NULL, result TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT result FROM extractions WHERE key = ?", (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, key, kind, result):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO extractions (key, kind, result) VALUES (?, ?, ?)",
+                              (key, kind, json.dumps(result, ensure_ascii=False)))
+            self.conn.commit()
+
+
+class BatchExtractor:
+    """
+    submit() 先查缓存，未命中的文本进入队列；调度线程按抽取类型凑批
+    （满 batch_size 条或等待超过 batch_wait 秒即发出），由 max_in_flight 个线程并发请求 API。
+    同一文本同时被多次提交时只请求一次。
+    """
+
+    def __init__(self, client, model, cache=None, batch_size=LLM_BATCH_SIZE,
+                 batch_wait=LLM_BATCH_WAIT, max_in_flight=LLM_MAX_IN_FLIGHT):
+        self.client = client
+        self.model = model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.pool = ThreadPoolExecutor(max_workers=max_in_flight)
+        self.requests = queue.Queue()
+        self.waiting = {}  # cache key -> [Future, ...]
+        self.lock = threading.Lock()
+        self.api_calls = 0
+        self.cache_hits = 0
+        self.dispatcher = threading.Thread(target=self.dispatch_loop, daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, kind, text):
+        future = Future()
+        if self.client is None or not text:
+            future.set_result([])
+            return future
+        key = extraction_key(kind, self.model, text)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                with self.lock:
+                    self.cache_hits += 1
+                future.set_result([tuple(x) for x in cached] if kind == "composition" else cached)
+                return future
+        with self.lock:
+            if key in self.waiting:
+                self.waiting[key].append(future)
+                return future
+            self.waiting[key] = [future]
+        self.requests.put((kind, key, text))
+        return future
+
+    def extract(self, kind, text):
+        return self.submit(kind, text).result()
+
+    def dispatch_loop(self):
+        pending = {kind: [] for kind in KINDS}
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self.requests.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is not None:
+                kind, key, text = item
+                pending[kind].append((key, text))
+                if deadline is None:
+                    deadline = time.monotonic() + self.batch_wait
+            flush_all = deadline is not None and time.monotonic() >= deadline
+            for kind, items in pending.items():
+                while len(items) >= self.batch_size or (flush_all and items):
+                    batch, items[:] = items[:self.batch_size], items[self.batch_size:]
+                    self.pool.submit(self.run_batch, kind, batch)
+            if not any(pending.values()):
+                deadline = None
+            elif flush_all:
+                deadline = time.monotonic() + self.batch_wait
+
+    def request(self, kind, batch):
+        """一次 API 请求，返回 {输入下标: 解析结果}"""
+        system_prompt, parse_item = KINDS[kind]
+        user_prompt = json.dumps([{"id": i, "text": text} for i, (_, text) in enumerate(batch)], ensure_ascii=False)
+        with self.lock:
+            self.api_calls += 1
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            stream=False,
+            temperature=0.0,
+            response_format={"type": "json_object"}
+        )
+        results = json.loads(response.choices[0].message.content).get("results")
+        parsed = {}
+        for item in results if isinstance(results, list) else []:
+            if isinstance(item, dict) and isinstance(item.get("id"), int) and 0 <= item["id"] < len(batch):
+                value = parse_item(item)
+                if value is not None:
+                    parsed[item["id"]] = value
+        return parsed
+
+    def run_batch(self, kind, batch):
+        try:
+            parsed = self.request(kind, batch)
+        except Exception as e:
+            print(f"调用LLM批量抽取（{kind}，{len(batch)} 条）时发生错误: {e}")
+            parsed = {}
+        # 批量结果中缺失的条目单独重试一次
+        if len(batch) > 1:
+            for i, item in enumerate(batch):
+                if i not in parsed:
+                    try:
+                        value = self.request(kind, [item]).get(0)
+                    except Exception as e:
+                        print(f"调用LLM抽取（{kind}）时发生错误: {e}\n原始文本: {item[1]}")
+                        value = None
+                    if value is not None:
+                        parsed[i] = value
+        for i, (key, _) in enumerate(batch):
+            value = parsed.get(i)
+            if value is not None and self.cache is not None:
+                self.cache.put(key, kind, value)
+            with self.lock:
+                futures = self.waiting.pop(key, [])
+            for future in futures:
+                future.set_result(value if value is not None else [])
+
+    def stats(self):
+        return {"api_calls": self.api_calls, "cache_hits": self.cache_hits}
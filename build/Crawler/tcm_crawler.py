@@ -1,25 +1,42 @@
 import requests
 from bs4 import BeautifulSoup
+import argparse
 import json
+import random
 import re
-from collections import defaultdict
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 import time
 import os # 导入os模块用于文件系统操作
 from openai import OpenAI # 导入OpenAI库，DeepSeek API兼容OpenAI接口
+from crawl_manifest import CrawlManifest
+from llm_extractor import BatchExtractor, ExtractionCache, EXTRACTION_CACHE_PATH, LLM_BATCH_SIZE, LLM_MAX_IN_FLIGHT
 
 # --- 配置参数 ---
-BASE_URL = "https://www.901020.com/fangji/"
+BASE_URL = os.environ.get("TCM_CRAWLER_BASE_URL", "https://www.901020.com/fangji/") # 测试时可指向本地夹具服务器
 START_ID = 1
 END_ID = 2561 # 请注意，爬取2561个页面可能需要较长时间，并消耗API额度
 OUTPUT_FILE = "tcm_knowledge_graph.json" # 最终聚合的知识图谱文件
 DATA_FOLDER = "crawled_data" # 存放每个页面单独JSON的文件夹
-REQUEST_DELAY = 0.1 # 每个请求之间的延迟（秒），建议设置，避免对服务器造成过大压力
+REQUEST_TIMEOUT = 15 # 单个请求的超时时间（秒）
+
+# 并发抓取配置
+CONCURRENCY = 8 # 抓取 + 解析线程数
+EXTRACT_WORKERS = 8 # 同时进行LLM抽取的页面数（请求由 llm_extractor 凑批，并发上限见 LLM_MAX_IN_FLIGHT）
+RATE_LIMIT = 10.0 # 全局令牌桶：每秒最多发出的请求数（代替原先固定的 REQUEST_DELAY），避免对服务器造成过大压力
+RATE_BURST = 2 # 令牌桶容量，允许的瞬时突发请求数
+PER_HOST_LIMIT = 4 # 同一主机同时进行的请求数上限
+MAX_RETRIES = 3 # 5xx / 429 / 超时 / 连接错误的重试次数
+BACKOFF_BASE = 1.0 # 指数退避的基准等待时间（秒）
+RETRY_STATUS = {429, 500, 502, 503, 504}
 
 
 # DeepSeek API 配置
-DEEPSEEK_API_KEY = "API" # <<<<<<< 请在这里填入您的DeepSeek API Key >>>>>>>
-DEEPSEEK_BASE_URL = "https://api.deepseek.com"
-DEEPSEEK_MODEL = "deepseek-chat" # 或 "deepseek-v2" 等您想使用的模型
+DEEPSEEK_API_KEY = os.environ.get("DEEPSEEK_API_KEY", "API") # <<<<<<< 请在这里填入您的DeepSeek API Key >>>>>>>
+DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL", "https://api.deepseek.com") # 测试时可指向本地 OpenAI 兼容服务
+DEEPSEEK_MODEL = os.environ.get("DEEPSEEK_MODEL", "deepseek-chat") # 或 "deepseek-v2" 等您想使用的模型
 
 # 初始化DeepSeek客户端
 deepseek_client = None
@@ -49,8 +66,6 @@ SECTION_MAP = {
     "别名": "别名",
 }
 
-# 全局列表，用于存储所有提取到的三元组（最终聚合用）
-all_triples = []
 # 使用defaultdict来统计方剂名出现次数，用于处理重复方剂名（如：仙遗粮汤1, 仙遗粮汤2）
 formula_name_counts = defaultdict(int)
 
@@ -262,281 +277,424 @@ def extract_formula_name_and_related_info(name_content: str):
     return cleaned_name, final_extracted_source_str, final_extracted_aliases_list
 
 
-# --- 主爬虫函数 ---
-def scrape_tcm_formula_data():
-    # 1. 创建数据文件夹
-    os.makedirs(DATA_FOLDER, exist_ok=True)
+# --- 并发抓取：令牌桶限速 + 每个主机的并发上限 + 5xx/超时重试 ---
+class TokenBucket:
+    """全局令牌桶：平均每秒 rate 个请求，允许 burst 个请求的突发"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class Fetcher:
+    """
+    线程安全的页面抓取器，供线程池中的多个线程共用：
+    每个线程一个 requests.Session（复用连接），所有线程共用令牌桶，
+    同一主机同时进行的请求数不超过 per_host；5xx、429、超时与连接错误按指数退避重试。
+    """
 
-    # 2. 加载已爬取的数据和已处理的ID，用于断点续爬和最终聚合
-    processed_ids = set()
-    global formula_name_counts
-    
-    print(f"正在加载 '{DATA_FOLDER}' 中已爬取的数据...")
-    for filename in os.listdir(DATA_FOLDER):
-        if filename.endswith(".json"):
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, per_host=PER_HOST_LIMIT,
+                 retries=MAX_RETRIES, backoff=BACKOFF_BASE, timeout=REQUEST_TIMEOUT):
+        self.bucket = TokenBucket(rate, burst)
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.host_slots = {}
+        self.host_lock = threading.Lock()
+        self.local = threading.local()
+
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self.host_lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self.host_slots[host]
+
+    def fetch(self, url: str):
+        """
+        返回页面 HTML；404 或不可重试的错误返回 None
+        """
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
             try:
-                page_id = int(filename.replace(".json", ""))
-                with open(os.path.join(DATA_FOLDER, filename), 'r', encoding='utf-8') as f:
-                    loaded_triples = json.load(f)
-                    all_triples.extend(loaded_triples)
-
-                    for triple in loaded_triples:
-                        if "方名\t" in triple["node_2"] and triple["relation"] == "include":
-                            full_formula_name = triple["node_2"].split('\t')[1]
-                            raw_name = re.sub(r'\d+$', '', full_formula_name)
-                            formula_name_counts[raw_name] += 1
-                processed_ids.add(page_id)
-            except (ValueError, json.JSONDecodeError) as e:
-                print(f"警告: 无法加载或解析文件 {filename}: {e}")
-    
-    print(f"已加载 {len(all_triples)} 条现有三元组。已处理页面ID数量: {len(processed_ids)}")
-    print(f"当前方剂名计数（用于编号）: {dict(formula_name_counts)}")
+                with self.host_slot(url):
+                    response = self.session().get(url, timeout=self.timeout)
+                if response.status_code == 404:
+                    return None
+                if response.status_code in RETRY_STATUS and attempt < self.retries:
+                    raise requests.exceptions.HTTPError(f"{response.status_code}", response=response)
+                response.raise_for_status()
+                print(f"正在爬取: {url}...")
+                return response.text
+            except (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                    requests.exceptions.HTTPError) as e:
+                status = e.response.status_code if getattr(e, "response", None) is not None else None
+                retryable = status is None or status in RETRY_STATUS
+                if not retryable or attempt >= self.retries:
+                    print(f"获取 {url} 时发生错误: {e}")
+                    return None
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                print(f"获取 {url} 失败（{e}），{delay:.1f} 秒后第 {attempt + 1} 次重试")
+                time.sleep(delay)
+            except requests.exceptions.RequestException as e:
+                print(f"获取 {url} 时发生错误: {e}")
+                return None
+        return None
+
+
+# --- 页面解析：只依赖页面本身，可在抓取线程中并行执行 ---
+def parse_formula_blocks(html: str):
+    """
+    将页面切分为方剂块并解析各栏目，不涉及方剂名编号（编号依赖全局计数，见 assign_formula_names）。
+    每个块返回：
+        raw_names: 块内各【方剂名】解析出的方剂名（按出现顺序，最后一个为该块的方剂名）
+        has_composition_section: 块内是否出现【组成】
+        data: 除方名外的栏目（来源、别名、处方、功能主治_raw_texts 等）
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    main_content_div = soup.find('div', class_='content')
+    if not main_content_div:
+        main_content_div = soup.find('div', class_='article-content')
+    if not main_content_div:
+        main_content_div = soup.body
+    if not main_content_div:
+        return []
 
+    formula_blocks = []
+    current_block_p_tags = []
 
-    for i in range(START_ID, END_ID + 1):
-        page_output_file = os.path.join(DATA_FOLDER, f"{i}.json")
+    all_p_tags_in_content = main_content_div.find_all('p', recursive=False)
 
-        if i in processed_ids:
-            print(f"跳过已爬取页面: {BASE_URL}{i}.html (数据已存在于 {page_output_file})")
-            continue
+    for p_tag in all_p_tags_in_content:
+        full_p_text_for_block_check = p_tag.get_text(strip=True)
+        if re.match(r'【方剂名】', full_p_text_for_block_check):
+            if current_block_p_tags:
+                formula_blocks.append(current_block_p_tags)
+            current_block_p_tags = [p_tag]
+        elif current_block_p_tags:
+            current_block_p_tags.append(p_tag)
 
-        url = f"{BASE_URL}{i}.html"
-        
-        time.sleep(REQUEST_DELAY)
-
-        try:
-            response = requests.get(url, timeout=15)
-            response.raise_for_status()
-            print(f"正在爬取: {url}...") 
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
-                pass 
-            else:
-                print(f"HTTP错误 {url}: {e}")
-            continue
-        except requests.exceptions.RequestException as e:
-            print(f"获取 {url} 时发生错误: {e}")
-            continue
+    if current_block_p_tags:
+        formula_blocks.append(current_block_p_tags)
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        main_content_div = soup.find('div', class_='content')
-        if not main_content_div:
-            main_content_div = soup.find('div', class_='article-content')
-        if not main_content_div:
-            main_content_div = soup.body
-
-        formula_blocks = []
-        current_block_p_tags = []
-        
-        all_p_tags_in_content = main_content_div.find_all('p', recursive=False)
-
-        for p_tag in all_p_tags_in_content:
-            full_p_text_for_block_check = p_tag.get_text(strip=True)
-            if re.match(r'【方剂名】', full_p_text_for_block_check):
-                if current_block_p_tags:
-                    formula_blocks.append(current_block_p_tags)
-                current_block_p_tags = [p_tag]
-            elif current_block_p_tags:
-                current_block_p_tags.append(p_tag)
-        
-        if current_block_p_tags:
-            formula_blocks.append(current_block_p_tags)
+    if not formula_blocks:
+        formula_blocks = [main_content_div.find_all('p')]
 
-        if not formula_blocks:
-            formula_blocks = [main_content_div.find_all('p')]
-            
-            if not formula_blocks[0]:
-                continue
+        if not formula_blocks[0]:
+            return []
 
-        # --- 第一遍遍历，统计每个方剂名下的组成数量 ---
-        formula_composition_counts_on_this_page = defaultdict(int)
-        temp_formula_name_raw_for_counting_this_page = defaultdict(int) 
-
-        for block_idx_temp, block_p_tags_temp in enumerate(formula_blocks):
-            temp_formula_name = ""
-            has_composition_section = False
-            for p_tag_temp in block_p_tags_temp:
-                full_p_text_temp = p_tag_temp.get_text(strip=True)
-                match_temp = re.match(r'【(.*?)】\s*(.*)', full_p_text_temp)
-                if match_temp:
-                    header_name_raw_temp = match_temp.group(1).strip()
-                    content_temp = match_temp.group(2).strip()
-                    if header_name_raw_temp == "方剂名":
-                        name_only_temp, _, _ = extract_formula_name_and_related_info(content_temp)
-                        
-                        if name_only_temp:
-                            raw_name_candidate = name_only_temp
-                            temp_formula_name_raw_for_counting_this_page[raw_name_candidate] += 1
-                            current_total_count = formula_name_counts[raw_name_candidate] + temp_formula_name_raw_for_counting_this_page[raw_name_candidate]
-                            if current_total_count > 1:
-                                temp_formula_name = f"{raw_name_candidate}{current_total_count}"
-                            else:
-                                temp_formula_name = raw_name_candidate
-                    elif header_name_raw_temp == "组成":
-                        has_composition_section = True
-            
-            if temp_formula_name and has_composition_section:
-                formula_composition_counts_on_this_page[temp_formula_name] += 1
-        # --- 结束第一遍遍历 ---
+    parsed_blocks = []
+    for block_p_tags in formula_blocks:
+        formula_data = {}
+        raw_names = []
+        has_composition_section = False
 
-        current_formula_composition_index_on_page = defaultdict(int)
-        current_page_triples = []
+        for p_tag in block_p_tags:
+            full_p_text = p_tag.get_text(strip=True)
+            match = re.match(r'【(.*?)】\s*(.*)', full_p_text)
 
-        # --- 第二遍遍历：提取数据并构建三元组 ---
-        for block_idx, block_p_tags in enumerate(formula_blocks):
-            formula_data = {}
-            current_formula_name_raw = ""
+            if match:
+                header_name_raw = match.group(1).strip()
+                content = match.group(2).strip()
 
-            for p_tag in block_p_tags:
-                full_p_text = p_tag.get_text(strip=True)
-                match = re.match(r'【(.*?)】\s*(.*)', full_p_text)
-                
-                if match:
-                    header_name_raw = match.group(1).strip()
-                    content = match.group(2).strip()
-                    
-                    key = SECTION_MAP.get(header_name_raw)
-
-                    if key:
-                        if key == "方名":
-                            formula_name_candidate, extracted_source_from_name, extracted_aliases_from_name = extract_formula_name_and_related_info(content)
-                            
-                            if formula_name_candidate:
-                                current_formula_name_raw = formula_name_candidate
-                                formula_name_counts[current_formula_name_raw] += 1
-                                if formula_name_counts[current_formula_name_raw] > 1:
-                                    formula_data[key] = f"{current_formula_name_raw}{formula_name_counts[current_formula_name_raw]}"
+                if header_name_raw == "组成":
+                    has_composition_section = True
+
+                key = SECTION_MAP.get(header_name_raw)
+
+                if key:
+                    if key == "方名":
+                        formula_name_candidate, extracted_source_from_name, extracted_aliases_from_name = extract_formula_name_and_related_info(content)
+
+                        if formula_name_candidate:
+                            raw_names.append(formula_name_candidate)
+
+                            # 将提取到的来源信息添加到formula_data中
+                            if extracted_source_from_name:
+                                if "来源" in formula_data:
+                                    existing_sources = [s.strip() for s in re.split(r'[；，]', formula_data["来源"]) if s.strip()]
+                                    new_sources = [s.strip() for s in re.split(r'[；，]', extracted_source_from_name) if s.strip()]
+                                    for ns in new_sources:
+                                        if ns and ns not in existing_sources:
+                                            formula_data["来源"] += f"；{ns}"
                                 else:
-                                    formula_data[key] = current_formula_name_raw
-                                
-                                # 将提取到的来源信息添加到formula_data中
-                                if extracted_source_from_name:
-                                    if "来源" in formula_data:
-                                        existing_sources = [s.strip() for s in re.split(r'[；，]', formula_data["来源"]) if s.strip()]
-                                        new_sources = [s.strip() for s in re.split(r'[；，]', extracted_source_from_name) if s.strip()]
-                                        for ns in new_sources:
-                                            if ns and ns not in existing_sources:
-                                                formula_data["来源"] += f"；{ns}"
-                                    else:
-                                        formula_data["来源"] = extracted_source_from_name
-                                
-                                # 将提取到的别名信息添加到formula_data中（临时存储，待统一处理）
-                                if extracted_aliases_from_name:
-                                    if "别名" not in formula_data:
-                                        formula_data["别名"] = []
-                                    formula_data["别名"].extend(extracted_aliases_from_name)
-                                    formula_data["别名"] = list(set(formula_data["别名"])) # 确保列表中的别名是唯一的
-                            else:
-                                continue
-                        elif key == "功能主治_raw": # 特殊处理功能主治的原始文本
-                            if "功能主治_raw_texts" not in formula_data:
-                                formula_data["功能主治_raw_texts"] = []
-                            formula_data["功能主治_raw_texts"].append(content)
+                                    formula_data["来源"] = extracted_source_from_name
+
+                            # 将提取到的别名信息添加到formula_data中（临时存储，待统一处理）
+                            if extracted_aliases_from_name:
+                                if "别名" not in formula_data:
+                                    formula_data["别名"] = []
+                                formula_data["别名"].extend(extracted_aliases_from_name)
+                                formula_data["别名"] = list(set(formula_data["别名"])) # 确保列表中的别名是唯一的
                         else:
-                            # 对于非方剂名（如【出处】），也进行一次清理，确保没有冗余标签
-                            if key == "来源":
-                                cleaned_content_source = re.sub(r'【.*?】|$$.\*?$$', '', content).strip()
-                                cleaned_content_source = re.sub(r'^(?:来源|出处)\s*', '', cleaned_content_source).strip()
-                                if cleaned_content_source:
-                                    if "来源" in formula_data:
-                                        existing_sources = [s.strip() for s in re.split(r'[；，]', formula_data["来源"]) if s.strip()]
-                                        new_sources = [s.strip() for s in re.split(r'[；，]', cleaned_content_source) if s.strip()]
-                                        for ns in new_sources:
-                                            if ns and ns not in existing_sources:
-                                                formula_data["来源"] += f"；{ns}"
-                                    else:
-                                        formula_data[key] = cleaned_content_source
-                            else:
-                                formula_data[key] = content
-            
-            if not formula_data.get("方名"):
-                continue
+                            continue
+                    elif key == "功能主治_raw": # 特殊处理功能主治的原始文本
+                        if "功能主治_raw_texts" not in formula_data:
+                            formula_data["功能主治_raw_texts"] = []
+                        formula_data["功能主治_raw_texts"].append(content)
+                    else:
+                        # 对于非方剂名（如【出处】），也进行一次清理，确保没有冗余标签
+                        if key == "来源":
+                            cleaned_content_source = re.sub(r'【.*?】|$$.\*?$$', '', content).strip()
+                            cleaned_content_source = re.sub(r'^(?:来源|出处)\s*', '', cleaned_content_source).strip()
+                            if cleaned_content_source:
+                                if "来源" in formula_data:
+                                    existing_sources = [s.strip() for s in re.split(r'[；，]', formula_data["来源"]) if s.strip()]
+                                    new_sources = [s.strip() for s in re.split(r'[；，]', cleaned_content_source) if s.strip()]
+                                    for ns in new_sources:
+                                        if ns and ns not in existing_sources:
+                                            formula_data["来源"] += f"；{ns}"
+                                else:
+                                    formula_data[key] = cleaned_content_source
+                        else:
+                            formula_data[key] = content
 
-            formula_name = formula_data["方名"]
-            
-            add_triple("方剂", "方剂", "include", "方名", formula_name, current_page_triples)
-
-            if "来源" in formula_data and formula_data["来源"]:
-                add_triple("方名", formula_name, "from", "来源", formula_data["来源"], current_page_triples)
-
-            # --- 统一处理别名 ---
-            if "别名" in formula_data and formula_data["别名"]:
-                if isinstance(formula_data["别名"], list): # 从方剂名中提取的别名
-                    all_aliases_to_process = formula_data["别名"]
-                else: # 从【别名】字段提取的别名
-                    aliases_text = formula_data["别名"]
-                    all_aliases_to_process = re.split(r'[、，]\s*(?![^（）]*[）])', aliases_text)
-                
-                unique_aliases = set()
-                for alias_entry in all_aliases_to_process:
-                    cleaned_alias = alias_entry.strip()
-                    cleaned_alias = re.sub(r'[。，；：！？]$', '', cleaned_alias)
-                    if cleaned_alias:
-                        unique_aliases.add(cleaned_alias)
-
-                for alias in sorted(list(unique_aliases)):
-                    add_triple("方名", formula_name, "another name", "别名", alias, current_page_triples)
-
-            # --- 统一处理功能主治（使用LLM） ---
-            if "功能主治_raw_texts" in formula_data and formula_data["功能主治_raw_texts"]:
-                combined_functions_text = " ".join(formula_data["功能主治_raw_texts"]).strip()
-                if combined_functions_text:
-                    extracted_functions = extract_functions_with_llm(combined_functions_text)
-                    for func_item in extracted_functions:
-                        add_triple("方名", formula_name, "functions", "功能主治", func_item, current_page_triples)
-
-            if "处方" in formula_data and formula_data["处方"]:
-                composition_text = formula_data["处方"]
-                
-                current_formula_composition_index_on_page[formula_name] += 1
-                
-                if formula_composition_counts_on_this_page[formula_name] == 1:
-                    prescription_node_name = formula_name
-                else:
-                    prescription_node_name = f"{formula_name}_组成_{current_formula_composition_index_on_page[formula_name]}"
+        parsed_blocks.append({
+            "raw_names": raw_names,
+            "has_composition_section": has_composition_section,
+            "data": formula_data,
+        })
+    return parsed_blocks
 
-                add_triple("方名", formula_name, "prescription type", "处方", prescription_node_name, current_page_triples)
-                
-                extracted_herbs_dosages = extract_composition_with_llm(composition_text)
-                
-                for herb_name, dosage_text in extracted_herbs_dosages:
-                    if herb_name:
-                        add_triple("处方", prescription_node_name, "composition", "中药名", herb_name, current_page_triples)
-                        if dosage_text:
-                            add_triple("中药名", herb_name, "dose", "剂量", dosage_text, current_page_triples)
-
-        if current_page_triples:
-            with open(page_output_file, 'w', encoding='utf-8') as f:
-                json.dump(current_page_triples, f, ensure_ascii=False, indent=2)
-            print(f"已保存页面 {i} 的数据到 {page_output_file}")
+
+def fetch_and_parse(fetcher: Fetcher, page_id: int, base_url: str = BASE_URL):
+    html = fetcher.fetch(f"{base_url}{page_id}.html")
+    if html is None:
+        return None
+    return parse_formula_blocks(html)
+
+
+# --- 方剂名编号：依赖全局 formula_name_counts，必须按页面 ID 顺序串行执行 ---
+def assign_formula_names(parsed_blocks: list) -> list:
+    """
+    按全局计数为重复的方剂名编号（如：仙遗粮汤1, 仙遗粮汤2），并确定处方节点名。
+    返回 [(formula_name, prescription_node_name, formula_data), ...]，无方剂名的块被跳过。
+    """
+    named_blocks = []
+    for block in parsed_blocks:
+        formula_name = ""
+        for raw_name in block["raw_names"]:
+            formula_name_counts[raw_name] += 1
+            if formula_name_counts[raw_name] > 1:
+                formula_name = f"{raw_name}{formula_name_counts[raw_name]}"
+            else:
+                formula_name = raw_name
+        named_blocks.append((formula_name, block))
+
+    # 同一页面中同名方剂有多个组成时，处方节点名加序号区分
+    formula_composition_counts_on_this_page = defaultdict(int)
+    for formula_name, block in named_blocks:
+        if formula_name and block["has_composition_section"]:
+            formula_composition_counts_on_this_page[formula_name] += 1
+
+    current_formula_composition_index_on_page = defaultdict(int)
+    result = []
+    for formula_name, block in named_blocks:
+        if not formula_name:
+            continue
+        formula_data = block["data"]
+        prescription_node_name = None
+        if "处方" in formula_data and formula_data["处方"]:
+            current_formula_composition_index_on_page[formula_name] += 1
+            if formula_composition_counts_on_this_page[formula_name] == 1:
+                prescription_node_name = formula_name
+            else:
+                prescription_node_name = f"{formula_name}_组成_{current_formula_composition_index_on_page[formula_name]}"
+        result.append((formula_name, prescription_node_name, formula_data))
+    return result
+
+
+# --- LLM抽取与三元组构建：各页面相互独立，可在线程池中并行执行 ---
+def build_page_triples(named_blocks: list, extractor: BatchExtractor = None) -> list:
+    """
+    extractor 为空时逐条同步调用 extract_*_with_llm；否则先提交本页全部待抽取文本，
+    由 extractor 与其他页面的文本一起凑批、并发请求并缓存
+    """
+    functions_results = []
+    composition_results = []
+    for formula_name, prescription_node_name, formula_data in named_blocks:
+        combined_functions_text = " ".join(formula_data.get("功能主治_raw_texts") or []).strip()
+        composition_text = formula_data["处方"] if prescription_node_name else ""
+        if extractor is None:
+            functions_results.append(extract_functions_with_llm(combined_functions_text) if combined_functions_text else [])
+            composition_results.append(extract_composition_with_llm(composition_text) if composition_text else [])
         else:
-            print(f"页面 {i} 未提取到有效数据，未生成单独文件。")
+            functions_results.append(extractor.submit("functions", combined_functions_text))
+            composition_results.append(extractor.submit("composition", composition_text))
 
+    def resolve(result):
+        return result if isinstance(result, list) else result.result()
 
-    # 最终将所有聚合的三元组保存到总文件
-    final_all_triples = []
-    final_formula_name_counts = defaultdict(int)
-    for filename in os.listdir(DATA_FOLDER):
-        if filename.endswith(".json"):
-            try:
-                with open(os.path.join(DATA_FOLDER, filename), 'r', encoding='utf-8') as f:
-                    loaded_triples = json.load(f)
-                    final_all_triples.extend(loaded_triples)
-                    for triple in loaded_triples:
-                        if "方名\t" in triple["node_2"] and triple["relation"] == "include":
-                            full_formula_name = triple["node_2"].split('\t')[1]
-                            raw_name = re.sub(r'\d+$', '', full_formula_name)
-                            final_formula_name_counts[raw_name] += 1
-            except (ValueError, json.JSONDecodeError) as e:
-                print(f"警告: 无法加载或解析文件 {filename} 用于最终聚合: {e}")
-
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(final_all_triples, f, ensure_ascii=False, indent=2)
-    print(f"\n数据爬取完成。已将 {len(final_all_triples)} 个三元组保存到 {OUTPUT_FILE}")
+    current_page_triples = []
+    for block_idx, (formula_name, prescription_node_name, formula_data) in enumerate(named_blocks):
+        add_triple("方剂", "方剂", "include", "方名", formula_name, current_page_triples)
+
+        if "来源" in formula_data and formula_data["来源"]:
+            add_triple("方名", formula_name, "from", "来源", formula_data["来源"], current_page_triples)
+
+        # --- 统一处理别名 ---
+        if "别名" in formula_data and formula_data["别名"]:
+            if isinstance(formula_data["别名"], list): # 从方剂名中提取的别名
+                all_aliases_to_process = formula_data["别名"]
+            else: # 从【别名】字段提取的别名
+                aliases_text = formula_data["别名"]
+                all_aliases_to_process = re.split(r'[、，]\s*(?![^（）]*[）])', aliases_text)
+
+            unique_aliases = set()
+            for alias_entry in all_aliases_to_process:
+                cleaned_alias = alias_entry.strip()
+                cleaned_alias = re.sub(r'[。，；：！？]$', '', cleaned_alias)
+                if cleaned_alias:
+                    unique_aliases.add(cleaned_alias)
+
+            for alias in sorted(list(unique_aliases)):
+                add_triple("方名", formula_name, "another name", "别名", alias, current_page_triples)
+
+        # --- 统一处理功能主治（使用LLM） ---
+        for func_item in resolve(functions_results[block_idx]):
+            add_triple("方名", formula_name, "functions", "功能主治", func_item, current_page_triples)
+
+        if prescription_node_name:
+            add_triple("方名", formula_name, "prescription type", "处方", prescription_node_name, current_page_triples)
+
+            extracted_herbs_dosages = resolve(composition_results[block_idx])
+
+            for herb_name, dosage_text in extracted_herbs_dosages:
+                if herb_name:
+                    add_triple("处方", prescription_node_name, "composition", "中药名", herb_name, current_page_triples)
+                    if dosage_text:
+                        add_triple("中药名", herb_name, "dose", "剂量", dosage_text, current_page_triples)
+    return current_page_triples
+
+
+def save_page(page_id: int, named_blocks: list, manifest: CrawlManifest, extractor: BatchExtractor = None):
+    current_page_triples = build_page_triples(named_blocks, extractor)
+    if current_page_triples:
+        page_output_file = manifest.save_page(page_id, current_page_triples)
+        print(f"已保存页面 {page_id} 的数据到 {page_output_file}")
+    else:
+        print(f"页面 {page_id} 未提取到有效数据，未生成单独文件。")
+
+
+# --- 主爬虫函数 ---
+def scrape_tcm_formula_data(base_url=BASE_URL, start_id=START_ID, end_id=END_ID, data_folder=DATA_FOLDER,
+                            output_file=OUTPUT_FILE, concurrency=CONCURRENCY, extract_workers=EXTRACT_WORKERS,
+                            fetcher=None, extractor=None):
+    """
+    流水线：抓取 + 解析在 concurrency 个线程中按页面 ID 提前进行（最多领先 2 * concurrency 页），
+    主线程按 ID 顺序为方剂名编号（保证编号与串行爬取一致），再交给 extract_workers 个线程调用 LLM 并写文件，
+    因此抓取、解析与抽取相互重叠。各页面的待抽取文本由 extractor 统一凑批、并发请求并缓存。
+    """
+    # 1. 创建数据文件夹
+    os.makedirs(data_folder, exist_ok=True)
+    fetcher = fetcher or Fetcher()
+    if extractor is None:
+        extractor = BatchExtractor(deepseek_client, DEEPSEEK_MODEL, ExtractionCache())
+
+    # 2. 从清单恢复已处理的ID与方剂名计数，用于断点续爬（不再逐个读取页面文件）
+    manifest = CrawlManifest(data_folder)
+    untracked = manifest.register_untracked()
+    if untracked:
+        print(f"已将 {untracked} 个清单外的页面文件登记到 {manifest.path}")
+    processed_ids, loaded_name_counts, loaded_triples = manifest.resume_state()
+    formula_name_counts.update(loaded_name_counts)
+
+    print(f"已加载 {loaded_triples} 条现有三元组。已处理页面ID数量: {len(processed_ids)}")
+    print(f"当前方剂名计数（用于编号）: {dict(formula_name_counts)}")
+
+    page_ids = iter([i for i in range(start_id, end_id + 1) if i not in processed_ids])
+    window = max(concurrency, 1) * 2
+    started = time.perf_counter()
+    fetched_pages = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as fetch_pool, \
+            ThreadPoolExecutor(max_workers=extract_workers) as extract_pool:
+        pending = deque()
+        extractions = []
+
+        def submit_next():
+            page_id = next(page_ids, None)
+            if page_id is not None:
+                pending.append((page_id, fetch_pool.submit(fetch_and_parse, fetcher, page_id, base_url)))
+
+        for _ in range(window):
+            submit_next()
+
+        while pending:
+            page_id, future = pending.popleft()
+            submit_next()
+            parsed_blocks = future.result()
+            if parsed_blocks is None:
+                continue
+            fetched_pages += 1
+            named_blocks = assign_formula_names(parsed_blocks)
+            extractions.append(extract_pool.submit(save_page, page_id, named_blocks, manifest, extractor))
+
+        for future in extractions:
+            future.result()
+
+    elapsed = time.perf_counter() - started
+    print(f"本次抓取 {fetched_pages} 个页面，用时 {elapsed:.1f} 秒；LLM抽取: {extractor.stats()}")
+
+    # 最终将所有聚合的三元组流式写入总文件（只追加上次聚合之后新增的页面）
+    total_triples, appended_pages = manifest.write_aggregate(output_file)
+    _, final_formula_name_counts, _ = manifest.resume_state()
+    print(f"\n数据爬取完成。已将 {total_triples} 个三元组保存到 {output_file}（本次写入 {appended_pages} 个页面）")
     print(f"最终方剂名计数: {dict(final_formula_name_counts)}")
 
 
 # --- 运行爬虫 ---
 if __name__ == "__main__":
-    scrape_tcm_formula_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="并发抓取方剂页面并抽取三元组")
+    parser.add_argument("--base-url", default=BASE_URL, help="页面地址前缀，测试时可指向本地夹具服务器")
+    parser.add_argument("--start", type=int, default=START_ID)
+    parser.add_argument("--end", type=int, default=END_ID)
+    parser.add_argument("--data-folder", default=DATA_FOLDER)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="抓取线程数")
+    parser.add_argument("--extract-workers", type=int, default=EXTRACT_WORKERS, help="LLM 抽取线程数")
+    parser.add_argument("--rate", type=float, default=RATE_LIMIT, help="全局每秒请求数上限，0 表示不限速")
+    parser.add_argument("--burst", type=int, default=RATE_BURST)
+    parser.add_argument("--per-host", type=int, default=PER_HOST_LIMIT, help="同一主机的并发请求上限")
+    parser.add_argument("--retries", type=int, default=MAX_RETRIES)
+    parser.add_argument("--llm-batch-size", type=int, default=LLM_BATCH_SIZE, help="每次 LLM 请求打包的文本条数")
+    parser.add_argument("--llm-in-flight", type=int, default=LLM_MAX_IN_FLIGHT, help="同时进行的 LLM 请求数上限")
+    parser.add_argument("--extraction-cache", default=EXTRACTION_CACHE_PATH, help="LLM 抽取结果缓存文件")
+    args = parser.parse_args()
+
+    scrape_tcm_formula_data(
+        base_url=args.base_url,
+        start_id=args.start,
+        end_id=args.end,
+        data_folder=args.data_folder,
+        output_file=args.output,
+        concurrency=args.concurrency,
+        extract_workers=args.extract_workers,
+        fetcher=Fetcher(rate=args.rate, burst=args.burst, per_host=args.per_host, retries=args.retries),
+        extractor=BatchExtractor(deepseek_client, DEEPSEEK_MODEL, ExtractionCache(args.extraction_cache),
+                                 batch_size=args.llm_batch_size, max_in_flight=args.llm_in_flight),
+    )
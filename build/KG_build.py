@@ -7,10 +7,123 @@
     file name: KG_build.py
     function:
         通用知识图谱构建脚本，支持权重处理
+        支持逐条创建（custom）与 UNWIND 批量导入（bulk）两种全量重建模式，
+        以及按 cleaned_data 内容哈希清单增量更新（incremental）、不清空图谱的模式
+        带剂量的关系除原始文本 weight 外另写入 dose_parser 解析的 grams 与 dose_confidence，
+        并为中药组成关系的 grams 建立索引，剂量的求和与范围过滤可直接在库内完成
 """
 
+import argparse
 import json
+import os
+import time
+from collections import defaultdict
 from py2neo import Graph, Node, Relationship
+from dose_parser import dose_properties
+from graph_manifest import CLEANED_DIR, MANIFEST_PATH, GraphDiff, load_manifest, save_manifest
+from symptom_index import INDEX_PATH, SymptomIndex
+
+# === Neo4j 连接配置
+NEO4J_URI = "bolt://localhost:7687"
+NEO4J_AUTH = ("neo4j", "1qaz2wsx")
+NEO4J_NAME = "TCM-2"
+
+DATA_PATH = "./data/TCM.json"
+VERSION_PATH = "./data/graph_version.json"  # 每次重建递增，UI 查询缓存据此失效
+BATCH_SIZE = 1000  # bulk 模式下每个 UNWIND 语句携带的行数
+DOSE_RELATION = "中药组成"  # grams 建索引的关系类型
+# 关系属性：原始剂量文本与解析后的数值（weight 为空时均不设置）
+SET_WEIGHT = "SET r.weight = row.weight, r.grams = row.grams, r.dose_confidence = row.dose_confidence"
+
+
+def iter_triples(path=DATA_PATH):
+    """
+        逐条读取三元组：.jsonl（data/pipeline.py 的输出）逐行解析，不整体载入；其他按 JSON 数组读取
+    :param path: 数据文件路径
+    :return: 三元组迭代器
+    """
+    with open(path, "r", encoding="utf-8") as fr:
+        if path.endswith(".jsonl"):
+            for line in fr:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(fr)
+
+
+def connect():
+    """
+        连接 Neo4j 数据库
+    :return: Graph()
+    """
+    return Graph(NEO4J_URI, auth=NEO4J_AUTH, name=NEO4J_NAME)
+
+
+def quote_name(name):
+    """
+        label / 关系类型无法参数化，拼接进 Cypher 前用反引号转义
+    :param name: label 或关系类型
+    :return: 转义后的标识符
+    """
+    return "`" + name.replace("`", "``") + "`"
+
+
+def report_throughput(stage, count, seconds):
+    """
+        打印导入吞吐量
+    :param stage: 阶段名称（nodes / edges）
+    :param count: 导入数量
+    :param seconds: 耗时（秒）
+    :return:
+    """
+    rate = count / seconds if seconds > 0 else float("inf")
+    print(f"{stage}: {count} in {seconds:.2f}s ({rate:.1f} {stage}/sec)")
+
+
+def write_symptom_index(data):
+    """
+        写出功能主治 n-gram 索引，供 UI 在遍历前解析症状对应的功能主治节点
+    :param data: 三元组可迭代对象
+    :return:
+    """
+    index = SymptomIndex.from_triples(data)
+    index.save(INDEX_PATH)
+    print(f"symptom index: {len(index.names)} names, {len(index.postings)} grams -> {INDEX_PATH}")
+
+
+def bump_graph_version():
+    """
+        图谱版本号加一并写出，供 UI 等消费者判断图谱是否已重建
+    :return: 新版本号
+    """
+    try:
+        with open(VERSION_PATH, "r", encoding="utf-8") as fr:
+            version = json.load(fr).get("version", 0)
+    except (OSError, ValueError):
+        version = 0
+    version += 1
+    with open(VERSION_PATH, "w", encoding="utf-8") as fw:
+        json.dump({"version": version, "built_at": time.strftime("%Y-%m-%d %H:%M:%S")}, fw)
+    print(f"graph version -> {version}")
+    return version
+
+
+def reset_manifest(cleaned_dir=CLEANED_DIR, manifest_path=MANIFEST_PATH):
+    """
+        全量重建（custom / bulk）后按当前 cleaned_data 重写增量清单，之后的 incremental 以重建后的图谱为基准
+        （TCM.json 由 data/pipeline.py 从同一 cleaned_data 生成）；没有 cleaned_data 时删除旧清单，
+        下次增量按首次运行处理（全部 MERGE），不会依据描述旧图谱的清单删除或跳过关系
+    :param cleaned_dir: 清洗后的页面 JSON 目录
+    :param manifest_path: 清单路径
+    :return:
+    """
+    if os.path.isdir(cleaned_dir):
+        diff = GraphDiff({"pages": {}}, cleaned_dir)
+        save_manifest(diff.manifest(), manifest_path)
+        print(f"manifest: {len(diff.pages)} pages -> {manifest_path}")
+    elif os.path.exists(manifest_path):
+        os.remove(manifest_path)
+        print(f"manifest: {cleaned_dir} not found, removed {manifest_path}")
 
 
 def generateGraph_Node(graph, label, name):
@@ -28,7 +141,7 @@ def generateGraph_Node(graph, label, name):
 
 def generateGraph_Relation(graph, node_1, relation, node_2, weight=None):
     """
-        连接知识图谱关系，支持可选的权重属性
+        连接知识图谱关系，支持可选的权重属性（同时写入解析后的 grams / dose_confidence）
     :param graph: Graph()
     :param node_1: 头实体节点
     :param relation: 关系类型
@@ -37,52 +150,250 @@ def generateGraph_Relation(graph, node_1, relation, node_2, weight=None):
     :return:
     """
     if weight is not None:
-        r = Relationship(node_1, relation, node_2, weight=weight)
+        properties = {key: value for key, value in dose_properties(weight).items() if value is not None}
+        r = Relationship(node_1, relation, node_2, weight=weight, **properties)
     else:
         r = Relationship(node_1, relation, node_2)
     graph.create(r)
 
 
-def create_graph_custom():
+def create_graph_custom(data_path=DATA_PATH):
     """
         创建通用知识图谱，根据JSON结构构建，支持关系权重
+    :param data_path: TCM.json 或 TCM.jsonl
     :return:
     """
     # === 连接Neo4j数据库
-    connect_graph = Graph("bolt://localhost:7687", auth=("neo4j", "1qaz2wsx"), name="TCM-2")
+    connect_graph = connect()
     connect_graph.run("MATCH (n) DETACH DELETE n")  # 清空旧图谱
 
     dict_nodes = {}  # 缓存已创建节点，避免重复创建
+    edge_count = 0
+    start = time.perf_counter()
+
+    for ele in iter_triples(data_path):
+        node_1 = ele["node_1"]
+        relation = ele["relation"]
+        node_2 = ele["node_2"]
+        weight = ele.get("weight")  # 可选字段
+
+        # 解析 label 和 name
+        label1, name1 = node_1.split("\t")
+        label2, name2 = node_2.split("\t")
+
+        # 获取或创建节点1
+        if node_1 not in dict_nodes:
+            node_1_g = generateGraph_Node(connect_graph, label1, name1)
+            dict_nodes[node_1] = node_1_g
+        else:
+            node_1_g = dict_nodes[node_1]
+
+        # 获取或创建节点2
+        if node_2 not in dict_nodes:
+            node_2_g = generateGraph_Node(connect_graph, label2, name2)
+            dict_nodes[node_2] = node_2_g
+        else:
+            node_2_g = dict_nodes[node_2]
+
+        # 创建关系（带权重）
+        generateGraph_Relation(connect_graph, node_1_g, relation, node_2_g, weight)
+        edge_count += 1
 
-    with open("./data/TCM.json", "r", encoding="utf-8") as fr:
-        data = json.load(fr)
-        for ele in data:
-            node_1 = ele["node_1"]
-            relation = ele["relation"]
-            node_2 = ele["node_2"]
-            weight = ele.get("weight")  # 可选字段
+    # 逐条模式下节点与关系交替创建，只能按总耗时折算
+    elapsed = time.perf_counter() - start
+    report_throughput("nodes", len(dict_nodes), elapsed)
+    report_throughput("edges", edge_count, elapsed)
+    create_dose_index(connect_graph)
+    write_symptom_index(iter_triples(data_path))
+    reset_manifest()
+    bump_graph_version()
 
-            # 解析 label 和 name
-            label1, name1 = node_1.split("\t")
-            label2, name2 = node_2.split("\t")
 
-            # 获取或创建节点1
-            if node_1 not in dict_nodes:
-                node_1_g = generateGraph_Node(connect_graph, label1, name1)
-                dict_nodes[node_1] = node_1_g
-            else:
-                node_1_g = dict_nodes[node_1]
+def grouped_batches(data, batch_size=BATCH_SIZE):
+    """
+        按 (头label, 关系, 尾label) 分组的关系行，某组攒满 batch_size 行即产出，读完后产出各组剩余的行；
+        只缓存每组不足一批的行，内存占用与三元组总数无关
+    :param data: 三元组可迭代对象（可为逐行读取的 JSONL）
+    :param batch_size: 每批行数
+    :return: ((label1, relation, label2), 关系行列表) 生成器
+    """
+    pending = defaultdict(list)
+    for ele in data:
+        label1, name1 = ele["node_1"].split("\t")
+        label2, name2 = ele["node_2"].split("\t")
+        key = (label1, ele["relation"], label2)
+        rows = pending[key]
+        rows.append(with_dose({"src": name1, "dst": name2, "weight": ele.get("weight")}))
+        if len(rows) >= batch_size:
+            yield key, rows
+            pending[key] = []
+    for key, rows in pending.items():
+        if rows:
+            yield key, rows
+
+
+def with_dose(row):
+    """
+        关系行附加解析后的剂量数值
+    :param row: {"src", "dst", "weight"}
+    :return: 附加 grams / dose_confidence 的关系行（weight 为空时两者均为 None）
+    """
+    if row.get("weight") is None:
+        return dict(row, grams=None, dose_confidence=None)
+    return dict(row, **dose_properties(row["weight"]))
+
+
+def create_dose_index(graph):
+    """
+        为中药组成关系的 grams 建立关系属性索引（按克数过滤、排序可走索引）
+    :param graph: Graph()
+    :return:
+    """
+    graph.run(
+        f"CREATE INDEX dose_grams IF NOT EXISTS FOR ()-[r:{quote_name(DOSE_RELATION)}]-() ON (r.grams)"
+    )
+
+
+def run_batches(graph, query, rows, batch_size):
+    """
+        将 rows 按 batch_size 切分，每批在一个显式事务中执行参数化 UNWIND 语句
+    :param graph: Graph()
+    :param query: 以 $rows 为参数的 Cypher
+    :param rows: 参数行
+    :param batch_size: 每批行数
+    :return:
+    """
+    for i in range(0, len(rows), batch_size):
+        tx = graph.begin()
+        tx.run(query, rows=rows[i:i + batch_size])
+        graph.commit(tx)
+
 
-            # 获取或创建节点2
-            if node_2 not in dict_nodes:
-                node_2_g = generateGraph_Node(connect_graph, label2, name2)
-                dict_nodes[node_2] = node_2_g
-            else:
-                node_2_g = dict_nodes[node_2]
+def create_constraints(graph, labels):
+    """
+        建 (label, name) 唯一约束，MERGE / MATCH 均可走索引
+    :param graph: Graph()
+    :param labels: label 集合
+    :return:
+    """
+    for label in labels:
+        graph.run(
+            f"CREATE CONSTRAINT IF NOT EXISTS FOR (n:{quote_name(label)}) REQUIRE n.name IS UNIQUE"
+        )
+
+
+def create_graph_bulk(batch_size=BATCH_SIZE, data_path=DATA_PATH):
+    """
+        批量导入知识图谱：边读边按 (头label, 关系, 尾label) 分组，每组满 batch_size 行即以 UNWIND 写入一批
+        （MERGE 两端节点、CREATE 关系），内存占用与数据规模无关；
+        关系语义与 create_graph_custom 保持一致（重复三元组仍各自建边，weight 为空时不设置属性）
+    :param batch_size: 每批行数
+    :param data_path: TCM.json 或 TCM.jsonl
+    :return:
+    """
+    connect_graph = connect()
+    connect_graph.run("MATCH (n) DETACH DELETE n")  # 清空旧图谱
 
-            # 创建关系（带权重）
-            generateGraph_Relation(connect_graph, node_1_g, relation, node_2_g, weight)
+    start = time.perf_counter()
+    labels = set()
+    edge_count = 0
+    for (label1, relation, label2), rows in grouped_batches(iter_triples(data_path), batch_size):
+        new_labels = {label1, label2} - labels
+        if new_labels:
+            create_constraints(connect_graph, new_labels)  # 先建唯一约束，MERGE 节点走索引
+            labels |= new_labels
+        query = (
+            "UNWIND $rows AS row "
+            f"MERGE (a:{quote_name(label1)} {{name: row.src}}) "
+            f"MERGE (b:{quote_name(label2)} {{name: row.dst}}) "
+            f"CREATE (a)-[r:{quote_name(relation)}]->(b) "
+            + SET_WEIGHT
+        )
+        run_batches(connect_graph, query, rows, batch_size)
+        edge_count += len(rows)
+    # 节点随关系一起写入，只能按总耗时折算
+    elapsed = time.perf_counter() - start
+    report_throughput("nodes", connect_graph.run("MATCH (n) RETURN count(n)").evaluate(), elapsed)
+    report_throughput("edges", edge_count, elapsed)
+    create_dose_index(connect_graph)
+    write_symptom_index(iter_triples(data_path))
+    reset_manifest()
+    bump_graph_version()
+
+
+def update_graph_incremental(batch_size=BATCH_SIZE, cleaned_dir=CLEANED_DIR, manifest_path=MANIFEST_PATH):
+    """
+        增量更新：与上次写入的内容哈希清单比较 cleaned_data，只对变化页面带来的关系差异
+        分批 MERGE / DELETE（每批一个事务），图谱在更新过程中始终可查询；
+        先写入新增关系、再删除过期关系与孤立节点，最后更新清单、症状索引与图谱版本号。
+        首次运行（无清单）时全部关系按 MERGE 写入，不会清空已有图谱。
+    :param batch_size: 每批行数
+    :param cleaned_dir: 清洗后的页面 JSON 目录
+    :param manifest_path: 清单路径
+    :return: 新版本号，无变化时返回 None
+    """
+    diff = GraphDiff(load_manifest(manifest_path), cleaned_dir)
+    if not diff:
+        print("incremental: no changes")
+        return None
+    print(f"incremental: {diff.summary()}")
+    connect_graph = connect()
+
+    start = time.perf_counter()
+    merged = 0
+    merge_groups = diff.grouped_merge()
+    create_constraints(connect_graph, {label for (label1, _, label2) in merge_groups for label in (label1, label2)})
+    for (label1, relation, label2), rows in merge_groups.items():
+        query = (
+            "UNWIND $rows AS row "
+            f"MERGE (a:{quote_name(label1)} {{name: row.src}}) "
+            f"MERGE (b:{quote_name(label2)} {{name: row.dst}}) "
+            f"MERGE (a)-[r:{quote_name(relation)}]->(b) "
+            + SET_WEIGHT
+        )
+        run_batches(connect_graph, query, [with_dose(row) for row in rows], batch_size)
+        merged += len(rows)
+    report_throughput("merged edges", merged, time.perf_counter() - start)
+    create_dose_index(connect_graph)
+
+    start = time.perf_counter()
+    deleted = 0
+    for (label1, relation, label2), rows in diff.grouped_delete().items():
+        query = (
+            "UNWIND $rows AS row "
+            f"MATCH (a:{quote_name(label1)} {{name: row.src}})-[r:{quote_name(relation)}]->"
+            f"(b:{quote_name(label2)} {{name: row.dst}}) "
+            "DELETE r"
+        )
+        run_batches(connect_graph, query, rows, batch_size)
+        deleted += len(rows)
+    for label, names in diff.grouped_orphans().items():
+        query = (
+            "UNWIND $rows AS name "
+            f"MATCH (n:{quote_name(label)} {{name: name}}) "
+            "WHERE NOT (n)--() "
+            "DELETE n"
+        )
+        run_batches(connect_graph, query, names, batch_size)
+    report_throughput("deleted edges", deleted, time.perf_counter() - start)
+
+    save_manifest(diff.manifest(), manifest_path)
+    write_symptom_index(list(diff.triples()))
+    return bump_graph_version()
 
 
 if __name__ == '__main__':
-    create_graph_custom()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="构建中医药知识图谱")
+    parser.add_argument("--mode", choices=["custom", "bulk", "incremental"], default="custom",
+                        help="custom: 逐条创建；bulk: UNWIND 批量导入；incremental: 按 cleaned_data 差异增量更新")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="bulk / incremental 模式每批行数")
+    parser.add_argument("--data", default=DATA_PATH,
+                        help="custom / bulk 模式的数据文件，.jsonl（data/pipeline.py 输出）逐行读取")
+    args = parser.parse_args()
+
+    if args.mode == "bulk":
+        create_graph_bulk(args.batch_size, args.data)
+    elif args.mode == "incremental":
+        update_graph_incremental(args.batch_size)
+    else:
+        create_graph_custom(args.data)
@@ -7,10 +7,8 @@ def parse_weight(text):
     """保留原始剂量字符串"""
     return text.strip()
 
-def clean_file(file_path, output_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
+def clean_triples(data):
+    """将 dose 关系合并为 composition 关系的 weight 属性"""
     # 1. 提取所有中药 -> 剂量 映射
     dose_map = {}
     for entry in data:
@@ -32,6 +30,14 @@ def clean_file(file_path, output_path):
             cleaned.append(new_entry)
         elif entry['relation'] != 'dose':
             cleaned.append(entry)
+    return cleaned
+
+
+def clean_file(file_path, output_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    cleaned = clean_triples(data)
 
     # 3. 输出
     with open(output_path, 'w', encoding='utf-8') as f:
@@ -0,0 +1,81 @@
+"""
+清洗 + 合并的流式流水线：crawled_data_raw/*.json -> TCM.jsonl（每行一个三元组）
+
+各页面在进程池中并行执行 data_clean.clean_triples（dose 合并为 composition 的 weight），
+并按 graph_manifest.RELATION_MAP 将关系转为中文；主进程按页面顺序逐行写出，
+不在内存中累积全部三元组。KG_build.py --data ./data/TCM.jsonl 可逐行读取该文件建图。
+
+    cd build/data
+    python pipeline.py                               # 输出 ./TCM.jsonl
+    python pipeline.py --cleaned-dir ./cleaned_data  # 同时写出各页面的清洗结果，供增量建图使用
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from functools import partial
+from multiprocessing import Pool
+
+BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+if BUILD_DIR not in sys.path:
+    sys.path.append(BUILD_DIR)
+
+from data_clean import clean_triples
+from graph_manifest import normalize_triple
+
+INPUT_DIR = "./crawled_data_raw"
+OUTPUT_PATH = "./TCM.jsonl"
+
+
+def page_order(fname):
+    stem = fname[:-len(".json")]
+    return (0, int(stem), fname) if stem.isdigit() else (1, 0, fname)
+
+
+def process_page(fname, input_dir, cleaned_dir=None):
+    """
+    在子进程中清洗单个页面，返回 JSONL 行列表
+    :param fname: 页面文件名
+    :param input_dir: 原始页面目录
+    :param cleaned_dir: 非空时同时写出该页面的清洗结果（英文关系，与 data_clean.py 输出一致）
+    """
+    with open(os.path.join(input_dir, fname), 'r', encoding='utf-8') as f:
+        cleaned = clean_triples(json.load(f))
+    if cleaned_dir:
+        with open(os.path.join(cleaned_dir, fname), 'w', encoding='utf-8') as f:
+            json.dump(cleaned, f, ensure_ascii=False, indent=2)
+    return [json.dumps(normalize_triple(entry), ensure_ascii=False) + "\n" for entry in cleaned]
+
+
+def run_pipeline(input_dir=INPUT_DIR, output_path=OUTPUT_PATH, cleaned_dir=None, workers=None, chunksize=8):
+    """
+    :return: (页面数, 三元组数)
+    """
+    fnames = sorted((f for f in os.listdir(input_dir) if f.endswith('.json')), key=page_order)
+    if cleaned_dir:
+        os.makedirs(cleaned_dir, exist_ok=True)
+    worker = partial(process_page, input_dir=input_dir, cleaned_dir=cleaned_dir)
+
+    count = 0
+    tmp_path = output_path + ".tmp"
+    with Pool(workers) as pool, open(tmp_path, 'w', encoding='utf-8') as fw:
+        # imap 按页面顺序返回结果，已完成的页面立即写出
+        for lines in pool.imap(worker, fnames, chunksize=chunksize):
+            fw.writelines(lines)
+            count += len(lines)
+    os.replace(tmp_path, output_path)
+    return len(fnames), count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="并行清洗并流式合并为 JSONL")
+    parser.add_argument("--input-dir", default=INPUT_DIR)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--cleaned-dir", default=None, help="同时写出各页面清洗结果的目录")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为 CPU 核数")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    pages, triples = run_pipeline(args.input_dir, args.output, args.cleaned_dir, args.workers)
+    print(f"✅ Cleaned {pages} pages, wrote {triples} triples to {args.output} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,103 @@
+# -*- coding = utf-8 -*-
+"""
+    project name: Knowledge_Graph_Custom
+    file name: dose_parser.py
+    function:
+        剂量文本的数值化，建图（KG_build.py）、快照编译（graph_snapshot.py）与内存引擎载入时调用，
+        中药组成关系在原始剂量文本 weight 之外另存数值 grams 与解析可信度 dose_confidence：
+            - explicit：文本中写出了克数（含 kg / mg），如 '四两（120g）'、'9克（去节）'，取第一个克数
+            - range：克数为范围，如 '18-30g'、'三两（9~12g）'、'钱半至三钱 (4.5g~9g)'，取中值
+            - converted：只有传统单位，按市制换算，如 '一钱五分' -> 4.5、'两半' -> 45
+            - none：无法换算为克（'十枚'、'一升' 等），grams 为空
+        市制换算：1 斤 = 500 g，1 两 = 30 g，1 钱 = 3 g，1 分 = 0.3 g，1 铢 = 1/24 两；
+        古方原文的两、分与今制不同，原书给出的今用克数（括号中）优先于换算值。
+
+        python dose_parser.py '一两半 (45g)' '钱半' '十枚'
+"""
+
+import re
+import sys
+from collections import namedtuple
+
+DOSE_CONFIDENCE = ("explicit", "range", "converted", "none")
+UNIT_GRAMS = {"斤": 500.0, "两": 30.0, "钱": 3.0, "分": 0.3, "铢": 1.25}
+METRIC_GRAMS = {"kg": 1000.0, "千克": 1000.0, "mg": 0.001, "毫克": 0.001, "g": 1.0, "克": 1.0}
+
+NUMBER = r"\d+(?:\.\d+)?"
+METRIC_UNIT = r"kg|千克|mg|毫克|g|克"
+# 范围的下限可带单位，如 '4.5g~9g'
+GRAMS_PATTERN = re.compile(rf"({NUMBER})\s*({METRIC_UNIT})?(?:\s*[-~～—至]\s*({NUMBER}))?\s*({METRIC_UNIT})", re.IGNORECASE)
+# 数字 + 单位 + 可选的“半”；“钱匕”为量具、“等分”为等量，均不换算
+UNIT_PATTERN = re.compile(rf"({NUMBER}|[一二三四五六七八九十百]+|半)?(斤|两|钱(?!匕)|铢|(?<!等)分)(半)?")
+CHINESE_DIGITS = {"零": 0, "一": 1, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+Dose = namedtuple("Dose", ["text", "grams", "confidence"])
+
+
+def chinese_number(text):
+    """'十四' -> 14，'三十' -> 30，'2.5' -> 2.5，'半' -> 0.5"""
+    if text == "半":
+        return 0.5
+    if re.fullmatch(NUMBER, text):
+        return float(text)
+    total, current = 0, 0
+    for ch in text:
+        if ch in CHINESE_DIGITS:
+            current = CHINESE_DIGITS[ch]
+        else:  # 十 / 百
+            total += (current or 1) * (10 if ch == "十" else 100)
+            current = 0
+    return float(total + current)
+
+
+def traditional_grams(text):
+    """
+        第一段连续的传统单位剂量换算为克，如 '一两二钱' -> 36.0；没有时返回 None
+    :param text: 剂量文本
+    :return: 克数或 None
+    """
+    grams = None
+    end = None
+    for match in UNIT_PATTERN.finditer(text):
+        number, unit, half = match.groups()
+        if number is None and half is None:
+            continue  # 单独的“分”“两”等多为其他含义（如“分服”）
+        if end is not None and match.start() != end:
+            break
+        value = (chinese_number(number) if number else 1.0) + (0.5 if half else 0.0)
+        grams = (grams or 0.0) + value * UNIT_GRAMS[unit]
+        end = match.end()
+    return grams
+
+
+def parse_dose(text):
+    """
+        解析剂量文本
+    :param text: 原始剂量文本，可为 None
+    :return: Dose(text, grams, confidence)，grams 保留四位小数，无法换算时为 None
+    """
+    if not text:
+        return Dose(text, None, "none")
+    match = GRAMS_PATTERN.search(text)
+    if match:
+        low, low_unit, high, unit = match.groups()
+        scale = METRIC_GRAMS[unit.lower()]
+        if high is None:
+            return Dose(text, round(float(low) * scale, 4), "explicit")
+        low_scale = METRIC_GRAMS[low_unit.lower()] if low_unit else scale
+        return Dose(text, round((float(low) * low_scale + float(high) * scale) / 2, 4), "range")
+    grams = traditional_grams(text)
+    if grams is not None:
+        return Dose(text, round(grams, 4), "converted")
+    return Dose(text, None, "none")
+
+
+def dose_properties(weight):
+    """写入图谱的关系属性：grams（无法换算时为 None）与 dose_confidence"""
+    dose = parse_dose(weight)
+    return {"grams": dose.grams, "dose_confidence": dose.confidence}
+
+
+if __name__ == '__main__':
+    for arg in sys.argv[1:]:
+        print(parse_dose(arg))
@@ -0,0 +1,148 @@
+# -*- coding = utf-8 -*-
+"""
+    project name: Knowledge_Graph_Custom
+    file name: graph_manifest.py
+    function:
+        增量建图所需的清单与差异计算（不依赖 Neo4j）：
+            - data/graph_manifest.json 记录上次写入图谱时 cleaned_data/*.json 每个文件的内容哈希与三元组
+            - 重新扫描 cleaned_data，只解析哈希变化的文件，得到需要 MERGE / DELETE 的关系与需要删除的孤立节点
+        cleaned_data 中的关系为英文（include / functions ...），写入图谱前按 RELATION_MAP 转为中文，与 TCM.json 一致。
+        关系以 (头节点, 关系, 尾节点) 为标识，weight 作为属性；同一三元组出现在多个页面时，
+        只有在所有页面中都被删除后才会从图谱中删除。
+"""
+
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+CLEANED_DIR = "./data/cleaned_data"
+MANIFEST_PATH = "./data/graph_manifest.json"
+
+RELATION_MAP = {
+    "include": "包含",
+    "functions": "功能主治",
+    "composition": "中药组成",
+    "prescription type": "配方",
+    "from": "来源",
+    "another name": "别名",
+}
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def normalize_triple(ele):
+    """英文关系转为中文，其余字段保持不变"""
+    triple = {
+        "node_1": ele["node_1"],
+        "relation": RELATION_MAP.get(ele["relation"], ele["relation"]),
+        "node_2": ele["node_2"],
+    }
+    if ele.get("weight") is not None:
+        triple["weight"] = ele["weight"]
+    return triple
+
+
+def load_page(path):
+    with open(path, "r", encoding="utf-8") as fr:
+        return [normalize_triple(ele) for ele in json.load(fr)]
+
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as fr:
+            return json.load(fr)
+    except (OSError, ValueError):
+        return {"pages": {}}
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fw:
+        json.dump(manifest, fw, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def edge_weights(pages):
+    """(node_1, relation, node_2) -> weight（多处出现时以后出现者为准）"""
+    edges = {}
+    for page in pages:
+        for ele in page["triples"]:
+            edges[(ele["node_1"], ele["relation"], ele["node_2"])] = ele.get("weight")
+    return edges
+
+
+class GraphDiff:
+
+    def __init__(self, old_manifest, cleaned_dir=CLEANED_DIR):
+        """
+        :param old_manifest: load_manifest() 的结果，首次运行时为空清单（即全部三元组都视为新增）
+        :param cleaned_dir: 清洗后的页面 JSON 目录
+        """
+        old_pages = old_manifest["pages"]
+        self.pages = {}
+        self.changed = []
+        for fname in sorted(os.listdir(cleaned_dir)):
+            if not fname.endswith(".json"):
+                continue
+            path = os.path.join(cleaned_dir, fname)
+            sha256 = file_sha256(path)
+            old = old_pages.get(fname)
+            if old is not None and old["sha256"] == sha256:
+                self.pages[fname] = old
+            else:
+                self.pages[fname] = {"sha256": sha256, "triples": load_page(path)}
+                self.changed.append(fname)
+        self.removed_pages = sorted(set(old_pages) - set(self.pages))
+
+        old_edges = edge_weights(old_pages.values())
+        new_edges = edge_weights(self.pages.values())
+        # 新增或 weight 变化的关系需要 MERGE，全部页面中都不再出现的关系需要 DELETE
+        self.merge = {key: weight for key, weight in new_edges.items()
+                      if key not in old_edges or old_edges[key] != weight}
+        self.delete = [key for key in old_edges if key not in new_edges]
+
+        old_nodes = {node for key in old_edges for node in (key[0], key[2])}
+        new_nodes = {node for key in new_edges for node in (key[0], key[2])}
+        self.orphans = sorted(old_nodes - new_nodes)
+
+    def __bool__(self):
+        return bool(self.changed or self.removed_pages)
+
+    def triples(self):
+        for page in self.pages.values():
+            yield from page["triples"]
+
+    def manifest(self):
+        return {"pages": self.pages}
+
+    def grouped_merge(self):
+        """(label1, relation, label2) -> [{"src", "dst", "weight"}]"""
+        return self._group((key, weight) for key, weight in self.merge.items())
+
+    def grouped_delete(self):
+        return self._group((key, None) for key in self.delete)
+
+    @staticmethod
+    def _group(items):
+        groups = defaultdict(list)
+        for (node_1, relation, node_2), weight in items:
+            label1, name1 = node_1.split("\t")
+            label2, name2 = node_2.split("\t")
+            groups[(label1, relation, label2)].append({"src": name1, "dst": name2, "weight": weight})
+        return groups
+
+    def grouped_orphans(self):
+        """label -> [name]"""
+        groups = defaultdict(list)
+        for node in self.orphans:
+            label, name = node.split("\t")
+            groups[label].append(name)
+        return groups
+
+    def summary(self):
+        return (f"{len(self.changed)} changed / {len(self.removed_pages)} removed pages, "
+                f"{len(self.merge)} edges to merge, {len(self.delete)} to delete, {len(self.orphans)} orphan nodes")
@@ -0,0 +1,361 @@
+# -*- coding = utf-8 -*-
+"""
+    project name: Knowledge_Graph_Custom
+    file name: graph_snapshot.py
+    function:
+        将三元组编译为紧凑的二进制快照，读取时 mmap 映射、零拷贝访问，
+        多个 worker 进程共享同一份页缓存，启动时无需解析 JSON：
+            - 字符串表：所有节点名、label、关系名、剂量文本去重后拼接为 UTF-8 blob + 偏移数组
+            - 节点：label 编号数组、名称字符串编号数组，以及按 (label, name) 排序的节点编号（用于二分查找）
+            - 每种关系的正向 / 反向 CSR（offsets / targets / edge_ids），边上的剂量文本编号，
+              以及 dose_parser 解析的数值 grams（无法换算时为 NaN）与 dose_confidence 编号
+        文件布局：MAGIC | header 长度 | header JSON（各段的偏移、元素个数、类型码） | 8 字节对齐的各段
+
+        python graph_snapshot.py compile --json ./data/TCM.json --output ./data/TCM.snap
+        python graph_snapshot.py verify --json ./data/TCM.json --snapshot ./data/TCM.snap
+"""
+
+import argparse
+import json
+import math
+import mmap
+import struct
+import sys
+import time
+from array import array
+from collections import Counter
+
+from dose_parser import DOSE_CONFIDENCE, parse_dose
+
+MAGIC = b"TCMSNAP1"
+FORMAT_VERSION = 2  # 2: 新增 edge_confidence，edge_grams 改由 dose_parser 解析
+NO_WEIGHT = 0xFFFFFFFF  # 边没有剂量文本
+SNAPSHOT_PATH = "./data/TCM.snap"
+
+
+class StringTable:
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, text):
+        string_id = self.ids.get(text)
+        if string_id is None:
+            string_id = self.ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+    def sections(self):
+        offsets = array("I", [0])
+        blob = bytearray()
+        for text in self.strings:
+            blob += text.encode("utf-8")
+            offsets.append(len(blob))
+        return {"string_offsets": offsets, "string_blob": array("B", blob)}
+
+
+def csr_sections(num_nodes, pairs):
+    """pairs: [(src, dst, edge_id)] -> offsets / targets / edge_ids"""
+    counts = array("I", [0]) * (num_nodes + 1)
+    for src, _, _ in pairs:
+        counts[src + 1] += 1
+    for i in range(num_nodes):
+        counts[i + 1] += counts[i]
+    targets = array("I", [0]) * len(pairs)
+    edge_ids = array("I", [0]) * len(pairs)
+    cursor = array("I", counts[:num_nodes])
+    for src, dst, edge_id in pairs:
+        pos = cursor[src]
+        targets[pos] = dst
+        edge_ids[pos] = edge_id
+        cursor[src] += 1
+    return counts, targets, edge_ids
+
+
+def compile_snapshot(triples, path=SNAPSHOT_PATH):
+    """
+        编译快照
+    :param triples: 三元组可迭代对象（TCM.json / TCM.jsonl 的元素）
+    :param path: 输出路径
+    :return: (节点数, 边数)
+    """
+    strings = StringTable()
+    node_ids = {}
+    node_labels = array("I")
+    node_names = array("I")
+    edge_weights = array("I")
+    edge_grams = array("f")
+    edge_confidence = array("B")
+    relation_pairs = {}
+
+    def node(text):
+        node_id = node_ids.get(text)
+        if node_id is None:
+            label, name = text.split("\t")
+            node_id = node_ids[text] = len(node_labels)
+            node_labels.append(strings.intern(label))
+            node_names.append(strings.intern(name))
+        return node_id
+
+    for ele in triples:
+        src = node(ele["node_1"])
+        dst = node(ele["node_2"])
+        edge_id = len(edge_weights)
+        weight = ele.get("weight")
+        edge_weights.append(NO_WEIGHT if weight is None else strings.intern(weight))
+        dose = parse_dose(weight)
+        edge_grams.append(math.nan if dose.grams is None else dose.grams)
+        edge_confidence.append(DOSE_CONFIDENCE.index(dose.confidence))
+        relation_pairs.setdefault(ele["relation"], []).append((src, dst, edge_id))
+
+    num_nodes = len(node_labels)
+    # label 编号压缩为 0..L-1，节点只存 uint16
+    label_string_ids = sorted(set(node_labels))
+    label_index = {string_id: i for i, string_id in enumerate(label_string_ids)}
+    compact_labels = array("H", (label_index[string_id] for string_id in node_labels))
+    sorted_nodes = array("I", sorted(range(num_nodes), key=lambda n: (
+        strings.strings[node_labels[n]], strings.strings[node_names[n]])))
+
+    # 关系名需在生成字符串表之前加入
+    relations = [strings.intern(relation) for relation in relation_pairs]
+    sections = dict(strings.sections())
+    sections.update({
+        "node_labels": compact_labels,
+        "node_names": node_names,
+        "sorted_nodes": sorted_nodes,
+        "edge_weights": edge_weights,
+        "edge_grams": edge_grams,
+        "edge_confidence": edge_confidence,
+    })
+    for index, pairs in enumerate(relation_pairs.values()):
+        for direction, direction_pairs in (("out", pairs), ("inc", [(d, s, e) for s, d, e in pairs])):
+            offsets, targets, edge_ids = csr_sections(num_nodes, direction_pairs)
+            sections[f"{direction}{index}_offsets"] = offsets
+            sections[f"{direction}{index}_targets"] = targets
+            sections[f"{direction}{index}_edge_ids"] = edge_ids
+
+    header = {
+        "version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "nodes": num_nodes,
+        "edges": len(edge_weights),
+        "labels": label_string_ids,
+        "relations": relations,
+        "sections": {},
+    }
+    # 先用占位偏移计算 header 长度，再回填真实偏移（偏移位数变化时重新计算）
+    while True:
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        offset = align(len(MAGIC) + 4 + len(header_bytes))
+        layout = {}
+        for name, data in sections.items():
+            layout[name] = [offset, len(data), data.typecode]
+            offset = align(offset + len(data) * data.itemsize)
+        if layout == header["sections"]:
+            break
+        header["sections"] = layout
+
+    with open(path, "wb") as fw:
+        fw.write(MAGIC)
+        fw.write(struct.pack("<I", len(header_bytes)))
+        fw.write(header_bytes)
+        for name, data in sections.items():
+            fw.write(b"\0" * (layout[name][0] - fw.tell()))
+            data.tofile(fw)
+    return num_nodes, len(edge_weights)
+
+
+def align(offset, size=8):
+    return (offset + size - 1) // size * size
+
+
+class StringColumn:
+    """按编号惰性解码字符串的只读序列（NO_WEIGHT 解码为 None）"""
+
+    def __init__(self, snapshot, string_ids):
+        self.snapshot = snapshot
+        self.string_ids = string_ids
+
+    def __len__(self):
+        return len(self.string_ids)
+
+    def __getitem__(self, index):
+        string_id = self.string_ids[index]
+        return None if string_id == NO_WEIGHT else self.snapshot.string(string_id)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class SnapshotCSR:
+    """与 kg_engine.CSR 接口一致，数组为 mmap 上的 memoryview"""
+
+    def __init__(self, offsets, targets, edge_ids):
+        self.offsets = offsets
+        self.targets = targets
+        self.edge_ids = edge_ids
+
+    def neighbors(self, node_id):
+        return self.targets[self.offsets[node_id]:self.offsets[node_id + 1]]
+
+    def edges(self, node_id):
+        start, end = self.offsets[node_id], self.offsets[node_id + 1]
+        return zip(self.targets[start:end], self.edge_ids[start:end])
+
+
+class GraphSnapshot:
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        with open(path, "rb") as fr:
+            self.mm = mmap.mmap(fr.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} 不是图谱快照文件")
+        (header_len,) = struct.unpack_from("<I", self.mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(bytes(self.mm[start:start + header_len]).decode("utf-8"))
+        if self.header["version"] != FORMAT_VERSION:
+            raise ValueError(f"不支持的快照版本: {self.header['version']}")
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"快照字节序为 {self.header['byteorder']}，与本机不一致，请重新编译")
+        self.view = memoryview(self.mm)
+        self.views = []
+
+        self.string_offsets = self.section("string_offsets")
+        self.string_blob = self.section("string_blob")
+        self.node_labels = self.section("node_labels")
+        self.node_name_ids = self.section("node_names")
+        self.sorted_nodes = self.section("sorted_nodes")
+        self.edge_weight_ids = self.section("edge_weights")
+        self.edge_grams = self.section("edge_grams")
+        self.edge_confidence = self.section("edge_confidence")
+        self.label_names = [self.string(i) for i in self.header["labels"]]
+        self.relations = [self.string(i) for i in self.header["relations"]]
+        self.node_names = StringColumn(self, self.node_name_ids)
+        self.weights = StringColumn(self, self.edge_weight_ids)
+        self.out = {}
+        self.inc = {}
+        for index, relation in enumerate(self.relations):
+            self.out[relation] = self.csr("out", index)
+            self.inc[relation] = self.csr("inc", index)
+
+    def section(self, name):
+        offset, count, typecode = self.header["sections"][name]
+        size = struct.calcsize(typecode)
+        view = self.view[offset:offset + count * size].cast(typecode)
+        self.views.append(view)
+        return view
+
+    def csr(self, direction, index):
+        return SnapshotCSR(*(self.section(f"{direction}{index}_{part}") for part in ("offsets", "targets", "edge_ids")))
+
+    def string(self, string_id):
+        return bytes(self.string_blob[self.string_offsets[string_id]:self.string_offsets[string_id + 1]]).decode("utf-8")
+
+    @property
+    def num_nodes(self):
+        return self.header["nodes"]
+
+    def label_of(self, node_id):
+        return self.label_names[self.node_labels[node_id]]
+
+    def find(self, label, name):
+        """按 (label, name) 二分查找节点编号，不存在时返回 None"""
+        key = (label, name)
+        lo, hi = 0, len(self.sorted_nodes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            node_id = self.sorted_nodes[mid]
+            if (self.label_of(node_id), self.node_names[node_id]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.sorted_nodes):
+            node_id = self.sorted_nodes[lo]
+            if (self.label_of(node_id), self.node_names[node_id]) == key:
+                return node_id
+        return None
+
+    def dose(self, edge_id):
+        """边上解析后的剂量：(grams 或 None, dose_confidence)"""
+        grams = self.edge_grams[edge_id]
+        return (None if math.isnan(grams) else round(grams, 4)), DOSE_CONFIDENCE[self.edge_confidence[edge_id]]
+
+    def triples(self):
+        """按关系、头节点顺序还原三元组"""
+        for relation, csr in self.out.items():
+            for src in range(self.num_nodes):
+                for dst, edge_id in csr.edges(src):
+                    triple = {
+                        "node_1": f"{self.label_of(src)}\t{self.node_names[src]}",
+                        "relation": relation,
+                        "node_2": f"{self.label_of(dst)}\t{self.node_names[dst]}",
+                    }
+                    weight = self.weights[edge_id]
+                    if weight is not None:
+                        triple["weight"] = weight
+                        triple["grams"], triple["dose_confidence"] = self.dose(edge_id)
+                    yield triple
+
+    def close(self):
+        # 释放全部 memoryview 后才能关闭 mmap，之后不可再访问
+        for view in self.views:
+            view.release()
+        self.view.release()
+        self.mm.close()
+
+
+def triple_key(triple):
+    """JSON 源的三元组按 weight 重新解析剂量，与快照中存储的 grams / dose_confidence 比对"""
+    if "dose_confidence" in triple:
+        grams, confidence = triple["grams"], triple["dose_confidence"]
+    else:
+        _, grams, confidence = parse_dose(triple.get("weight"))
+    grams = None if grams is None else round(grams, 3)
+    return triple["node_1"], triple["relation"], triple["node_2"], triple.get("weight"), grams, confidence
+
+
+def verify_snapshot(json_path, snapshot_path=SNAPSHOT_PATH):
+    """
+        往返校验：快照还原出的三元组（含重复）与 JSON 源完全一致，且每个节点都能按 (label, name) 找回
+    :return: 不一致的条目数
+    """
+    from KG_build import iter_triples  # 按需导入：只读取快照的 UI 进程不依赖 py2neo
+    expected = Counter(triple_key(t) for t in iter_triples(json_path))
+    snapshot = GraphSnapshot(snapshot_path)
+    actual = Counter(triple_key(t) for t in snapshot.triples())
+    missing = expected - actual
+    extra = actual - expected
+    for key in list(missing)[:10]:
+        print(f"missing: {key}")
+    for key in list(extra)[:10]:
+        print(f"extra: {key}")
+    unfound = 0
+    for node_id in range(snapshot.num_nodes):
+        if snapshot.find(snapshot.label_of(node_id), snapshot.node_names[node_id]) != node_id:
+            unfound += 1
+    print(f"verify: {sum(expected.values())} triples in JSON, {sum(actual.values())} in snapshot, "
+          f"{sum(missing.values())} missing, {sum(extra.values())} extra, {unfound} nodes not found by name")
+    snapshot.close()
+    return sum(missing.values()) + sum(extra.values()) + unfound
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="编译 / 校验图谱二进制快照")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_compile = sub.add_parser("compile")
+    p_compile.add_argument("--json", default="./data/TCM.json", help="TCM.json 或 TCM.jsonl")
+    p_compile.add_argument("--output", default=SNAPSHOT_PATH)
+    p_verify = sub.add_parser("verify")
+    p_verify.add_argument("--json", default="./data/TCM.json")
+    p_verify.add_argument("--snapshot", default=SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    if args.command == "compile":
+        from KG_build import iter_triples
+        start = time.perf_counter()
+        nodes, edges = compile_snapshot(iter_triples(args.json), args.output)
+        print(f"snapshot: {nodes} nodes, {edges} edges -> {args.output} ({time.perf_counter() - start:.2f}s)")
+    else:
+        sys.exit(1 if verify_snapshot(args.json, args.snapshot) else 0)
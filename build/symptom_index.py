@@ -0,0 +1,104 @@
+# -*- coding = utf-8 -*-
+"""
+    project name: Knowledge_Graph_Custom
+    file name: symptom_index.py
+    function:
+        功能主治名称的字符 n-gram 倒排索引，替代 `gn.name CONTAINS $symptom` 的全量扫描。
+        中文没有词边界，索引同时收录单字与二元字组：
+            - 查询词为单字时直接取单字倒排表
+            - 查询词不少于两字时对其所有二元字组的倒排表求交集，再逐条用子串判断复核
+        因此返回结果与 CONTAINS 语义完全一致（空串匹配全部名称）。
+        KG_build.py 每次建图时写出 data/symptom_index.json，UI 查询时加载使用。
+"""
+
+import json
+from array import array
+
+INDEX_PATH = "./data/symptom_index.json"
+SYMPTOM_LABEL = "功能主治"
+
+
+def grams(text):
+    """单字 + 二元字组（去重）"""
+    result = set(text)
+    result.update(text[i:i + 2] for i in range(len(text) - 1))
+    return result
+
+
+class SymptomIndex:
+
+    def __init__(self, names, postings=None):
+        """
+        :param names: 功能主治名称列表，倒排表中存放的是名称在列表中的下标
+        :param postings: 已构建的倒排表（从索引文件加载时传入），为空则按 names 构建
+        """
+        self.names = list(names)
+        if postings is None:
+            postings = {}
+            for i, name in enumerate(self.names):
+                for gram in grams(name):
+                    postings.setdefault(gram, array("l")).append(i)
+        self.postings = postings
+
+    @classmethod
+    def from_triples(cls, triples):
+        names = set()
+        for ele in triples:
+            for node in (ele["node_1"], ele["node_2"]):
+                label, name = node.split("\t")
+                if label == SYMPTOM_LABEL:
+                    names.add(name)
+        return cls(sorted(names))
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        with open(path, "r", encoding="utf-8") as fr:
+            data = json.load(fr)
+        postings = {gram: array("l", ids) for gram, ids in data["postings"].items()}
+        return cls(data["names"], postings)
+
+    def save(self, path=INDEX_PATH):
+        with open(path, "w", encoding="utf-8") as fw:
+            json.dump({
+                "label": SYMPTOM_LABEL,
+                "names": self.names,
+                "postings": {gram: list(ids) for gram, ids in self.postings.items()},
+            }, fw, ensure_ascii=False)
+
+    def lookup_ids(self, symptom):
+        """
+            返回名称包含 symptom 的下标列表（升序）
+        :param symptom: 查询子串
+        :return: list[int]
+        """
+        if not symptom:
+            return list(range(len(self.names)))
+        if len(symptom) == 1:
+            return list(self.postings.get(symptom, ()))
+
+        lists = []
+        for gram in grams(symptom):
+            if len(gram) != 2:
+                continue
+            posting = self.postings.get(gram)
+            if posting is None:
+                return []
+            lists.append(posting)
+        lists.sort(key=len)
+        candidates = set(lists[0])
+        for posting in lists[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        return sorted(i for i in candidates if symptom in self.names[i])
+
+    def lookup(self, symptom):
+        """返回名称包含 symptom 的功能主治名称列表"""
+        return [self.names[i] for i in self.lookup_ids(symptom)]
+
+
+if __name__ == '__main__':
+    with open("./data/TCM.json", "r", encoding="utf-8") as fr:
+        index = SymptomIndex.from_triples(json.load(fr))
+    index.save()
+    print(f"✅ Indexed {len(index.names)} {SYMPTOM_LABEL} names ({len(index.postings)} grams) into {INDEX_PATH}")